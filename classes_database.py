@@ -7,6 +7,7 @@ Created on Wed Jun 12 11:52:35 2024
 
 import numpy as np
 import helpers.constants as cte
+from helpers.time_series import HOURS_IN_YEAR, monthly_totals, to_hourly_array
 import json
 import os
 
@@ -22,10 +23,14 @@ class BuildingEnergyAsset:
         self.name = name
 
         # Initialize time series data placeholders for input1, input2, output1, and output2
-        self.input1 = []  # Represents electricity or other input1
-        self.input2 = []  # Represents air or other input2
+        self._input1 = []  # Represents electricity or other input1
+        self._input2 = []  # Represents air or other input2
         self.output1 = []  # Represents heating demand or other output1
-        self.output2 = []  # Empty by default
+        self._output2 = []  # Empty by default
+        # demand and yields the derived series are calculated from, see calculate_inputs_and_outputs
+        self._synthesis = None
+        # series still derived from the demand and the yields, left out of to_dict
+        self._derived = set()
         self.generation_system_info={}
         # Optional Parameters
         self.pmaxmax = kwargs.get("pmaxmax", 1)  # Default to 1 if not provided
@@ -37,6 +42,39 @@ class BuildingEnergyAsset:
         self.name=kwargs.get("name",f"asset_{building_asset_context_id}")
 
 
+    @property
+    def input1(self):
+        if self._input1 is None:
+            self._derive_series()
+        return self._input1
+
+    @input1.setter
+    def input1(self, input1):
+        self._input1 = input1
+        self._derived.discard("input1")
+
+    @property
+    def input2(self):
+        if self._input2 is None:
+            self._derive_series()
+        return self._input2
+
+    @input2.setter
+    def input2(self, input2):
+        self._input2 = input2
+        self._derived.discard("input2")
+
+    @property
+    def output2(self):
+        if self._output2 is None:
+            self._derive_series()
+        return self._output2
+
+    @output2.setter
+    def output2(self, output2):
+        self._output2 = output2
+        self._derived.discard("output2")
+
     def add_production_profile(self,production_profile):
         self.input1 = production_profile
 
@@ -44,29 +82,49 @@ class BuildingEnergyAsset:
         """
         General method to calculate input1, input2 (e.g., electricity and air)
         based on demand and fuel_yield. You can specify the input_type as 'electricity' or another.
+        The demand is output1, the other series are derived from it (see derive_asset_series) the first time they are
+        read. to_dict leaves them out and gives the yields instead, see availability_series
         """
-        for d in demand:
-            if type == "heat_pump":
-                input1_value = d / fuel_yield1
-                input2_value = (fuel_yield1 - 1) * input1_value
-            else:
-                input1_value = d / fuel_yield1
-                input2_value=[]
-                if fuel_yield2 is not None:
-                    output2_value = d*fuel_yield2
-                    self.output2 = output2_value
-
-            self.input1.append(input1_value)
-            self.input2.append(input2_value)
-
+        if fuel_yield1 == 0:
+            raise ZeroDivisionError(f"fuel_yield1 of {self.name} is 0")
+        self._synthesis = (demand, fuel_yield1, fuel_yield2, type == "heat_pump")
+        self._input1 = self._input2 = self._output2 = None
+        self._derived = {"input1", "input2", "output2"}
         # Store demand in output1 or output2 based on the context
         self.output1 = demand  # This could represent heating demand or another output
+
+    def _derive_series(self):
+        input1, input2, output2 = derive_asset_series(*self._synthesis)
+        for name, series in (("input1", input1), ("input2", input2), ("output2", output2)):
+            if getattr(self, f"_{name}") is None:
+                setattr(self, f"_{name}", series)
+
     def add_generation_systems_info(self,Generation_system_info):
         self.generation_system_info = Generation_system_info
 
 
     def to_dict(self):
-        """Convert the object to a dictionary matching the required JSON structure."""
+        """Convert the object to a dictionary matching the required JSON structure.
+        The series derived from the demand (output1) are empty and the yields they are derived from are given in
+        derived_series, availability_series returns the complete series"""
+        availability_ts = {
+                    "temp_id": None,
+                    "name": self.name,
+                    "value_input1": [] if "input1" in self._derived else self.input1,
+                    "value_input2": [] if "input2" in self._derived else self.input2,
+                    "value_output1": self.output1,
+                    "value_output2": [] if "output2" in self._derived else self.output2,
+                    "testcase": "TC_0"
+                }
+        if self._derived:
+            _, fuel_yield1, fuel_yield2, heat_pump = self._synthesis
+            availability_ts[cte.DERIVED_SERIES] = {
+                "series": sorted(self._derived),
+                cte.FUEL_YIELD_1: fuel_yield1,
+                # NaN (no second yield) is not valid JSON
+                cte.FUEL_YIELD_2: fuel_yield2 if fuel_yield2 is not None and fuel_yield2 == fuel_yield2 else None,
+                "heat_pump": heat_pump
+            }
         return {
                 "id_temp": None,
                 "generation_system_id": self.generation_system_id,
@@ -75,20 +133,47 @@ class BuildingEnergyAsset:
                 "pmax_scalar": None,
                 "pmaxmax_scalar": self.pmaxmax_scalar,
                 "building_asset_context_id": self.building_asset_context_id,
-                "availability_ts": {
-                    "temp_id": None,
-                    "name": self.name,
-                    "value_input1": self.input1,
-                    "value_input2": self.input2,
-                    "value_output1": self.output1,
-                    "value_output2": self.output2,
-                    "testcase": "TC_0"
-                },
+                "availability_ts": availability_ts,
                 "generation_system": self.generation_system_info
 
             }
 
 
+def derive_asset_series(demand, fuel_yield1, fuel_yield2, heat_pump):
+    """
+    Series of an asset derived from its demand (output1) and yields in one vectorised step:
+    - input1 = demand / fuel_yield1
+    - input2 = (fuel_yield1 - 1) * input1 for heat pumps (air), empty otherwise
+    - output2 = demand * fuel_yield2 for the other systems if they have a second yield, empty otherwise
+    Returns input1, input2 and output2 as lists
+    """
+    demand = np.asarray(demand, dtype=float)
+    input1 = demand / fuel_yield1
+    input2 = ((fuel_yield1 - 1) * input1).tolist() if heat_pump else []
+    output2 = []
+    # no second output if the yield is missing (None or NaN)
+    if not heat_pump and fuel_yield2 is not None and fuel_yield2 == fuel_yield2:
+        output2 = (demand * fuel_yield2).tolist()
+    return input1.tolist(), input2, output2
+
+
+def availability_series(availability_ts):
+    """
+    value_input1, value_input2, value_output1 and value_output2 of an availability_ts as a dictionary. The series left
+    out by BuildingEnergyAsset.to_dict (listed in its derived_series) are derived from value_output1 and the yields
+    """
+    series = {key: availability_ts.get(key, []) for key in
+              (cte.VALUE_INPUT1, cte.VALUE_INPUT2, cte.VALUE_OUTPUT1, cte.VALUE_OUTPUT2)}
+    derived_series = availability_ts.get(cte.DERIVED_SERIES)
+    if derived_series:
+        input1, input2, output2 = derive_asset_series(series[cte.VALUE_OUTPUT1], derived_series[cte.FUEL_YIELD_1],
+                                                      derived_series[cte.FUEL_YIELD_2], derived_series["heat_pump"])
+        derived = {cte.VALUE_INPUT1: input1, cte.VALUE_INPUT2: input2, cte.VALUE_OUTPUT2: output2}
+        for name in derived_series["series"]:
+            series[f"value_{name}"] = derived[f"value_{name}"]
+    return series
+
+
 class CommunityEnergyAsset:
     def __init__(self, generation_system_id, pmaxmin_scalar, pmaxmax_scalar, input_node_geom, output_node_geom, name):
         self.generation_system_id = generation_system_id
@@ -205,8 +290,12 @@ class BuildingConsumption:
             if fuel_yield1 == 0:
                 raise ValueError("fuel_yield1 cannot be zero.")  # Prevent division by zero
 
-            # Calculate consumption based on demand and fuel_yield1
-            output = [x / fuel_yield1 for x in demand]
+            # Calculate consumption based on demand and fuel_yield1 (numpy series, e.g. of load_community_context,
+            # in one operation)
+            if isinstance(demand, np.ndarray):
+                output = demand / fuel_yield1
+            else:
+                output = [x / fuel_yield1 for x in demand]
 
         # Assign the output to the appropriate consumption type
         if type == cte.HEAT_CONSUMPTION:
@@ -253,7 +342,10 @@ class BuildingDemand:
             output = [0] * hours_in_year
         else:
             # Calculate consumption based on demand and fuel_yield1
-            output = [x * fuel_yield1 for x in consumption]
+            if isinstance(consumption, np.ndarray):
+                output = consumption * fuel_yield1
+            else:
+                output = [x * fuel_yield1 for x in consumption]
  
         # Assign the output to the appropriate consumption type
         if type == cte.HEATING_DEMAND:
@@ -264,6 +356,16 @@ class BuildingDemand:
             self.cooling_demand = output
 
 
+def as_float_series(values):
+    """
+    Series of floats. numpy series (e.g. of load_community_context) are kept as float arrays without a copy, lists
+    are converted in one call and stay lists
+    """
+    if isinstance(values, np.ndarray):
+        return np.asarray(values, dtype=float)
+    return np.asarray(values, dtype=float).tolist()
+
+
 class Building_data:
     def __init__(self, id,**kwargs):
         self.id = id
@@ -307,10 +409,10 @@ class Building_data:
         self.subdivision_community = building.get(cte.SUBDIVISION_COMMUNITY, None)
         self.subdivision_total = building.get(cte.SUBDIVISION_TOTAL, None)
     def associate_building_consumption(self,consumption_data):
-        elec_consumption = [float(value) for value in consumption_data.get(cte.ELECTRICITY_CONSUMPTION, [])]
-        dhw_consumption = [float(value) for value in consumption_data.get(cte.DHW_CONSUMPTION, [])]
-        heat_consumption = [float(value) for value in consumption_data.get(cte.HEAT_CONSUMPTION, [])]
-        cool_consumption = [float(value) for value in consumption_data.get(cte.COOL_CONSUMPTION, [])]
+        elec_consumption = as_float_series(consumption_data.get(cte.ELECTRICITY_CONSUMPTION, []))
+        dhw_consumption = as_float_series(consumption_data.get(cte.DHW_CONSUMPTION, []))
+        heat_consumption = as_float_series(consumption_data.get(cte.HEAT_CONSUMPTION, []))
+        cool_consumption = as_float_series(consumption_data.get(cte.COOL_CONSUMPTION, []))
 
         building_consumption_id_temp = consumption_data.get("id", None)
         building_consumption =BuildingConsumption(building_consumption_id_temp,elec_consumption=elec_consumption)
@@ -366,10 +468,8 @@ class Building_data:
 
             generation_profile = []
             if generation_system_id == 83:
-                generation_profile = [
-                    float(value) for value in
-                    building_energy_asset_data.get("availability_ts", {}).get("value_input1", [])
-                ]
+                generation_profile = as_float_series(
+                    building_energy_asset_data.get("availability_ts", {}).get("value_input1", []))
             building_energy_assets[name].add_production_profile(generation_profile)
 
         self.building_energy_assets=building_energy_assets
@@ -402,13 +502,14 @@ def testing_classes():
     print("this is a test")
 
 class FinalEnergy:
-    def __init__(self, id):
+    def __init__(self, id, dtype=np.float64):
         self.id = id
         self.name = None
         self.final = False
-        self._hourly_data = [0] * 8760  # Using a leading underscore to indicate this is "private" and a method is assigned
+        # contiguous array so new consumptions are accumulated in place, float32 can be used to halve memory
+        self._hourly_data = np.zeros(HOURS_IN_YEAR, dtype=dtype)  # Using a leading underscore to indicate this is "private" and a method is assigned
                                         #to recalculate monthly and yearly data every time hourly data is changed
-        self.monthly_data = [0] * 12
+        self.monthly_data = np.zeros(12, dtype=dtype)
         self.yearly_data = 0
         self.recalculate()  # Initial calculation
 
@@ -419,50 +520,48 @@ class FinalEnergy:
     @hourly_data.setter
     def hourly_data(self, new_hourly_data):
         #the setter is used: e.g. energy_instance.hourly_data = new_hourly_data  # This triggers the setter
-        if len(new_hourly_data) != 8760:
+        if len(new_hourly_data) != HOURS_IN_YEAR:
             raise ValueError("Hourly data must have 8760 entries.")
-        self._hourly_data =  [0 if value is None else value for value in new_hourly_data]
+        self._hourly_data = to_hourly_array(new_hourly_data, dtype=self._hourly_data.dtype)
         self.recalculate()  # Recalculate monthly and yearly data when hourly data changes
 
     def recalculate(self):
         """ Recalculate the monthly and yearly data whenever hourly data is changed """
-        self.monthly_data = self.calculate_monthly(self._hourly_data)
-        self.yearly_data = sum(self._hourly_data)
+        self.monthly_data = monthly_totals(self._hourly_data)
+        self.yearly_data = float(self._hourly_data.sum())
 
     def calculate_monthly(self, hourly_data):
-        # Define the number of hours per month in a non-leap year
-        hours_per_month = [744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744]
-        monthly_data = []
-        start = 0
-        for hours in hours_per_month:
-            monthly_data.append(sum(hourly_data[start:start + hours]))
-            start += hours
-        return monthly_data
+        # Monthly sums based on the assumption of non-leap year
+        return monthly_totals(np.asarray(hourly_data)).tolist()
 
     def final_energy_to_dic(self):
         return {
             "name": self.name,
             "final": self.final,
-            "hour": self._hourly_data[:],  # return a copy of the list
-            "month": self.monthly_data[:],  # return a copy of the list
+            "hour": self._hourly_data.tolist(),  # return a copy as a list
+            "month": self.monthly_data.tolist(),  # return a copy as a list
             "year": self.yearly_data
         }
 
     def add_new_consumption(self, consumption):
         """
         Adds new fuels or electricity consumption to the current _hourly_data for the energy carrier
-        :param consumption: List of 8760 values representing the new consumption to add.
+        :param consumption: List or array of 8760 values representing the new consumption to add.
         """
-        if len(consumption) != 8760:
+        if len(consumption) != HOURS_IN_YEAR:
             raise ValueError("Consumption data must have 8760 entries.")
-        # Add each hour's consumption to the existing _hourly_data
-        self._hourly_data =[self._hourly_data[i] + (consumption[i] if consumption[i] is not None else 0) for i in range(8760)]
+        # Add each hour's consumption to the existing _hourly_data (None values count as 0)
+        self._hourly_data += to_hourly_array(consumption, dtype=self._hourly_data.dtype)
         # Recalculate monthly and yearly values after adding new consumption
         self.recalculate()
 
 
 
 class BuildingKPIs:
+    # Order of the KPI series in the (6, 8760) block and the factor to convert them to MWh, tonnes and k€
+    KPI_SERIES = ("PEF_total", "PEF_nren", "PEF_ren", "co2", "non_h_costs", "household_costs")
+    UNIT_CONVERSION = np.array([1e-3, 1e-3, 1e-3, 1e-6, 1e-3, 1e-3])
+
     def __init__(self, final_energy_instance, kpi_data):
         """
         Initialize the BuildingKPIs object with the FinalEnergy instance and KPI data such as PEF_total, PEF_nren, etc.
@@ -476,20 +575,13 @@ class BuildingKPIs:
         self.final_energy = final_energy_instance
         self.energy_carrier_name=final_energy_instance.name
         self.energy_carrier_id = kpi_data['energy_carrier_id']
-        self.pef_tot = kpi_data.get('pef_tot', 0.0)  # Default to 0 if None
-        self.pef_nren = kpi_data.get('pef_nren', 0.0)  # Default to 0 if None
-        self.f_co2_eq_g_kwh = kpi_data.get('f_co2_eq_g_kwh', 0.0)  # Default to 0 if None
-        self.pef_ren = kpi_data.get('pef_ren', 0.0)  # Default to 0 if None
-
-        if kpi_data.get('non_h_costs_eur_kwh', 0.0) == None:
-            self.non_h_costs_eur_kwh = 0
-        else:
-            self.non_h_costs_eur_kwh=kpi_data.get('non_h_costs_eur_kwh', 0.0)  # Default to 0 if None
-
-        if  kpi_data.get('house_costs_eur_kwh', 0.0)== None:
-            self.house_costs_eur_kwh = 0  # Default to 0 if None
-        else:
-            self.house_costs_eur_kwh = kpi_data.get('house_costs_eur_kwh', 0.0)  # Default to 0 if None
+        # Default to 0 if the factor is missing or None
+        self.pef_tot = kpi_data.get('pef_tot') or 0.0
+        self.pef_nren = kpi_data.get('pef_nren') or 0.0
+        self.f_co2_eq_g_kwh = kpi_data.get('f_co2_eq_g_kwh') or 0.0
+        self.pef_ren = kpi_data.get('pef_ren') or 0.0
+        self.non_h_costs_eur_kwh = kpi_data.get('non_h_costs_eur_kwh') or 0.0
+        self.house_costs_eur_kwh = kpi_data.get('house_costs_eur_kwh') or 0.0
 
         # Calculate the KPIs (hourly, monthly, yearly)
         self.calculate_kpis()
@@ -498,32 +590,20 @@ class BuildingKPIs:
         """
         Calculate the KPIs based on FinalEnergy's hourly data and the provided external factors.
         """
-        # Perform element-wise calculation
-        hourly_data = self.final_energy._hourly_data
-        self.PEF_total = [hourly_data[i] * self.pef_tot for i in range(len(hourly_data))] #kWh
-        self.PEF_nren = [hourly_data[i] * self.pef_nren for i in range(len(hourly_data))] #kWh
-        self.PEF_ren = [hourly_data[i] * self.pef_ren for i in range(len(hourly_data))] #kWh
-        self.co2 = [hourly_data[i] * self.f_co2_eq_g_kwh for i in range(len(hourly_data))] #g
-        self.non_h_costs = [hourly_data[i] * self.non_h_costs_eur_kwh for i in range(len(hourly_data))] #euros
-        self.household_costs = [hourly_data[i] * self.house_costs_eur_kwh for i in range(len(hourly_data))] #euros
-        # Monthly KPIs in appropriate units (MWh, tonnes, k€)
-        self.PEF_total_monthly = [value * 1e-3 for value in
-                                  self.calculate_monthly(self.PEF_total)]  # Convert kWh to MWh
-        self.PEF_nren_monthly = [value * 1e-3 for value in self.calculate_monthly(self.PEF_nren)]  # Convert kWh to MWh
-        self.PEF_ren_monthly = [value * 1e-3 for value in self.calculate_monthly(self.PEF_ren)]  # Convert kWh to MWh
-        self.co2_monthly = [value * 1e-6 for value in self.calculate_monthly(self.co2)]  # Convert grams to tonnes
-        self.non_h_costs_monthly = [value * 1e-3 for value in
-                                    self.calculate_monthly(self.non_h_costs)]  # Convert € to k€
-        self.household_costs_monthly = [value * 1e-3 for value in
-                                        self.calculate_monthly(self.household_costs)]  # Convert € to k€
-
-        # Yearly KPIs in appropriate units (MWh, tonnes, k€)
-        self.PEF_total_yearly = sum(self.PEF_total) * 1e-3  # Convert kWh to MWh
-        self.PEF_nren_yearly = sum(self.PEF_nren) * 1e-3  # Convert kWh to MWh
-        self.PEF_ren_yearly = sum(self.PEF_ren) * 1e-3  # Convert kWh to MWh
-        self.co2_yearly = sum(self.co2) * 1e-6  # Convert grams to tonnes
-        self.non_h_costs_yearly = sum(self.non_h_costs) * 1e-3  # Convert € to k€
-        self.household_costs_yearly = sum(self.household_costs) * 1e-3  # Convert € to k€
+        hourly_data = self.final_energy.hourly_data
+        factors = np.array([self.pef_tot, self.pef_nren, self.pef_ren, self.f_co2_eq_g_kwh,
+                            self.non_h_costs_eur_kwh, self.house_costs_eur_kwh], dtype=hourly_data.dtype)
+        # Element-wise calculation of the six series at once: rows are kWh, kWh, kWh, g, euros, euros
+        self.hourly_block = np.multiply.outer(factors, hourly_data)
+        (self.PEF_total, self.PEF_nren, self.PEF_ren, self.co2, self.non_h_costs,
+         self.household_costs) = self.hourly_block
+        # Monthly and yearly KPIs in appropriate units (MWh, tonnes, k€)
+        monthly_block = monthly_totals(self.hourly_block) * self.UNIT_CONVERSION[:, None]
+        yearly_block = self.hourly_block.sum(axis=1) * self.UNIT_CONVERSION
+        (self.PEF_total_monthly, self.PEF_nren_monthly, self.PEF_ren_monthly, self.co2_monthly,
+         self.non_h_costs_monthly, self.household_costs_monthly) = monthly_block.tolist()
+        (self.PEF_total_yearly, self.PEF_nren_yearly, self.PEF_ren_yearly, self.co2_yearly,
+         self.non_h_costs_yearly, self.household_costs_yearly) = yearly_block.tolist()
 
     def calculate_monthly(self, hourly_data):
         """
@@ -531,13 +611,7 @@ class BuildingKPIs:
         :param hourly_data: Array of hourly data (8760 values)
         :return: Monthly data (12 values)
         """
-        hours_per_month = [744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744]
-        monthly_data = []
-        start = 0
-        for hours in hours_per_month:
-            monthly_data.append(sum(hourly_data[start:start + hours]))
-            start += hours
-        return monthly_data
+        return monthly_totals(np.asarray(hourly_data)).tolist()
 
     def to_dict(self):
         """
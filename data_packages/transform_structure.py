@@ -184,6 +184,7 @@ def reverse_whole_structure(community_context):
         print(f"An error occurred: {e}")
 
     community_context_updated = {
+        "id": community_context.get("id", None),
         "author": community_context.get("author", ""),
         "description": community_context.get("description", ""),
         "name": community_context.get("name", ""),
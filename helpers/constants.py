@@ -15,6 +15,7 @@ COOLING_SYSTEM_ID="cooling_system_id"
 COUNTRY_ID="country_id"
 DEMAND_PROFILE="demand_profile"
 DEMANDPROFILE = "demandprofile"
+DERIVED_SERIES = "derived_series"
 DHW_CONSUMPTION = "dhw_consumption"
 DHW_DEMAND = "dhw_demand"
 DHW_SYSTEM = "dhw_system"
@@ -27,6 +28,7 @@ ENERGY_CARRIER_INPUT1_ID = "energy_carrier_input_1_id"
 ENERGY_CARRIER_INPUT1="energy_carrier_input_1"
 FINAL_ENERGY_ELECTRICITY_GRID = "final_energy_electricity_grid"
 FUEL_YIELD_1="fuel_yield1"
+FUEL_YIELD_2="fuel_yield2"
 GENERATION_SYSTEM_ID="generation_system_id"
 GENERATION_SYSTEM_PROFILE_ID="generation_system_profile_id"
 GENERATION_SYSTEM_PROFILE="generation_system_profile"
@@ -42,6 +44,9 @@ PMAX_SCALAR = "pmax_scalar"
 SUBDIVISION_COMMUNITY="subdivision_community"
 SUBDIVISION_TOTAL="subdivision_total"
 VALUE_INPUT1 = "value_input1"
+VALUE_INPUT2 = "value_input2"
+VALUE_OUTPUT1 = "value_output1"
+VALUE_OUTPUT2 = "value_output2"
 # String Literals for KPIs
 KPI_PEAK_HEAT_DEMAND_NAME = "KPI_peak_heat_demand_[kWh]"
 KPI_PEAK_HEAT_DEMAND_VALUE = "KPI_peak_heat_demand"
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming loader of community context JSON files.
+
+json.load keeps the whole text in memory and turns every value of the hourly series (consumptions, demand profiles,
+availability_ts inputs and outputs, ...) into a Python float, about 32 bytes per value. This loader reads the file in
+chunks and decodes the numeric arrays straight into numpy buffers (8 bytes per value), while the rest of the context
+(ids, names, geometries, systems) stays as plain dictionaries, lists and scalars, as json.load returns them.
+
+The series of 8760 values are rows of preallocated (rows x 8760) blocks (see SeriesBuffers), so a context with
+thousands of buildings is held in a few large arrays instead of millions of Python objects. Numeric arrays shorter than
+min_series_length stay Python lists, with the same values as json.load. NaN, Infinity and -Infinity are accepted, as
+json.load does.
+
+Typical use:
+    community_context = load_community_context(path)
+    buildings = initialise(community_context)  # or initialise(path)
+    engine = CommunityKPIEngine(community_context)
+"""
+import json
+import os
+import re
+from json.decoder import scanstring
+
+import numpy as np
+
+from helpers.time_series import HOURS_IN_YEAR
+
+# Arrays of numbers with at least this length are decoded into numpy arrays, shorter ones stay lists
+MIN_SERIES_LENGTH = 24
+# Characters read from the file at a time
+CHUNK_SIZE = 1024 ** 2
+# Rows of 8760 values allocated at a time
+BLOCK_ROWS = 64
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?")
+# Characters that can continue a number: a number followed by one of them may be cut by the end of the chunk
+NUMBER_CHARS = ".eE+-0123456789"
+# Characters of the JSON values that are not numbers (strings, arrays, objects, true, false, null) and are not in the
+# numbers, NaN or Infinity, any other character is a syntax error found by json.loads
+NOT_NUMERIC_CHARS = '"[{ul'
+# NaN, Infinity and -Infinity are accepted, as json.load does
+LITERALS = {"true": True, "false": False, "null": None, "NaN": float("nan"), "Infinity": float("inf"),
+            "-Infinity": float("-inf")}
+# First characters of the values decoded as numbers
+NUMERIC_CHARS = "-NI0123456789"
+
+
+class SeriesBuffers:
+    def __init__(self, length=HOURS_IN_YEAR, block_rows=BLOCK_ROWS, dtype=np.float64):
+        """
+        Preallocated (block_rows x length) blocks the series are decoded into, a new block is allocated when the
+        previous one is full. Series of another length get their own array
+        :param length: length of the rows, 8760 for hourly series
+        :param block_rows: rows allocated at a time
+        :param dtype: float64 by default (the same values as json.load), float32 can be used to halve memory
+        """
+        self.length = length
+        self.block_rows = block_rows
+        self.dtype = dtype
+        self._block = None
+        self._row = None
+        self._next_row = block_rows
+        self.blocks = 0
+
+    def row(self):
+        """
+        Next free row. It is only taken by finish() if the series fills it exactly, otherwise it is given again
+        """
+        if self._next_row == self.block_rows:
+            self._block = np.empty((self.block_rows, self.length), dtype=self.dtype)
+            self._next_row = 0
+            self.blocks += 1
+        self._row = self._block[self._next_row]
+        return self._row
+
+    def finish(self, array, count):
+        """
+        Array of a decoded series of count values: the row itself if the series fills it, otherwise a trimmed copy
+        """
+        if array is self._row and count == self.length:
+            self._next_row += 1
+            self._row = None
+            return array
+        return array[:count].copy()
+
+
+class _SeriesWriter:
+    def __init__(self, buffers, min_length):
+        # numbers are kept as a list until the array is long enough to be a series
+        self.buffers = buffers
+        self.min_length = min_length
+        self.values = []
+        self.array = None
+        self.count = 0
+
+    def extend(self, values):
+        if self.array is None:
+            self.values.extend(values)
+            if len(self.values) >= self.min_length:
+                self.array = self.buffers.row()
+                values, self.values = self.values, None
+                self._write(values)
+        else:
+            self._write(values)
+
+    def _write(self, values):
+        end = self.count + len(values)
+        if end > len(self.array):
+            # longer than the rows of the buffers, moved to its own array
+            array = np.empty(max(end, 2 * len(self.array)), dtype=self.buffers.dtype)
+            array[:self.count] = self.array[:self.count]
+            self.array = array
+        self.array[self.count:end] = values
+        self.count = end
+
+    def finish(self):
+        if self.array is None:
+            return self.values
+        return self.buffers.finish(self.array, self.count)
+
+    def tolist(self):
+        if self.array is None:
+            return self.values
+        return self.array[:self.count].tolist()
+
+
+class ContextStreamReader:
+    def __init__(self, file, buffers=None, min_series_length=MIN_SERIES_LENGTH, chunk_size=CHUNK_SIZE):
+        """
+        :param file: text file object of the JSON
+        :param buffers: SeriesBuffers the series are decoded into, new ones by default
+        :param min_series_length: arrays of numbers with at least this length are decoded into numpy arrays
+        :param chunk_size: characters read at a time
+        """
+        self.file = file
+        self.buffers = buffers or SeriesBuffers()
+        self.min_series_length = min_series_length
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        self.series = 0
+        self._pending = None
+
+    def _more(self):
+        # reads a chunk, the text already decoded is dropped. False at the end of the file
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self.text, self.pos)
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE_RE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self._more():
+                return
+
+    def _next_char(self):
+        self._skip_whitespace()
+        if self.pos >= len(self.text):
+            raise self._error("Unexpected end of the file")
+        return self.text[self.pos]
+
+    def load(self):
+        value = self._value()
+        self._skip_whitespace()
+        if self.pos < len(self.text):
+            raise self._error("Extra data")
+        return value
+
+    def _value(self):
+        char = self._next_char()
+        if char == "{":
+            return self._object()
+        if char == "[":
+            return self._array()
+        if char == '"':
+            return self._string()
+        return self._scalar()
+
+    def _string(self):
+        while True:
+            try:
+                value, end = scanstring(self.text, self.pos + 1)
+            except json.JSONDecodeError:
+                # string (or escape) cut by the end of the chunk
+                if self._more():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def _scalar(self):
+        while True:
+            for literal, value in LITERALS.items():
+                if self.text.startswith(literal, self.pos):
+                    self.pos += len(literal)
+                    return value
+            match = NUMBER_RE.match(self.text, self.pos)
+            # the number (or literal) may continue in the next chunk, e.g. "12" of "12.5" or "3e" of "3e-5"
+            cut = match is None or match.end() == len(self.text) or self.text[match.end()] in NUMBER_CHARS
+            if cut and self._more():
+                continue
+            if match is None:
+                raise self._error("Expecting value")
+            self.pos = match.end()
+            if match.group(1) or match.group(2):
+                return float(match.group())
+            return int(match.group())
+
+    def _object(self):
+        self.pos += 1
+        value = {}
+        if self._next_char() == "}":
+            self.pos += 1
+            return value
+        while True:
+            if self._next_char() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self._string()
+            if self._next_char() != ":":
+                raise self._error("Expecting ':' delimiter")
+            self.pos += 1
+            value[key] = self._value()
+            char = self._next_char()
+            self.pos += 1
+            if char == "}":
+                return value
+            if char != ",":
+                raise self._error("Expecting ',' delimiter")
+
+    def _array(self):
+        self.pos += 1
+        char = self._next_char()
+        if char == "]":
+            self.pos += 1
+            return []
+        values = []
+        if char in NUMERIC_CHARS:
+            writer = self._numbers()
+            if writer is not None:
+                return writer
+            values = self._pending
+        while True:
+            values.append(self._value())
+            char = self._next_char()
+            self.pos += 1
+            if char == "]":
+                return values
+            if char != ",":
+                raise self._error("Expecting ',' delimiter")
+
+    def _numbers(self):
+        # decodes a list of numbers segment by segment (json.loads of the complete numbers of the text read). Returns
+        # the list/array, or None if a value that is not a number is found: the numbers read are left in
+        # self._pending and the array continues as a generic one
+        writer = _SeriesWriter(self.buffers, self.min_series_length)
+        while True:
+            end = self.text.find("]", self.pos)
+            segment_end = end if end != -1 else self.text.rfind(",", self.pos)
+            segment = self.text[self.pos:segment_end] if segment_end != -1 else ""
+            not_numeric = min((segment.find(char) for char in NOT_NUMERIC_CHARS if char in segment), default=-1)
+            if not_numeric != -1:
+                # e.g. a null in the series: the complete numbers before it are kept
+                segment_end = self.text.rfind(",", self.pos, self.pos + not_numeric)
+                if segment_end != -1:
+                    writer.extend(json.loads("[" + self.text[self.pos:segment_end] + "]"))
+                    self.pos = segment_end + 1
+                self._pending = writer.tolist()
+                return None
+            if segment_end == -1:
+                if not self._more():
+                    raise self._error("Unterminated array")
+                continue
+            if segment.strip():
+                writer.extend(json.loads("[" + segment + "]"))
+            self.pos = segment_end + 1
+            if end != -1:
+                value = writer.finish()
+                if isinstance(value, np.ndarray):
+                    self.series += 1
+                return value
+            if not self._more() and self.text.find("]", self.pos) == -1:
+                raise self._error("Unterminated array")
+
+
+def load_community_context(source, buffers=None, min_series_length=MIN_SERIES_LENGTH, chunk_size=CHUNK_SIZE):
+    """
+    Community context of a JSON file with the numeric series decoded into numpy arrays
+
+    Parameters
+    ----------
+    source: path of the JSON file or text file object
+    buffers: SeriesBuffers the series are decoded into (e.g. float32 ones), new float64 ones by default
+    min_series_length: arrays of numbers with at least this length are numpy arrays, shorter ones lists
+    chunk_size: characters read at a time
+
+    Returns
+    -------
+    The same structure as json.load, with numpy arrays instead of the lists of numbers
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding="utf-8") as file:
+            return load_community_context(file, buffers, min_series_length, chunk_size)
+    return ContextStreamReader(source, buffers, min_series_length, chunk_size).load()
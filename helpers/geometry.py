@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Parsed building geometries shared by the stages of the pipeline.
+
+The geometries of the buildings (WKT strings or GeoJSON-like dictionaries, in EPSG 4326) are parsed once into a
+Shapely 2 array and the invalid ones are repaired in bulk. The layer keeps the areas (per CRS), the centroids and the
+union of the buildings the first time they are asked, and the layers are cached by the content of the geometries, so
+get_centroid, calculate_building_areas, calculate_areas, get_indicators_from_baseline and generate_geojson parse the
+same community only once.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.errors import GEOSException
+from shapely.geometry import shape
+
+# CRS of the geometries of the contexts and of the front data
+SOURCE_CRS = "EPSG:4326"
+# Number of communities kept in the cache
+MAX_CACHED_LAYERS = 16
+
+
+class GeometryLayer:
+    def __init__(self, geoms, crs=SOURCE_CRS):
+        """
+        :param geoms: list of WKT strings, GeoJSON-like dictionaries or Shapely geometries (None for a missing one)
+        :param crs: CRS of the geometries
+        """
+        self.crs = crs
+        self.raw_geometries = parse_geometries(geoms)
+        # geometries that could not be parsed are None (missing)
+        self.missing = shapely.is_missing(self.raw_geometries)
+        self._geometries = None
+        self._centroids = None
+        self._union = None
+        self._areas = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.raw_geometries)
+
+    @property
+    def geometries(self):
+        """
+        Parsed geometries with the invalid ones repaired (buffer(0), in bulk)
+        """
+        if self._geometries is None:
+            geometries = self.raw_geometries.copy()
+            invalid = ~self.missing & ~shapely.is_valid(geometries)
+            if invalid.any():
+                geometries[invalid] = shapely.buffer(geometries[invalid], 0)
+            self._geometries = geometries
+        return self._geometries
+
+    @property
+    def centroids(self):
+        if self._centroids is None:
+            self._centroids = shapely.centroid(self.geometries)
+        return self._centroids
+
+    @property
+    def union(self):
+        """
+        Union of all the geometries of the community
+        """
+        if self._union is None:
+            self._union = shapely.union_all(self.geometries[~self.missing])
+        return self._union
+
+    @property
+    def community_centroid(self):
+        return self.union.centroid
+
+    def areas(self, projected_crs=None):
+        """
+        Area of every geometry (NaN if missing)
+        :param projected_crs: CRS the areas are calculated in (e.g. "EPSG:3857" for m²), the CRS of the geometries by
+        default
+        """
+        with self._lock:
+            if projected_crs not in self._areas:
+                geometries = self.geometries
+                if projected_crs is not None and projected_crs != self.crs:
+                    geometries = project_geometries(geometries, self.crs, projected_crs)
+                areas = shapely.area(geometries)
+                areas[self.missing] = np.nan
+                self._areas[projected_crs] = areas
+            return self._areas[projected_crs]
+
+
+def parse_geometries(geoms):
+    """
+    Shapely array of a list of WKT strings, GeoJSON-like dictionaries or geometries. WKT strings are parsed in one
+    call, geometries that cannot be parsed are None
+    """
+    geometries = np.empty(len(geoms), dtype=object)
+    wkt_positions = [i for i, geom in enumerate(geoms) if isinstance(geom, str)]
+    if wkt_positions:
+        geometries[wkt_positions] = shapely.from_wkt([geoms[i] for i in wkt_positions], on_invalid="warn")
+    for i, geom in enumerate(geoms):
+        if isinstance(geom, dict):
+            try:
+                geometries[i] = shape(geom)
+            except (ValueError, KeyError, AttributeError, GEOSException) as e:
+                print(f"Error loading geometry {i}: {e}")
+        elif isinstance(geom, shapely.Geometry):
+            geometries[i] = geom
+    return geometries
+
+
+def project_geometries(geometries, source_crs, target_crs):
+    """
+    Geometries reprojected in one call (all their coordinates are transformed together)
+    """
+    transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+    def transform(coordinates):
+        x, y = transformer.transform(coordinates[:, 0], coordinates[:, 1])
+        return np.column_stack((x, y))
+
+    return shapely.transform(geometries, transform)
+
+
+def geometries_key(geoms):
+    """
+    Key of a list of geometries for the cache: the WKT strings themselves, the dictionaries as JSON
+    """
+    return tuple(geom if isinstance(geom, str) or geom is None else
+                 json.dumps(geom, sort_keys=True) if isinstance(geom, dict) else shapely.to_wkb(geom)
+                 for geom in geoms)
+
+
+_layers = OrderedDict()
+_layers_lock = threading.Lock()
+
+
+def get_geometry_layer(geoms, crs=SOURCE_CRS):
+    """
+    GeometryLayer of a list of geometries, parsed only the first time the same geometries are given (the most
+    recently used communities are kept)
+    """
+    key = (crs, geometries_key(geoms))
+    with _layers_lock:
+        if key in _layers:
+            _layers.move_to_end(key)
+            return _layers[key]
+    layer = GeometryLayer(geoms, crs)
+    with _layers_lock:
+        _layers[key] = layer
+        while len(_layers) > MAX_CACHED_LAYERS:
+            _layers.popitem(last=False)
+    return layer
+
+
+def clear_geometry_layers():
+    with _layers_lock:
+        _layers.clear()
@@ -9,8 +9,8 @@ import os
 import random
 from oemof.solph import components, views
 import helpers.constants as cte
-import geopandas as gpd
-from shapely import wkt
+from helpers.geometry import get_geometry_layer
+from helpers.context_loader import load_community_context
 
 #%% Helper function for normalization
 def normalize_profile(profile):
@@ -20,6 +20,9 @@ def normalize_profile(profile):
     return [x / max_value if max_value != 0 else 0 for x in profile]
 
 def initialise(bd):
+    # bd: community context, or path of its JSON file (read with the streaming loader, the series are numpy arrays)
+    if isinstance(bd, (str, os.PathLike)):
+        bd = load_community_context(bd)
     # Initialize data for buildings
     buildings = {}  # Dictionary to store buildings
 
@@ -176,20 +179,18 @@ def calculate_building_areas(buildings, projected_crs="EPSG:3857"):
         dict: Dictionary with building IDs as keys and areas in m² as values.
     """
     areas = {}
-    for building_id, building_data in buildings.items():
-        if building_data.geometry:
-            try:
-                # Convert WKT to shapely geometry
-                geom = wkt.loads(building_data.geometry)
-                
-                # Create GeoDataFrame for projection and area calculation
-                gdf = gpd.GeoDataFrame({"geometry": [geom]}, crs="EPSG:4326")
-                gdf_projected = gdf.to_crs(projected_crs)
-                
-                # Calculate the area
-                building_area = gdf_projected.geometry.area.iloc[0]
-                areas[building_id] = building_area
-                print(f"Building {building_id}: Area = {building_area:.2f} m²")
-            except Exception as e:
-                print(f"Failed to calculate area for Building {building_id}: {e}")
+    building_ids = [building_id for building_id, building_data in buildings.items() if building_data.geometry]
+    # parsed and projected once per community (see helpers.geometry)
+    layer = get_geometry_layer([buildings[building_id].geometry for building_id in building_ids])
+    try:
+        building_areas = layer.areas(projected_crs)
+    except Exception as e:
+        print(f"Failed to calculate the areas of the buildings: {e}")
+        return areas
+    for building_id, building_area, missing in zip(building_ids, building_areas, layer.missing):
+        if missing:
+            print(f"Failed to calculate area for Building {building_id}: invalid geometry")
+            continue
+        areas[building_id] = float(building_area)
+        print(f"Building {building_id}: Area = {building_area:.2f} m²")
     return areas
\ No newline at end of file
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the results of whole requests (calculate_indicators, get_new_context) for contexts submitted again unchanged,
+e.g. when the front end reloads a page.
+
+The results are addressed by a canonical hash of the inputs: dictionaries are hashed with their keys sorted, so the
+order of the keys of the JSON does not change the key, and numeric series are hashed as one block of bytes. Lists keep
+their order (the buildings of a context are returned in the order received). The key of a request (request_key) also
+has the fingerprint (modification time and size) of the data files the KPIs and the scenarios are calculated with, so
+results of older catalogues, carriers, national averages, actions or profiles are not used, and clear_result_caches()
+is called when the catalogue, the carriers or the national averages are reloaded.
+
+The digests of the numeric series that are lists are memoised: a series submitted again (the same list, unchanged) is
+not converted and hashed again. An entry is only used if the list still has the same items, so a series modified in
+place is hashed again.
+
+The results are stored pickled, so a hit returns a new copy that the caller can modify. The entries are kept in an LRU
+bounded by number of entries and by bytes and, optionally, in a folder (ENPOWER_RESULT_CACHE_DIR) bounded by bytes,
+where the least recently used files are removed first. The folder can be shared by several processes.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Mapping
+from numbers import Number
+
+import numpy as np
+
+CACHE_DIR_VARIABLE = "ENPOWER_RESULT_CACHE_DIR"
+# Part of every key, bump it when the calculations change so older entries (e.g. on disk) are not used
+RESULT_CACHE_VERSION = 2
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 ** 3
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Data files the KPIs and the scenarios are calculated with, their fingerprint is part of the key of every request
+DATA_FILES = (
+    os.path.join(ROOT_PATH, "kpi_module", "catalogues", "generation_systems_catalogue.json"),
+    os.path.join(ROOT_PATH, "kpi_module", "catalogues", "energy_carrier.json"),
+    os.path.join(ROOT_PATH, "scenario_generator", "total_primary_energy_GHG_costs_intensity.csv"),
+    os.path.join(ROOT_PATH, "scenario_generator", "data", "actions_to_generation_systems.csv"),
+    os.path.join(ROOT_PATH, "scenario_generator", "catalogues", "all_profiles.csv"),
+)
+# Numeric lists with at least this length have their digest memoised
+MIN_MEMOISED_LENGTH = 24
+# Values of the series whose digests are memoised, about the series of a 200 buildings context
+MAX_MEMOISED_VALUES = 8 * 1024 ** 2
+
+# Values hashed by their repr, checked first as most of the values of a context are scalars
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+# {id(series): (copy of the series, digest)}, least recently used first
+_series_digests = OrderedDict()
+_memoised_values = 0
+_series_lock = threading.Lock()
+
+
+def _numeric_digest(value):
+    # sha256 of the values of a list/tuple of numbers as float64, None if it is not numeric
+    try:
+        numeric = np.fromiter(value, dtype=np.float64, count=len(value))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(numeric.tobytes()).digest()
+
+
+def _series_digest(value):
+    # digest of a numeric series, memoised by identity. The copy keeps the items of the series: the entry is only used
+    # if they are the same (a comparison by identity of the items), so a series modified in place is hashed again
+    global _memoised_values
+    if len(value) < MIN_MEMOISED_LENGTH:
+        return _numeric_digest(value)
+    with _series_lock:
+        entry = _series_digests.get(id(value))
+        if entry is not None and entry[0] == value:
+            _series_digests.move_to_end(id(value))
+            return entry[1]
+    digest = _numeric_digest(value)
+    if digest is not None:
+        with _series_lock:
+            previous = _series_digests.pop(id(value), None)
+            if previous is not None:
+                _memoised_values -= len(previous[0])
+            _series_digests[id(value)] = (value[:], digest)
+            _memoised_values += len(value)
+            while _memoised_values > MAX_MEMOISED_VALUES:
+                _, (evicted, _) = _series_digests.popitem(last=False)
+                _memoised_values -= len(evicted)
+    return digest
+
+
+def clear_series_digests():
+    global _memoised_values
+    with _series_lock:
+        _series_digests.clear()
+        _memoised_values = 0
+
+
+def _update_hash(hasher, value):
+    if type(value) in SCALAR_TYPES:
+        hasher.update(repr(value).encode() + b";")
+    elif isinstance(value, (dict, Mapping)):
+        hasher.update(b"{")
+        for key in sorted(value, key=repr):
+            hasher.update(repr(key).encode())
+            hasher.update(b":")
+            _update_hash(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, np.ndarray) and value.dtype.kind in "iuf":
+        hasher.update(b"[" + value.dtype.kind.encode())
+        hasher.update(np.ascontiguousarray(value, dtype=np.float64).tobytes())
+        hasher.update(b"]")
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        # numeric series (8760 values) are hashed as the digest of their block of bytes, tagged with the type of their
+        # first value
+        digest = None
+        if len(value) > 0 and isinstance(value[0], Number) and not isinstance(value[0], bool):
+            if isinstance(value, np.ndarray):
+                digest = _numeric_digest(value)
+            else:
+                digest = _series_digest(value)
+        if digest is not None:
+            hasher.update(b"[" + type(value[0]).__name__.encode())
+            hasher.update(digest)
+        else:
+            hasher.update(b"[")
+            for item in value:
+                _update_hash(hasher, item)
+        hasher.update(b"]")
+    else:
+        hasher.update(repr(value).encode())
+        hasher.update(b";")
+
+
+def canonical_hash(*values):
+    """
+    sha256 of the values, independent of the order of the keys of their dictionaries (and of any other mapping, e.g. a
+    ScenarioContext)
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f"v{RESULT_CACHE_VERSION}".encode())
+    for value in values:
+        _update_hash(hasher, value)
+    return hasher.hexdigest()
+
+
+def data_fingerprint(paths=None):
+    """
+    Modification time (ns) and size of the data files (DATA_FILES by default), None for a missing file
+    """
+    fingerprint = []
+    for path in DATA_FILES if paths is None else paths:
+        try:
+            status = os.stat(path)
+        except OSError:
+            fingerprint.append((os.path.basename(path), None))
+        else:
+            fingerprint.append((os.path.basename(path), status.st_mtime_ns, status.st_size))
+    return fingerprint
+
+
+def request_key(name, *values):
+    """
+    Key of the result of a request: canonical hash of its name, the fingerprint of the data files and its inputs
+    """
+    return canonical_hash(name, data_fingerprint(), *values)
+
+
+# Caches cleared by clear_result_caches, see register_cache
+_registered_caches = weakref.WeakSet()
+
+
+def register_cache(cache):
+    """
+    Adds a cache (any object with a clear() method) to the ones cleared when the data files are reloaded
+    """
+    _registered_caches.add(cache)
+    return cache
+
+
+def clear_result_caches():
+    """
+    Clears the results kept in memory by the registered caches (the result cache of the requests and the building
+    results of the KPI engine), called when the catalogue, the carriers or the national averages are reloaded. The
+    entries on disk are not used anymore if the files changed, as their fingerprint is part of the keys
+    """
+    for cache in list(_registered_caches):
+        cache.clear()
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        """
+        :param max_entries: results kept in memory
+        :param max_bytes: size (pickled) of the results kept in memory
+        :param cache_dir: folder of the results on disk, ENPOWER_RESULT_CACHE_DIR by default (no disk store if unset)
+        :param max_disk_bytes: size of the folder, the least recently used results are removed above it
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_VARIABLE) or None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()  # {key: pickled result}, most recently used last
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        register_cache(self)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _remember(self, key, data):
+        # adds the pickled result to the LRU and evicts the least recently used ones above the limits
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)  # most recently used
+        except OSError:
+            return None
+        return data
+
+    def _write_disk(self, key, data):
+        if self.cache_dir is None or len(data) > self.max_disk_bytes:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                try:
+                    status = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                files.append((status.st_mtime, status.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+                self.evictions += 1
+            except OSError:
+                continue
+
+    def get(self, key, default=None):
+        """
+        Copy of the result of a key (memory first, then disk), default if there is none
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if data is None:
+            data = self._read_disk(key)
+            if data is None:
+                with self._lock:
+                    self.misses += 1
+                return default
+            with self._lock:
+                self.disk_hits += 1
+            self._remember(key, data)
+        try:
+            return pickle.loads(data)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self.discard(key)
+            return default
+
+    def put(self, key, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    def get_or_compute(self, key, function, *args, **kwargs):
+        """
+        Result of a key, calculated with function(*args, **kwargs) and stored if it is not cached
+        """
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            result = function(*args, **kwargs)
+            self.put(key, result)
+        return result
+
+    def discard(self, key):
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._bytes -= len(data)
+        if self.cache_dir is not None:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if disk and self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        """
+        Hit/miss metrics: hits (memory), disk_hits, misses, evictions, hit_rate, entries and bytes in memory
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by the whole process
+result_cache = ResultCache()
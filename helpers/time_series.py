@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the hourly (8760) time series used across the KPI module and the
+scenario generator. Series are kept as contiguous numpy arrays so they can be
+accumulated in place and rolled up into months without Python loops.
+"""
+import numpy as np
+
+HOURS_IN_YEAR = 8760  # 8760 hours for a year-long hourly model
+# Number of hours per month in a non-leap year
+HOURS_PER_MONTH = np.array([744, 672, 744, 720, 744, 720, 744, 744, 720, 744, 720, 744])
+# Index of the first hour of every month, used by np.add.reduceat
+MONTH_START_HOURS = np.concatenate(([0], np.cumsum(HOURS_PER_MONTH)[:-1]))
+
+
+def to_hourly_array(values, timestep_count=None, dtype=np.float64):
+    """
+    Converts a time series (list, tuple or array) to a contiguous numpy array.
+    None and NaN values are replaced by 0 so the series can be summed safely.
+
+    Parameters
+    ----------
+    values: list or np.ndarray with the hourly values, or None for an empty series
+    timestep_count: expected length of the series. If values is None (or empty, when timestep_count is given) a zero
+        series of this length is returned
+    dtype: float64 by default, float32 can be used to halve memory
+
+    Returns
+    -------
+    np.ndarray
+    """
+    if values is None or (timestep_count and len(values) == 0):
+        return np.zeros(timestep_count or HOURS_IN_YEAR, dtype=dtype)
+    # dtype=float turns None into NaN, so both are cleaned with the same call
+    array = np.array(values, dtype=dtype)
+    np.nan_to_num(array, copy=False, nan=0.0)
+    return array
+
+
+def monthly_totals(hourly_data):
+    """
+    Monthly sums of an hourly series (last axis) assuming a non-leap year.
+
+    Parameters
+    ----------
+    hourly_data: np.ndarray with 8760 values in the last axis, e.g. (8760,) or (n_series, 8760)
+
+    Returns
+    -------
+    np.ndarray with 12 values in the last axis
+    """
+    return np.add.reduceat(hourly_data, MONTH_START_HOURS, axis=-1)
@@ -719,6 +719,61 @@ def wine_bottles(citizen_kpis_factors,total_primary_energy):
 
     return Wine_bottles
 
+# Citizen equivalences in the order returned by get_totals_per_building:
+# (name, source, factors of kpi_ctz_factors dividing the source). Sources are primary energy [kWh] or CO2 [kg]
+CITIZEN_EQUIVALENCES = (
+    ("TV_h", "primary_energy", ("f_tv",)),
+    ("streaming_h", "primary_energy", ("f_streaming",)),
+    ("Pizza_h", "primary_energy", ("f_pizza",)),
+    ("Battery_charges", "primary_energy", ("f_battery",)),
+    ("ElCar_charges", "primary_energy", ("f_km", "f_elcar")),
+    ("Trees_number", "co2", ("f_trees",)),
+    ("streaming_emissionhours", "co2", ("f_em_net",)),
+    ("ICV_km", "co2", ("f_ICV",)),
+    ("Wine_bottles", "primary_energy", ("f_wine",)),
+)
+
+def citizen_equivalence_divisors(citizen_kpis_factors):
+    """
+    Divisor of every citizen equivalence (in the order of CITIZEN_EQUIVALENCES)
+
+    Parameters
+    ----------
+    citizen_kpis_factors : dict
+        A dictionary containing the factors for various KPI calculations (kpi_ctz_factors).
+
+    Returns
+    -------
+    divisors : np.ndarray
+        One divisor per equivalence.
+    """
+    return np.array([np.prod([citizen_kpis_factors[factor] for factor in factors])
+                     for _, _, factors in CITIZEN_EQUIVALENCES])
+
+def citizen_equivalences(citizen_kpis_factors, total_primary_energy, total_co2):
+    """
+    All the citizen equivalences (tv_h, streaming_h, pizza_h, battery_charges, el_car_charges, trees_number,
+    streaming_emission_hours, icv_km, wine_bottles) as a single vectorized scaling.
+
+    Parameters
+    ----------
+    citizen_kpis_factors : dict
+        A dictionary containing the factors for various KPI calculations (kpi_ctz_factors).
+    total_primary_energy : float or array
+        Total primary energy in kWh: a value, an hourly series or a (buildings x hours) matrix.
+    total_co2 : float or array
+        Total CO2 in kgCO2eq, same shape as total_primary_energy.
+
+    Returns
+    -------
+    equivalences : np.ndarray
+        (equivalences x ...) array, in the order of CITIZEN_EQUIVALENCES.
+    """
+    sources = np.stack([np.asarray(total_primary_energy, dtype=float), np.asarray(total_co2, dtype=float)])
+    source_index = [0 if source == "primary_energy" else 1 for _, source, _ in CITIZEN_EQUIVALENCES]
+    divisors = citizen_equivalence_divisors(citizen_kpis_factors)
+    return sources[source_index] / divisors.reshape((-1,) + (1,) * (sources.ndim - 1))
+
 def save_to_csv(building_consumption_dict, demand_profile, total_primary_energy_MWh, KPI_peak_heat_demand, KPI_peak_elec_demand, num_members,
                 TV_h, streaming_h, Pizza_h, Battery_charges, ElCar_charges, Trees_number, streaming_emissionhours, ICV_km, Wine_bottles):
     """
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide registry of the generation systems catalogue.
+
+The catalogue JSON is parsed once (lazily, on first use) and indexed by id, so a system is found in O(1) instead of
+re-reading the file and scanning the list on every call. Entries are stored frozen (read-only mappings and tuples):
+    - view(system_id) returns the frozen entry, for read-only use (no copy)
+    - get(system_id) returns a plain dict copy, safe to embed and modify in a context
+reload() re-reads the file and invalidate() drops the parsed catalogue so it is loaded again on the next lookup. Both
+also drop the conversion factor matrix, which is built from the catalogue, and the cached results (see
+helpers/result_cache.py).
+"""
+import json
+import os
+import threading
+from types import MappingProxyType
+
+import helpers.constants as cte
+
+GENERATION_SYSTEMS_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues",
+                                                 "generation_systems_catalogue.json")
+
+
+def freeze(value):
+    """
+    Recursively converts dictionaries to read-only mappings and lists to tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    Inverse of freeze, returns a new (deep) copy made of dictionaries and lists
+    """
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class GenerationSystemsCatalogue:
+    def __init__(self, path=GENERATION_SYSTEMS_CATALOGUE_PATH):
+        """
+        :param path: path of the generation_systems_catalogue.json file
+        """
+        self.path = path
+        self._systems = None  # tuple of frozen systems, in the order of the file
+        self._index = None  # {id: frozen system}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._index is not None
+
+    def _ensure_loaded(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:  # another thread could have loaded it while waiting
+                    self._load()
+
+    def _load(self):
+        with open(self.path, "r") as file:
+            energy_systems_catalogue = json.load(file)
+        systems = tuple(freeze(system) for system in energy_systems_catalogue)
+        index = {}
+        for system in systems:
+            # keep the first entry if an id is repeated, as the linear search did
+            index.setdefault(system[cte.ID], system)
+        self._systems = systems
+        self._index = index
+
+    def reload(self):
+        """
+        Re-reads the catalogue file, e.g. after it has been updated
+        """
+        with self._lock:
+            self._load()
+        self._changed()
+
+    def invalidate(self):
+        """
+        Drops the parsed catalogue, it is loaded again on the next lookup
+        """
+        with self._lock:
+            self._systems = None
+            self._index = None
+        self._changed()
+
+    @staticmethod
+    def _changed():
+        # the conversion factor matrix takes the factors of the catalogue, it is built again on the next use and the
+        # results calculated with it are cleared. Imported here as conversion_factors imports this module
+        from conversion_factors import invalidate_conversion_factor_matrix
+        invalidate_conversion_factor_matrix()
+
+    def view(self, system_id):
+        """
+        Read-only entry of a generation system, None if the id is not in the catalogue
+        """
+        self._ensure_loaded()
+        return self._index.get(system_id)
+
+    def get(self, system_id):
+        """
+        Copy of the entry of a generation system as a plain dictionary, None if the id is not in the catalogue
+        """
+        return thaw(self.view(system_id))
+
+    def __contains__(self, system_id):
+        self._ensure_loaded()
+        return system_id in self._index
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return iter(self._systems)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._systems)
+
+
+# Shared by the whole process
+generation_systems_catalogue = GenerationSystemsCatalogue()
@@ -0,0 +1,681 @@
+# -*- coding: utf-8 -*-
+"""
+Community-wide KPI engine.
+
+The final energy of every building is loaded in a (buildings x carriers x hours) array and the national factors of
+every building in a (buildings x carriers x factors) array, so primary energy, CO2 and costs of the whole community
+are calculated with a single broadcasted product. Community aggregates are reductions over the buildings axis.
+
+The results of every building are cached by a content hash of its consumption, generation system profile, energy
+assets and building data. update() only recalculates the buildings whose content changed (e.g. the ones touched by a
+scenario action) and updates the community sums subtracting their old contribution and adding the new one.
+
+Typical use:
+    engine = CommunityKPIEngine(community_context)
+    community_indicators = engine.community_KPIs()
+    citizen_KPIs = engine.citizen_KPIs()
+    engine.update(new_community_context)  # what-if, only the changed buildings are recalculated
+    engine = CommunityKPIEngine.from_file(path)  # context of a JSON file, read by the streaming loader
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from numbers import Number
+
+import numpy as np
+import helpers.constants as cte
+from helpers.time_series import to_hourly_array
+from helpers.context_loader import load_community_context
+from helpers.result_cache import register_cache
+from KPI_module import kpi_ctz_factors, CITIZEN_EQUIVALENCES, citizen_equivalence_divisors
+from conversion_factors import (KPI_FACTORS, PEF_TOTAL, PEF_NREN, PEF_REN, CO2, NON_H_COSTS, HOUSEHOLD_COSTS,
+                                DEFAULT_COUNTRY_ID, get_conversion_factor_matrix)
+from key_performance_indicators import (handle_demand_profile, calculate_building_final_energy,
+                                        select_carrier_kpi_data, calculate_building_costs, get_building_country_id,
+                                        filter_values_batch)
+from parallel_evaluation import map_buildings
+
+# KPIs requiring area-weighted aggregation
+AREA_WEIGHTED_KPIS = [
+    cte.TOTAL_PRIMARY_ENERGY_INTENSITY_NAME,
+    cte.NATIONAL_AVERAGE_TOTAL_PRIMARY_ENERGY_INTENSITY_NAME,
+    cte.TOTAL_CO2_INTENSITY_NAME,
+    cte.NATIONAL_AVERAGE_TOTAL_CO2_INTENSITY_NAME,
+    cte.TOTAL_ENERGY_COST_INTENSITY_NAME,
+    cte.NATIONAL_AVERAGE_TOTAL_ENERGY_COST_INTENSITY_NAME
+]
+DEMAND_TYPES = [cte.HEATING_DEMAND, cte.DHW_DEMAND, cte.COOLING_DEMAND, cte.ELECTRICITY_DEMAND]
+RESIDENTIAL_USES = [1, 2, 3]
+# Hourly series of the buildings taken directly from calculate_building_final_energy
+BUILDING_SERIES = ("total_PV", "rate_of_self_consumption", "self_sufficiency", "self_consumption")
+# Hourly KPI series, rows of hourly_KPIs
+KPI_SERIES = {"total_primary_energy_kWh": PEF_TOTAL, "total_primary_energy_non_renewable": PEF_NREN,
+              "total_primary_energy_renewable": PEF_REN, "total_co2": CO2, "total_non_h_costs": NON_H_COSTS,
+              "total_h_costs": HOUSEHOLD_COSTS}
+BUILDING_SCALARS = ("peak_heat_demand", "peak_elec_demand", "total_capex", "total_lifetime_costs", "total_savings",
+                    "payback_period")
+NATIONAL_AVERAGES = ("national_average_total_primary_energy_intensity", "national_average_total_CO2",
+                     "national_average_total_energy_cost")
+# Parts of a building_asset_context the KPIs depend on
+HASHED_KEYS = (cte.BUILDING_CONSUMPTION, cte.GENERATION_SYSTEM_PROFILE, cte.BUILDING_ENERGY_ASSET, cte.BUILDING)
+# Temporary ids given by the scenario generator, they do not change the KPIs
+UNHASHED_KEYS = ("id_temp",)
+
+
+def _update_hash(hasher, value):
+    if isinstance(value, dict):
+        hasher.update(b"{")
+        for key in sorted(value, key=str):
+            if key in UNHASHED_KEYS:
+                continue
+            hasher.update(repr(key).encode())
+            _update_hash(hasher, value[key])
+        hasher.update(b"}")
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        # numeric series (8760 values) are hashed as one block of bytes
+        numeric = None
+        if len(value) > 0 and isinstance(value[0], Number) and not isinstance(value[0], bool):
+            try:
+                numeric = np.asarray(value, dtype=np.float64)
+            except (TypeError, ValueError):
+                numeric = None
+        if numeric is not None and numeric.ndim == 1:
+            hasher.update(b"[n")
+            hasher.update(numeric.tobytes())
+        else:
+            hasher.update(b"[")
+            for item in value:
+                _update_hash(hasher, item)
+        hasher.update(b"]")
+    else:
+        hasher.update(repr(value).encode())
+        hasher.update(b";")
+
+
+def building_content_hash(building_asset_context):
+    """
+    Content hash of the parts of a building_asset_context used to calculate its KPIs: consumption, generation system
+    profile, building energy assets and building data (use, area, construction year, demand profile)
+    """
+    hasher = hashlib.sha1()
+    for key in HASHED_KEYS:
+        hasher.update(key.encode())
+        _update_hash(hasher, building_asset_context.get(key))
+    return hasher.hexdigest()
+
+
+def evaluate_building(building_asset_context, timestep_count, country_id=DEFAULT_COUNTRY_ID):
+    """
+    Calculates all the per building results used by the engine
+
+    Parameters
+    ----------
+    building_asset_context: building with GENERATION_SYSTEM_PROFILE_ID
+    timestep_count: number of time steps of the series
+    country_id: country of the conversion factors
+
+    Returns
+    -------
+    Dictionary with the hourly series, demand (4 x hours), final energy per carrier, national KPI data per carrier,
+    costs, scalars and building data
+    """
+    consumption_profile = building_asset_context.get(cte.BUILDING_CONSUMPTION)
+    if consumption_profile is not None:
+        # handle_demand_profile sets to 0 the services without system, the context (often shared between scenarios)
+        # is not modified
+        consumption_profile = dict(consumption_profile)
+    building = building_asset_context.get(cte.BUILDING, {})
+    building_energy_asset = building_asset_context.get(cte.BUILDING_ENERGY_ASSET, None)
+    generation_system_profile = building_asset_context.get(cte.GENERATION_SYSTEM_PROFILE, None)
+    building_use_id = building.get(cte.BUILDING_USE_ID)
+
+    demand_profile = handle_demand_profile(building_asset_context, generation_system_profile, consumption_profile)
+    if demand_profile is None:
+        demand_profile = building.get(cte.DEMANDPROFILE)
+    if isinstance(demand_profile, Exception):
+        raise demand_profile
+    demand = np.array([to_hourly_array(demand_profile.get(demand_type), timestep_count)
+                       for demand_type in DEMAND_TYPES])
+
+    (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+     grid_consumption, total_final_energy) = calculate_building_final_energy(consumption_profile,
+                                                                            generation_system_profile,
+                                                                            building_energy_asset,
+                                                                            timestep_count)
+    kpi_data_per_carrier = select_carrier_kpi_data(generation_system_profile, country_id)
+
+    # Only the carriers actually consumed are kept, so the carriers axis stays small
+    final_energy = {}
+    carrier_names = {}
+    for energy_carrier_id, energy_instance in total_final_energy.items():
+        if (energy_instance.hourly_data > 0).any():
+            final_energy[energy_carrier_id] = energy_instance.hourly_data
+            carrier_names[energy_carrier_id] = energy_instance.name
+
+    costs = calculate_building_costs(building_energy_asset, building_use_id, total_PV, self_consumption,
+                                     grid_consumption, kpi_data_per_carrier.get(12), total_final_energy[12])
+    scalars = dict.fromkeys(BUILDING_SCALARS, 0.0)
+    if building_energy_asset:
+        scalars["total_capex"] = costs.get("total_capex", 0)
+        scalars["total_lifetime_costs"] = costs.get("total_lifetime_costs", 0)
+        scalars["total_savings"] = costs.get("total_savings", 0)
+        payback_period = costs.get("payback_period_years", 0)
+        scalars["payback_period"] = np.nan if payback_period is None else payback_period
+    scalars["peak_heat_demand"] = max(demand_profile[cte.HEATING_DEMAND])
+    scalars["peak_elec_demand"] = np.max(total_electricity_use)
+    area_building = building.get(cte.AREA)
+
+    return {
+        "series": dict(zip(BUILDING_SERIES, (total_PV, rate_of_self_consumption, self_sufficiency,
+                                             self_consumption))),
+        "demand": demand,
+        "final_energy": final_energy,
+        "carrier_names": carrier_names,
+        "kpi_data": kpi_data_per_carrier,
+        "costs": costs,
+        "scalars": scalars,
+        # building area cannot be close to 0, e.g. 1*10-6, 100m2 is assumed
+        "area": area_building if area_building > 1 else 100,
+        "residential": building_use_id in RESIDENTIAL_USES,
+        "benchmark_key": (building_use_id, building.get(cte.CONSTRUCTION_YEAR),
+                          get_building_country_id(generation_system_profile)),
+    }
+
+
+def evaluate_building_task(task):
+    """
+    evaluate_building with the arguments in a tuple, for map_buildings
+    """
+    return evaluate_building(*task)
+
+
+class BuildingResultsCache:
+    def __init__(self, max_entries=4096):
+        """
+        LRU cache of evaluate_building results, keyed by (content hash, timestep_count, country_id).
+        Shared by the engines of the process, so a scenario only evaluates the buildings it changed. It is cleared
+        when the catalogue, the carriers or the national averages are reloaded (see helpers.result_cache)
+        :param max_entries: number of buildings kept
+        """
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        register_cache(self)
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self._results.move_to_end(key)
+                self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def __len__(self):
+        return len(self._results)
+
+
+# Shared by the whole process
+building_results_cache = BuildingResultsCache()
+
+
+class CommunityKPIEngine:
+    def __init__(self, community_context, dtype=np.float64, country_id=DEFAULT_COUNTRY_ID,
+                 results_cache=building_results_cache, parallel=False, executor=None, max_workers=None,
+                 chunk_size=None):
+        """
+        Loads the building_asset_context of the community context and calculates the KPIs of all the buildings.
+        :param community_context: community context with the building_asset_context list
+        :param dtype: float64 by default, float32 can be used to halve memory on large communities
+        :param country_id: country of the primary energy, CO2 and cost factors, see set_country
+        :param results_cache: BuildingResultsCache of the per building results, None to disable it
+        :param parallel: True to evaluate the buildings in worker processes, see parallel_evaluation.map_buildings
+        :param executor: optional executor for the parallel mode, the shared process pool by default
+        :param max_workers: number of workers of the shared process pool
+        :param chunk_size: number of buildings sent to a worker at a time
+        """
+        self.dtype = dtype
+        self.country_id = country_id
+        self.results_cache = results_cache
+        self.parallel = parallel
+        self.executor = executor
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.buildings = []
+        self.building_ids = []
+        self.building_hashes = []
+        self.building_results = []
+        self.carrier_ids = []
+        self.carrier_names = {}
+        self.costs = []
+        self.load(community_context)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Engine of the community context of a JSON file, read with the streaming loader (see helpers/context_loader.py)
+        so the series go straight to numpy arrays. kwargs are the parameters of __init__
+        """
+        return cls(load_community_context(path), **kwargs)
+
+    @staticmethod
+    def _select_buildings(community_context):
+        building_asset_contexts = community_context.get(cte.BUILDING_ASSET_CONTEXT)
+        if not isinstance(building_asset_contexts, list):
+            raise ValueError("community context structure is not correct, should be a list")
+        return [building_asset_context for building_asset_context in building_asset_contexts
+                if cte.GENERATION_SYSTEM_PROFILE_ID in building_asset_context]
+
+    @staticmethod
+    def _timestep_count(community_context, buildings):
+        timestep_count = community_context.get("timestep_count")
+        for b, building_asset_context in enumerate(buildings):
+            building_id = building_asset_context.get(cte.ID, f"building_{b + 1}")
+            consumption_profile = building_asset_context.get(cte.BUILDING_CONSUMPTION)
+            if consumption_profile is None:
+                raise ValueError(f"Consumption profile does not exist for building ID: {building_id}")
+            if timestep_count is None:
+                if len(consumption_profile) > 0:
+                    timestep_count = len(next(iter(consumption_profile.values())))
+                else:
+                    raise ValueError(f"Timestep count could not be determined for building ID: {building_id}")
+        return timestep_count
+
+    def _building_results(self, buildings, hashes, timestep_count):
+        """
+        Results of several buildings, from the cache if the same content has already been evaluated. The missing
+        ones are evaluated in worker processes if the engine is parallel
+        """
+        keys = [(content_hash, timestep_count, self.country_id) for content_hash in hashes]
+        results = [self.results_cache.get(key) if self.results_cache is not None else None for key in keys]
+        missing = [b for b, result in enumerate(results) if result is None]
+        evaluated = map_buildings(evaluate_building_task,
+                                  [(buildings[b], timestep_count, self.country_id) for b in missing],
+                                  parallel=self.parallel, executor=self.executor, max_workers=self.max_workers,
+                                  chunk_size=self.chunk_size)
+        for b, result in zip(missing, evaluated):
+            results[b] = result
+            if self.results_cache is not None:
+                self.results_cache.put(keys[b], result)
+        return results
+
+    def load(self, community_context):
+        """
+        Calculates (or takes from the cache) the results of every building and fills the community arrays
+        """
+        buildings = self._select_buildings(community_context)
+        timestep_count = self._timestep_count(community_context, buildings)
+        hashes = [building_content_hash(building_asset_context) for building_asset_context in buildings]
+        results = self._building_results(buildings, hashes, timestep_count)
+        building_ids = [building_asset_context.get(cte.ID, f"building_{b + 1}")  # Incremental ID if missing
+                        for b, building_asset_context in enumerate(buildings)]
+        self.buildings = buildings
+        self._assemble(results, hashes, building_ids, timestep_count or 0)
+
+    def _assemble(self, results, hashes, building_ids, timestep_count):
+        """
+        Fills the community arrays from the per building results
+        """
+        n_buildings = len(results)
+        self.timestep_count = timestep_count
+        self.building_ids = list(building_ids)
+        self.building_hashes = list(hashes)
+        self.building_results = list(results)
+        self.costs = [result["costs"] for result in results]
+        self.areas = np.array([result["area"] for result in results], dtype=float)
+        self.residential = np.array([result["residential"] for result in results], dtype=bool)
+        self.scalars = {name: np.array([result["scalars"][name] for result in results], dtype=float)
+                        for name in BUILDING_SCALARS}
+        self.series = {name: np.zeros((n_buildings, timestep_count), dtype=self.dtype) for name in BUILDING_SERIES}
+        self.total_demand = np.zeros((len(DEMAND_TYPES), timestep_count), dtype=self.dtype)
+        for b, result in enumerate(results):
+            for name in BUILDING_SERIES:
+                self.series[name][b] = result["series"][name]
+            self.total_demand += result["demand"]
+            self.carrier_names.update(result["carrier_names"])
+        # get national averages for KPIs comparison, in the order returned by filter_values
+        national_averages = filter_values_batch("total_primary_energy_GHG_costs_intensity.csv",
+                                                [result["benchmark_key"] for result in results])
+        for name, values in zip(NATIONAL_AVERAGES, national_averages.T):
+            self.scalars[name] = values
+        self._fill_carrier_arrays([result["final_energy"] for result in results],
+                                  [result["kpi_data"] for result in results])
+        self.calculate_kpis()
+        self._sum_series()
+
+    def _sum_series(self):
+        """
+        Community sums of the hourly series, kept up to date by update()
+        """
+        self.series_totals = {name: values.sum(axis=0) for name, values in self.series.items()}
+        self.final_energy_total = self.final_energy.sum(axis=0)
+
+    def _fill_carrier_arrays(self, final_energy_per_building, kpi_data_per_building):
+        """
+        Builds the (buildings x carriers x hours) final energy array and the mask of the carriers with KPIs
+        """
+        self.carrier_ids = sorted({energy_carrier_id for final_energy in final_energy_per_building
+                                   for energy_carrier_id in final_energy})
+        self.carrier_index = {energy_carrier_id: c for c, energy_carrier_id in enumerate(self.carrier_ids)}
+        n_buildings = len(final_energy_per_building)
+        self.final_energy = np.zeros((n_buildings, len(self.carrier_ids), self.timestep_count), dtype=self.dtype)
+        # Carriers without national data keep 0 factors, as they had no BuildingKPIs before
+        self.kpi_mask = np.zeros((n_buildings, len(self.carrier_ids)), dtype=bool)
+        # Factors of carriers unknown to the conversion factor matrix, taken from the profiles
+        self.profile_factors = {}
+        for b, (final_energy, kpi_data_per_carrier) in enumerate(zip(final_energy_per_building,
+                                                                      kpi_data_per_building)):
+            self._fill_building_carriers(b, final_energy, kpi_data_per_carrier)
+        self._fill_factors()
+
+    def _fill_building_carriers(self, b, final_energy, kpi_data_per_carrier):
+        conversion_factor_matrix = get_conversion_factor_matrix()
+        self.final_energy[b] = 0
+        self.kpi_mask[b] = False
+        for energy_carrier_id, hourly_data in final_energy.items():
+            self.final_energy[b, self.carrier_index[energy_carrier_id]] = hourly_data
+        for energy_carrier_id, kpi_data in kpi_data_per_carrier.items():
+            if energy_carrier_id in self.carrier_index:
+                c = self.carrier_index[energy_carrier_id]
+                self.kpi_mask[b, c] = True
+                if energy_carrier_id not in conversion_factor_matrix.carrier_index:
+                    self.profile_factors[b, c] = [kpi_data.get(factor) or 0.0 for factor in KPI_FACTORS]
+
+    def _fill_factors(self, buildings=slice(None)):
+        """
+        (buildings x carriers x factors) array from the conversion factor matrix of the selected country
+        """
+        carrier_factors = get_conversion_factor_matrix().factors(self.carrier_ids, self.country_id)
+        if isinstance(buildings, slice):
+            self.factors = (self.kpi_mask[:, :, None] * carrier_factors[None, :, :]).astype(self.dtype)
+        else:
+            self.factors[buildings] = self.kpi_mask[buildings, :, None] * carrier_factors[None, :, :]
+        for (b, c), factors in self.profile_factors.items():
+            self.factors[b, c] = factors
+
+    def set_country(self, country_id):
+        """
+        Recalculates the KPIs of all the buildings with the factors of another country. The results of the buildings
+        in that country (the asset costs depend on its electricity prices) come from the cache when possible
+        """
+        self.country_id = country_id
+        results = self._building_results(self.buildings, self.building_hashes, self.timestep_count)
+        self._assemble(results, self.building_hashes, self.building_ids, self.timestep_count)
+
+    def update(self, community_context):
+        """
+        Updates the engine to a modified community context (e.g. after a scenario action) recalculating only the
+        buildings whose content hash changed. The community sums are updated subtracting the old contribution of
+        those buildings and adding the new one
+
+        Returns
+        -------
+        List with the indices of the recalculated buildings
+        """
+        buildings = self._select_buildings(community_context)
+        timestep_count = self._timestep_count(community_context, buildings) or 0
+        hashes = [building_content_hash(building_asset_context) for building_asset_context in buildings]
+        building_ids = [building_asset_context.get(cte.ID, f"building_{b + 1}")
+                        for b, building_asset_context in enumerate(buildings)]
+        if timestep_count != self.timestep_count or len(building_ids) != len(self.building_ids):
+            # Buildings added or removed: the arrays are rebuilt, unchanged buildings come from the cache
+            self.load(community_context)
+            return list(range(len(buildings)))
+
+        # the ids can change (e.g. the buildings of a scenario get new ones), a building is only recalculated if the
+        # content at its position changed
+        self.building_ids = building_ids
+        self.buildings = buildings
+        dirty = [b for b, content_hash in enumerate(hashes) if content_hash != self.building_hashes[b]]
+        if not dirty:
+            return dirty
+        results = dict(zip(dirty, self._building_results([buildings[b] for b in dirty], [hashes[b] for b in dirty],
+                                                         timestep_count)))
+        building_results = [results.get(b, result) for b, result in enumerate(self.building_results)]
+        carrier_ids = {energy_carrier_id for result in building_results for energy_carrier_id in result["final_energy"]}
+        if carrier_ids != set(self.carrier_ids):
+            # Energy carrier added or no longer used by any building, the carriers axis is rebuilt
+            self._assemble(building_results, hashes, building_ids, timestep_count)
+            return dirty
+
+        # remove the old contribution of the dirty buildings
+        for name, totals in self.series_totals.items():
+            totals -= self.series[name][dirty].sum(axis=0)
+        self.final_energy_total -= self.final_energy[dirty].sum(axis=0)
+        for b in dirty:
+            self.total_demand -= self.building_results[b]["demand"]
+
+        national_averages = filter_values_batch("total_primary_energy_GHG_costs_intensity.csv",
+                                                [results[b]["benchmark_key"] for b in dirty])
+        for row, b in enumerate(dirty):
+            result = results[b]
+            self.building_hashes[b] = hashes[b]
+            self.building_results[b] = result
+            self.costs[b] = result["costs"]
+            self.areas[b] = result["area"]
+            self.residential[b] = result["residential"]
+            for name in BUILDING_SCALARS:
+                self.scalars[name][b] = result["scalars"][name]
+            for name, values in zip(NATIONAL_AVERAGES, national_averages[row]):
+                self.scalars[name][b] = values
+            for name in BUILDING_SERIES:
+                self.series[name][b] = result["series"][name]
+            self.total_demand += result["demand"]
+            self.carrier_names.update(result["carrier_names"])
+            self.profile_factors = {key: factors for key, factors in self.profile_factors.items() if key[0] != b}
+            self._fill_building_carriers(b, result["final_energy"], result["kpi_data"])
+        self._fill_factors(dirty)
+        self.calculate_kpis(dirty)
+
+        # add the new contribution
+        for name, totals in self.series_totals.items():
+            totals += self.series[name][dirty].sum(axis=0)
+        self.final_energy_total += self.final_energy[dirty].sum(axis=0)
+        return dirty
+
+    def calculate_kpis(self, buildings=None):
+        """
+        Primary energy, CO2 and costs of every building in one broadcasted product, then the per building totals
+        :param buildings: indices of the buildings to recalculate, all by default
+        """
+        if buildings is None:
+            # (buildings x factors x hours): kWh, kWh, kWh, g, euros, euros summed over the energy carriers
+            self.hourly_KPIs = np.einsum("bch,bck->bkh", self.final_energy, self.factors)
+            self.scalars["num_members"] = np.zeros(len(self.building_ids))
+            for name, k in KPI_SERIES.items():
+                self.series[name] = self.hourly_KPIs[:, k]
+            buildings = slice(None)
+        else:
+            # rows are written in place, so the KPI series (views of hourly_KPIs) are updated too
+            self.hourly_KPIs[buildings] = np.einsum("bch,bck->bkh", self.final_energy[buildings],
+                                                    self.factors[buildings])
+        totals = self.hourly_KPIs[buildings].sum(axis=2)
+        areas = self.areas[buildings]
+        total_energy_cost = np.where(self.residential[buildings], totals[:, HOUSEHOLD_COSTS], totals[:, NON_H_COSTS])
+        for name in ("total_primary_energy_intensity_kWh", "total_co2_intensity", "total_energy_cost_intensity"):
+            self.scalars.setdefault(name, np.zeros(len(self.building_ids)))
+        self.scalars["total_primary_energy_intensity_kWh"][buildings] = totals[:, PEF_TOTAL] / areas
+        self.scalars["total_co2_intensity"][buildings] = totals[:, CO2] / areas
+        self.scalars["total_energy_cost_intensity"][buildings] = total_energy_cost / areas
+
+    def citizen_kpi_definitions(self):
+        """
+        List of (id, name, unit, source, scale) of the citizen KPIs. The value of a KPI is the source array
+        (hourly series or per building scalar) multiplied by the scale
+        """
+        # same divisors as get_totals, the CO2 series are in g
+        divisors = dict(zip([name for name, _, _ in CITIZEN_EQUIVALENCES],
+                            citizen_equivalence_divisors(kpi_ctz_factors())))
+        co2_kg = 1 / 1000
+        return [
+            (1, cte.KPI_PEAK_HEAT_DEMAND_NAME, cte.KWH, "peak_heat_demand", 1),
+            (2, cte.KPI_PEAK_ELEC_DEMAND_NAME, cte.KWH, "peak_elec_demand", 1),
+            (3, cte.TOTAL_PRIMARY_ENERGY_NAME, cte.KWH, "total_primary_energy_kWh", 1),
+            (4, cte.NUM_MEMBERS_NAME, cte.AU, "num_members", 1),
+            (5, cte.EQUIVALENT_TV_HOURS_NAME, cte.HOURS, "total_primary_energy_kWh", 1 / divisors["TV_h"]),
+            (6, cte.EQUIVALENT_STREAMING_HOURS_NAME, cte.HOURS, "total_primary_energy_kWh",
+             1 / divisors["streaming_h"]),
+            (7, cte.PIZZA_CONSUMPTION_COMPARISON_NAME, cte.PIZZA, "total_primary_energy_kWh", 1 / divisors["Pizza_h"]),
+            (8, cte.BATTERY_USAGE_ESTIMATION_NAME, cte.CHARGES, "total_primary_energy_kWh",
+             1 / divisors["Battery_charges"]),
+            (9, cte.ELECTRIC_CAR_CHARGING_ESTIMATION_NAME, cte.CHARGES, "total_primary_energy_kWh",
+             1 / divisors["ElCar_charges"]),
+            (10, cte.WINE_BOTTLES_PRODUCTION_NAME, cte.BOTTLES, "total_primary_energy_kWh",
+             1 / divisors["Wine_bottles"]),
+            (11, cte.TREES_REQUIRED_FOR_CARBON_OFFSET_NAME, cte.TREES, "total_co2", co2_kg / divisors["Trees_number"]),
+            (12, cte.STREAMING_EMISSIONS_IMPACT_NAME, "hours", "total_co2",
+             co2_kg / divisors["streaming_emissionhours"]),
+            (13, cte.CARBON_EMISSIONS_PER_KILOMETER_NAME, cte.KM, "total_co2", co2_kg / divisors["ICV_km"]),
+            (14, cte.TOTAL_PV_NAME, cte.KWH, "total_PV", 1),
+            (15, cte.TOTAL_SELF_CONSUMPTION_NAME, cte.AU, "self_consumption", 1),
+            (16, cte.TOTAL_SELF_SUFFICIENCY_NAME, cte.AU, "self_sufficiency", 1),
+            (17, cte.RATE_OF_SELF_CONSUMPTION_NAME, cte.PERCENT, "rate_of_self_consumption", 1),
+            (18, cte.RENEWABLE_PRIMARY_ENERGY_NAME, cte.KWH, "total_primary_energy_renewable", 1),
+            (19, cte.NON_RENEWABLE_PRIMARY_ENERGY_NAME, cte.KWH, "total_primary_energy_non_renewable", 1),
+            (20, cte.NON_HOUSEHOLDS_COSTS_NAME, cte.EURO, "total_non_h_costs", 1),
+            (21, cte.HOUSEHOLDS_COSTS_NAME, cte.EURO, "total_h_costs", 1),
+            (22, cte.TOTAL_CO2_NAME, "g", "total_co2", 1),
+            (23, cte.TOTAL_PRIMARY_ENERGY_INTENSITY_NAME, cte.KWH_PER_M2, "total_primary_energy_intensity_kWh", 1),
+            (24, cte.NATIONAL_AVERAGE_TOTAL_PRIMARY_ENERGY_INTENSITY_NAME, cte.KWH_PER_M2,
+             "national_average_total_primary_energy_intensity", 1),
+            (25, cte.TOTAL_CO2_INTENSITY_NAME, cte.GRAMS_PER_M2, "total_co2_intensity", 1),
+            (26, cte.NATIONAL_AVERAGE_TOTAL_CO2_INTENSITY_NAME, cte.GRAMS_PER_M2, "national_average_total_CO2", 1),
+            (27, cte.TOTAL_ENERGY_COST_INTENSITY_NAME, cte.EURO_PER_M2, "total_energy_cost_intensity", 1),
+            (28, cte.NATIONAL_AVERAGE_TOTAL_ENERGY_COST_INTENSITY_NAME, cte.EURO_PER_M2,
+             "national_average_total_energy_cost", 1),
+            (29, "total_capex", cte.EURO, "total_capex", 1),
+            (30, "total_lifetime_costs", cte.EURO, "total_lifetime_costs", 1),
+            (31, "total_savings", cte.EURO, "total_savings", 1),
+            (32, "payback_period_years", "years", "payback_period", 1)
+        ]
+
+    def _source(self, source):
+        return self.series[source] if source in self.series else self.scalars[source]
+
+    def citizen_KPIs(self):
+        """
+        KPIs per building with the same structure returned by recalculate_indicators
+        """
+        definitions = self.citizen_kpi_definitions()
+        citizen_KPIs = {}
+        for b, building_id in enumerate(self.building_ids):
+            citizen_KPIs[building_id] = []
+            for kpi_id, name, unit, source, scale in definitions:
+                values = self._source(source)
+                if values.ndim == 2:
+                    value = (values[b] * scale).tolist()
+                else:
+                    value = None if np.isnan(values[b]) else float(values[b] * scale)
+                citizen_KPIs[building_id].append({cte.ID: kpi_id, "name": name, "value": value, "unit": unit})
+            id_for_citizen_kpi = 33
+            for c, energy_carrier_id in enumerate(self.carrier_ids):
+                if (self.final_energy[b, c] > 0).any():
+                    citizen_KPIs[building_id].append({cte.ID: id_for_citizen_kpi,
+                                                      "name": f"final_energy_{self.carrier_names[energy_carrier_id]}",
+                                                      "value": self.final_energy[b, c].tolist(), "unit": "kWh"})
+                    id_for_citizen_kpi += 1
+        return citizen_KPIs
+
+    def areas_buildings(self):
+        return {building_id: {cte.AREA: float(area)} for building_id, area in zip(self.building_ids, self.areas)}
+
+    def aggregated_demand(self):
+        """
+        Total demand of the community, same structure as aggregate_demand_profiles
+        """
+        return {demand_type: self.total_demand[d].tolist() for d, demand_type in enumerate(DEMAND_TYPES)}
+
+    def community_KPIs(self):
+        """
+        Community indicators (same structure as community_KPIs) calculated as reductions over the buildings axis
+        """
+        aggregate_KPIs = {}
+        total_area = self.areas.sum()
+        summed_sources = {}
+        for kpi_id, name, unit, source, scale in self.citizen_kpi_definitions():
+            values = self._source(source)
+            if name in AREA_WEIGHTED_KPIS:
+                aggregate_KPIs[name] = {"value": float(np.dot(values, self.areas) / total_area) * scale,
+                                        "unit": unit}
+                continue
+            if source not in summed_sources:
+                # Equivalent KPIs share the source, the sum over the buildings is only done once
+                if values.ndim == 2:
+                    # hourly series sums are kept by the engine
+                    summed_sources[source] = (self.series_totals[source], True)
+                else:
+                    defined = values[~np.isnan(values)]
+                    summed_sources[source] = (defined.sum(axis=0), len(defined) > 0)
+            total, any_defined = summed_sources[source]
+            if values.ndim == 2:
+                aggregate_KPIs[name] = {"value": (total * scale).tolist(), "unit": unit}
+            elif any_defined:
+                aggregate_KPIs[name] = {"value": float(total * scale), "unit": unit}
+        community_final_energy = self.final_energy_total
+        for c, energy_carrier_id in enumerate(self.carrier_ids):
+            aggregate_KPIs[f"final_energy_{self.carrier_names[energy_carrier_id]}"] = {
+                "value": community_final_energy[c].tolist(), "unit": "kWh"}
+
+        peak_demand = self.total_demand.max(axis=1) if self.timestep_count else np.zeros(len(DEMAND_TYPES))
+        aggregate_KPIs["KPI_peak_heat_demand_[kWh]"] = {"value": float(peak_demand[0]), "unit": "kWh"}
+        aggregate_KPIs["KPI_peak_dhw_demand_[kWh]"] = {"value": float(peak_demand[1]), "unit": "kWh"}
+        aggregate_KPIs["KPI_peak_cooling_demand_[kWh]"] = {"value": float(peak_demand[2]), "unit": "kWh"}
+        aggregate_KPIs["KPI_peak_elec_demand_[kWh]"] = {"value": float(peak_demand[3]), "unit": "kWh"}
+        if 12 in self.carrier_ids:
+            peak_electricity_consumption = float(community_final_energy[self.carrier_ids.index(12)].max())
+        else:
+            peak_electricity_consumption = 0.0
+        aggregate_KPIs["KPI_peak_electricity_consumption_[kWh]"] = {"value": peak_electricity_consumption,
+                                                                    "unit": "kWh"}
+        return aggregate_KPIs
+
+
+_community_engines = OrderedDict()  # {community key: CommunityKPIEngine}, most recently used last
+_community_engines_lock = threading.Lock()
+
+
+def incremental_community_KPIs(community_context, key=None, max_engines=8):
+    """
+    Community KPIs keeping one engine per community between calls: if there is an engine for the key it is updated
+    (only the changed buildings are recalculated), otherwise a new engine is created
+
+    Parameters
+    ----------
+    community_context: community context with the building_asset_context list
+    key: identifier of the community (e.g. the id or context_parent of the context), None to use a new engine
+    max_engines: number of community engines kept
+
+    Returns
+    -------
+    Community KPIs, same structure as community_KPIs
+    """
+    # large communities are evaluated in worker processes (small ones stay serial, see map_buildings)
+    if key is None:
+        return CommunityKPIEngine(community_context, parallel=True).community_KPIs()
+    with _community_engines_lock:
+        entry = _community_engines.get(key)
+        if entry is None:
+            entry = _community_engines[key] = [None, threading.Lock()]
+        _community_engines.move_to_end(key)
+        while len(_community_engines) > max_engines:
+            _community_engines.popitem(last=False)
+    with entry[1]:  # engine of a community is updated by one request at a time
+        if entry[0] is None:
+            entry[0] = CommunityKPIEngine(community_context, parallel=True)
+        else:
+            entry[0].update(community_context)
+        return entry[0].community_KPIs()
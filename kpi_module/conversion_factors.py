@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion factors of the energy carriers (primary energy, CO2 and costs) as a precomputed
+(energy carriers x countries x factors) matrix.
+
+The matrix is built once per process from the national data of energy_carrier.json and completed with the national
+data embedded in the generation systems catalogue. The KPI series of a building, or of a whole community, are then a
+single matrix product of the final energy per carrier and the factors of the selected country, so the country can be
+switched without walking the nested national_energy_carrier_production lists again.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import helpers.constants as cte
+from helpers.result_cache import clear_result_caches
+from catalogue_registry import generation_systems_catalogue
+
+ENERGY_CARRIER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues", "energy_carrier.json")
+# Order of the factors in the last axis of the matrix
+KPI_FACTORS = ("pef_tot", "pef_nren", "pef_ren", "f_co2_eq_g_kwh", "non_h_costs_eur_kwh", "house_costs_eur_kwh")
+PEF_TOTAL, PEF_NREN, PEF_REN, CO2, NON_H_COSTS, HOUSEHOLD_COSTS = range(len(KPI_FACTORS))
+# The generation systems catalogue uses other names for the same factors
+FACTOR_ALIASES = {
+    "pef_tot": ("pef_tot", "PEF_tot"),
+    "pef_nren": ("pef_nren", "PEF_nren"),
+    "pef_ren": ("pef_ren", "PEF_ren"),
+    "f_co2_eq_g_kwh": ("f_co2_eq_g_kwh", "fCO2eq_[gperkWh]"),
+    "non_h_costs_eur_kwh": ("non_h_costs_eur_kwh",),
+    "house_costs_eur_kwh": ("house_costs_eur_kwh",),
+}
+DEFAULT_COUNTRY_ID = 27  # country used for the KPIs so far
+EUROPEAN_COUNTRY_ID = 31  # fallback when a carrier has no data for the country
+
+
+def normalise_national_data(national_data):
+    """
+    Factors of a national_energy_carrier_production entry with the energy_carrier.json names, None values as 0
+    """
+    factors = []
+    for factor in KPI_FACTORS:
+        value = next((national_data[alias] for alias in FACTOR_ALIASES[factor] if alias in national_data), None)
+        factors.append(value if value is not None else 0.0)
+    return factors
+
+
+class ConversionFactorMatrix:
+    def __init__(self, national_data_entries):
+        """
+        :param national_data_entries: iterable of national_energy_carrier_production entries. If a
+        (energy_carrier_id, country_id) pair is repeated the first entry is kept, as the next() scan did
+        """
+        factors = {}
+        for national_data in national_data_entries:
+            energy_carrier_id = national_data.get("energy_carrier_id")
+            if energy_carrier_id is None:
+                continue
+            country_id = national_data.get(cte.COUNTRY_ID)
+            # Catalogue entries without country are the European averages
+            country_id = EUROPEAN_COUNTRY_ID if country_id is None else country_id
+            factors.setdefault((int(energy_carrier_id), int(country_id)), normalise_national_data(national_data))
+
+        self.carrier_ids = sorted({energy_carrier_id for energy_carrier_id, _ in factors})
+        self.country_ids = sorted({country_id for _, country_id in factors})
+        self.carrier_index = {energy_carrier_id: i for i, energy_carrier_id in enumerate(self.carrier_ids)}
+        self.country_index = {country_id: j for j, country_id in enumerate(self.country_ids)}
+        self.matrix = np.zeros((len(self.carrier_ids), len(self.country_ids), len(KPI_FACTORS)))
+        self.available = np.zeros((len(self.carrier_ids), len(self.country_ids)), dtype=bool)
+        for (energy_carrier_id, country_id), values in factors.items():
+            i, j = self.carrier_index[energy_carrier_id], self.country_index[country_id]
+            self.matrix[i, j] = values
+            self.available[i, j] = True
+
+    def resolve_country(self, energy_carrier_id, country_id=DEFAULT_COUNTRY_ID):
+        """
+        Country whose factors are used for a carrier: the country itself or the European average.
+        None if the carrier has data for neither of them
+        """
+        i = self.carrier_index.get(energy_carrier_id)
+        if i is None:
+            return None
+        for candidate in (country_id, EUROPEAN_COUNTRY_ID):
+            j = self.country_index.get(candidate)
+            if j is not None and self.available[i, j]:
+                return candidate
+        return None
+
+    def factors(self, energy_carrier_ids, country_id=DEFAULT_COUNTRY_ID):
+        """
+        Factors of several carriers for a country (European average as fallback)
+
+        Parameters
+        ----------
+        energy_carrier_ids: list of energy carrier ids
+        country_id: country of the factors
+
+        Returns
+        -------
+        np.ndarray (n_carriers x factors), in the order of KPI_FACTORS. Carriers without data are left at 0
+        """
+        factors = np.zeros((len(energy_carrier_ids), len(KPI_FACTORS)))
+        for n, energy_carrier_id in enumerate(energy_carrier_ids):
+            resolved_country_id = self.resolve_country(energy_carrier_id, country_id)
+            if resolved_country_id is not None:
+                factors[n] = self.matrix[self.carrier_index[energy_carrier_id],
+                                         self.country_index[resolved_country_id]]
+        return factors
+
+    def kpi_data(self, energy_carrier_id, country_id=DEFAULT_COUNTRY_ID):
+        """
+        Factors of a carrier as a kpi_data dictionary (as used by BuildingKPIs), None if there is no data
+        """
+        resolved_country_id = self.resolve_country(energy_carrier_id, country_id)
+        if resolved_country_id is None:
+            return None
+        values = self.matrix[self.carrier_index[energy_carrier_id], self.country_index[resolved_country_id]]
+        kpi_data = dict(zip(KPI_FACTORS, values.tolist()))
+        kpi_data["energy_carrier_id"] = energy_carrier_id
+        kpi_data[cte.COUNTRY_ID] = resolved_country_id
+        return kpi_data
+
+    def hourly_kpis(self, final_energy, energy_carrier_ids, country_id=DEFAULT_COUNTRY_ID):
+        """
+        KPI series as one matrix product of final energy and factors
+
+        Parameters
+        ----------
+        final_energy: np.ndarray (carriers x hours) for a building or (buildings x carriers x hours) for a community
+        energy_carrier_ids: energy carrier id of every row of the carriers axis
+        country_id: country of the factors
+
+        Returns
+        -------
+        np.ndarray (factors x hours) or (buildings x factors x hours): kWh, kWh, kWh, g, euros, euros
+        """
+        return np.einsum("...ch,ck->...kh", final_energy, self.factors(energy_carrier_ids, country_id))
+
+
+def load_national_data_entries(energy_carrier_path=ENERGY_CARRIER_PATH, catalogue=generation_systems_catalogue):
+    """
+    National data of energy_carrier.json followed by the national data embedded in the catalogue
+    """
+    with open(energy_carrier_path, "r") as file:
+        energy_carriers = json.load(file)
+    for energy_carrier in energy_carriers:
+        yield from energy_carrier.get(cte.NATIONAL_ENERGY_CARRIER_DATA) or []
+    for system in catalogue:
+        for key in (cte.ENERGY_CARRIER_INPUT1, "energy_carrier_input_2"):
+            energy_carrier = system.get(key)
+            if energy_carrier:
+                yield from energy_carrier.get(cte.NATIONAL_ENERGY_CARRIER_DATA) or ()
+
+
+_conversion_factor_matrix = None
+_lock = threading.Lock()
+
+
+def get_conversion_factor_matrix():
+    """
+    Shared ConversionFactorMatrix, built on first use
+    """
+    global _conversion_factor_matrix
+    if _conversion_factor_matrix is None:
+        with _lock:
+            if _conversion_factor_matrix is None:
+                _conversion_factor_matrix = ConversionFactorMatrix(load_national_data_entries())
+    return _conversion_factor_matrix
+
+
+def invalidate_conversion_factor_matrix():
+    """
+    Drops the shared matrix, e.g. after energy_carrier.json or the catalogue have been updated. The results
+    calculated with it are cleared too
+    """
+    global _conversion_factor_matrix
+    with _lock:
+        _conversion_factor_matrix = None
+    clear_result_caches()
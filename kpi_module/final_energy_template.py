@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Template of the final energy carriers of energy_carrier.json, used to create the FinalEnergy accumulators of the
+buildings.
+
+The carriers file is read once per process (lazily, on first use). Every building gets a FinalEnergyAccumulator that
+behaves as the {energy_carrier_id: FinalEnergy} dictionary built before, but only the carriers the building actually
+uses get hourly storage.
+"""
+import json
+import os
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+import helpers.constants as cte
+from classes_database import FinalEnergy
+from helpers.result_cache import clear_result_caches
+
+ENERGY_CARRIER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues", "energy_carrier.json")
+
+
+class FinalEnergyTemplate:
+    def __init__(self, path=ENERGY_CARRIER_PATH):
+        """
+        :param path: path of the energy_carrier.json file
+        """
+        self.path = path
+        self._carriers = None  # tuple of (id, name, final) of the final carriers, in the order of the file
+        self._row_index = None  # {energy_carrier_id: position in the file}
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._carriers is None:
+            with self._lock:
+                if self._carriers is None:
+                    self._load()
+
+    def _load(self):
+        with open(self.path, "r") as file:
+            json_data = json.load(file)
+        carriers = tuple((entry[cte.ID], entry["name"], entry["final"]) for entry in json_data if entry.get("final"))
+        self._row_index = {energy_carrier_id: row for row, (energy_carrier_id, _, _) in enumerate(carriers)}
+        self._carriers = carriers
+
+    def reload(self):
+        """
+        Re-reads the carriers file, e.g. after it has been updated. The results calculated with the previous carriers
+        are cleared
+        """
+        with self._lock:
+            self._load()
+        clear_result_caches()
+
+    @property
+    def carrier_ids(self):
+        self._ensure_loaded()
+        return [energy_carrier_id for energy_carrier_id, _, _ in self._carriers]
+
+    def row(self, energy_carrier_id):
+        """
+        Position of a carrier in the file (order of the accumulators), KeyError if it is not a final carrier
+        """
+        self._ensure_loaded()
+        return self._row_index[energy_carrier_id]
+
+    def new_final_energy(self, dtype=np.float64):
+        """
+        New (empty) final energy accumulator of a building
+
+        Parameters
+        ----------
+        dtype: dtype of the hourly data
+
+        Returns
+        -------
+        FinalEnergyAccumulator
+        """
+        self._ensure_loaded()
+        return FinalEnergyAccumulator(self, dtype)
+
+
+class FinalEnergyAccumulator(Mapping):
+    def __init__(self, template, dtype=np.float64):
+        """
+        {energy_carrier_id: FinalEnergy} mapping where the FinalEnergy instances are created on first access.
+        Iteration only yields the carriers that have been accessed, in the order of energy_carrier.json
+        """
+        self.template = template
+        self.dtype = dtype
+        self._instances = {}
+
+    def __getitem__(self, energy_carrier_id):
+        energy_instance = self._instances.get(energy_carrier_id)
+        if energy_instance is None:
+            # KeyError for carriers that are not final, as the dictionary of all the final carriers did
+            row = self.template.row(energy_carrier_id)
+            _, name, final = self.template._carriers[row]
+            energy_instance = FinalEnergy(energy_carrier_id, dtype=self.dtype)
+            energy_instance.name = name
+            energy_instance.final = final
+            self._instances[energy_carrier_id] = energy_instance
+        return energy_instance
+
+    def __contains__(self, energy_carrier_id):
+        return energy_carrier_id in self._instances
+
+    def __iter__(self):
+        return iter(sorted(self._instances, key=self.template.row))
+
+    def __len__(self):
+        return len(self._instances)
+
+
+# Shared by the whole process
+final_energy_template = FinalEnergyTemplate()
@@ -1,13 +1,15 @@
-import os
-import json
-from classes_database import FinalEnergy, BuildingKPIs, CommunityEnergyAsset
-import pandas as pd
-from KPI_module import (kpi_ctz_factors,tv_h, streaming_h, pizza_h, battery_charges, el_car_charges,trees_number,
-                        streaming_emission_hours,icv_km,wine_bottles)
+import numpy as np
+from classes_database import BuildingKPIs, CommunityEnergyAsset, availability_series
+from KPI_module import kpi_ctz_factors, citizen_equivalences
 import geopandas as gpd
-from shapely import wkt
-from shapely.geometry import shape
 import helpers.constants as cte
+from helpers.geometry import get_geometry_layer
+from helpers.time_series import to_hourly_array
+from catalogue_registry import GenerationSystemsCatalogue, generation_systems_catalogue
+from national_benchmarks import get_national_benchmarks
+from conversion_factors import DEFAULT_COUNTRY_ID, get_conversion_factor_matrix
+from final_energy_template import final_energy_template
+from parallel_evaluation import map_buildings
 
 
 def handle_demand_profile(building_asset_context,generation_system_profile,consumption_profile):
@@ -48,36 +50,53 @@ def handle_demand_profile(building_asset_context,generation_system_profile,consu
         return ValueError(
             f"Demand profile could not be calculated because generation system profile is missing for building ID: {building_id}")
 
+def self_consumption_kernel(total_electricity_use, total_PV):
+    """
+    Calculates in one pass the hourly self-consumption, grid consumption, rate of self-consumption and
+    self-sufficiency. Both inputs can be single series (8760,) or matrices (n_series, 8760), e.g. one row per
+    PV asset, and are broadcast against each other. None and NaN values are treated as 0.
+
+    Parameters
+    ----------
+    total_electricity_use: list or np.ndarray with the electricity use [kWh]
+    total_PV: list or np.ndarray with the PV production [kWh]
+
+    Returns
+    -------
+    self_consumption, grid_consumption, rate_of_self_consumption [%], self_sufficiency [%] as np.ndarray
+    """
+    total_electricity_use = to_hourly_array(total_electricity_use)
+    total_PV = to_hourly_array(total_PV)
+    self_consumption = np.minimum(total_electricity_use, total_PV)
+    grid_consumption = total_electricity_use - self_consumption
+    # Hours without production (or without use) give a rate of 0
+    rate_of_self_consumption = np.divide(self_consumption * 100, total_PV,
+                                         out=np.zeros_like(self_consumption), where=total_PV > 0)
+    self_sufficiency = np.divide(self_consumption * 100, total_electricity_use,
+                                 out=np.zeros_like(self_consumption), where=total_electricity_use > 0)
+    return self_consumption, grid_consumption, rate_of_self_consumption, self_sufficiency
+
 def calculate_self_consumption(total_electricity_use, total_PV):
-    return [
-        min(total_electricity_use[i], total_PV[i])
-        for i in range(len(total_electricity_use))
-    ]
+    return self_consumption_kernel(total_electricity_use, total_PV)[0].tolist()
 
 def calculate_rate_of_self_consumption(self_consumption, total_PV):
-    return [
-        (self_consumption[i] / total_PV[i]) * 100 if total_PV[i] > 0 else 0
-        for i in range(len(self_consumption))
-    ]
+    self_consumption = to_hourly_array(self_consumption)
+    total_PV = to_hourly_array(total_PV)
+    return np.divide(self_consumption * 100, total_PV, out=np.zeros_like(self_consumption),
+                     where=total_PV > 0).tolist()
 
 def calculate_grid_consumption(total_electricity_use, self_consumption):
-    return [
-        total_electricity_use[i] - self_consumption[i]
-        for i in range(len(total_electricity_use))
-    ]
+    return (to_hourly_array(total_electricity_use) - to_hourly_array(self_consumption)).tolist()
 
 def calculate_self_sufficiency(self_consumption, total_electricity_use):
-    return [
-        (self_consumption[i] / total_electricity_use[i]) * 100 if total_electricity_use[i] > 0 else 0
-        for i in range(len(self_consumption))
-    ]
+    self_consumption = to_hourly_array(self_consumption)
+    total_electricity_use = to_hourly_array(total_electricity_use)
+    return np.divide(self_consumption * 100, total_electricity_use, out=np.zeros_like(self_consumption),
+                     where=total_electricity_use > 0).tolist()
 
 def add_electricity_consumption(total_electricity_use, consumption):
-    for i in range(len(total_electricity_use)):
-        if consumption[i] is None:
-            consumption[i] = 0  # Handle None values in consumption
-        total_electricity_use[i] += consumption[i]
-    return total_electricity_use
+    # None values in consumption are handled as 0, a new array is returned
+    return to_hourly_array(total_electricity_use) + to_hourly_array(consumption)
 
 def check_system_type_to_get_consumption(system_name,consumption_profile):
     # print(type(consumption_profile))
@@ -98,31 +117,17 @@ def check_system_type_to_get_consumption(system_name,consumption_profile):
     return consumption, system_type
 
 def instantiate_final_energy_with_json():
-    parent_directory = os.path.dirname(os.path.abspath(__file__))
-    json_file_path = os.path.join(parent_directory,
-                                  "catalogues", "energy_carrier.json")
-    with open(json_file_path, "r") as file:
-        json_data = json.load(file)
-
-    total_final_energy = {} #diccionario de instancias de la clase Final Energy para cada energy carrier
-    for entry in json_data:
-        if entry.get("final"):
-            id = entry[cte.ID]
-            total_final_energy[id] = FinalEnergy(id)
-            total_final_energy[id].name = entry["name"]
-            total_final_energy[id].final = entry["final"]
-
-    return total_final_energy
+    # energy_carrier.json is read once per process, only the carriers used by the building get hourly storage
+    return final_energy_template.new_final_energy()
 
 def load_energy_system_catalogue():
-    parent_directory = os.path.dirname(os.path.abspath(__file__))
-    input_files_path = os.path.join(parent_directory,"catalogues",
-                                    "generation_systems_catalogue.json")
-    with open(input_files_path, "r") as file:
-        energy_systems_catalogue = json.load(file)
-    return energy_systems_catalogue
+    # The catalogue is parsed once per process and indexed by id, see catalogue_registry
+    return generation_systems_catalogue
 
 def filter_energy_systems_catalogue(energy_systems_catalogue, new_generation_system_id):
+    if isinstance(energy_systems_catalogue, GenerationSystemsCatalogue):
+        # O(1) lookup, a copy is returned so it can be embedded in the context
+        return energy_systems_catalogue.get(new_generation_system_id)
     # Loop through each system in the "systems" list
     for system in energy_systems_catalogue:
         # Check if the ID in the system matches the new_generation_system_id
@@ -131,12 +136,12 @@ def filter_energy_systems_catalogue(energy_systems_catalogue, new_generation_sys
 
     return None  # Return None if no matching system is found
 
-def calculate_building_indicators(consumption_profile,
-                                  generation_system_profile,
-                                  building_energy_asset,
-                                  timestep_count,
-                                  building_use_id):
+def calculate_building_final_energy(consumption_profile,
+                                    generation_system_profile,
+                                    building_energy_asset,
+                                    timestep_count):
     """
+    Calculates the electricity use, PV self-consumption indicators and final energy per energy carrier of a building
 
     Parameters
     ----------
@@ -150,10 +155,12 @@ def calculate_building_indicators(consumption_profile,
             }
     generation_system_profile is the dictionary of the energy systems
     building_energy_asset is a list of several assets
+    timestep_count: number of time steps of the series
 
     Returns
     -------
-
+    total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption, grid_consumption
+    (np.ndarray) and total_final_energy (FinalEnergy instances per energy carrier id, only the carriers used)
     """
     #initilize:
     rate_of_self_consumption = []
@@ -178,18 +185,16 @@ def calculate_building_indicators(consumption_profile,
     total_final_energy=instantiate_final_energy_with_json()
     energy_systems_catalogue=load_energy_system_catalogue()
     consumption=[]
-    costs={}
     if building_energy_asset is not None:
         # Initialize total_electricity_use with the base consumption profile
-        total_electricity_use = consumption_profile.get(cte.ELECTRICITY_CONSUMPTION, [])
+        # a missing or empty series counts as a zero series so the heat pumps and the PV can be added to it
+        total_electricity_use = to_hourly_array(consumption_profile.get(cte.ELECTRICITY_CONSUMPTION), timestep_count)
         for asset in building_energy_asset:
             if asset[cte.GENERATION_SYSTEM_ID] in list_of_hps:
                 # Perform element-wise summation for time_series_input1
-                time_series_input1_values =asset[cte.AVAILABILITY_TS][cte.VALUE_INPUT1].copy()
-                total_electricity_use = [
-                            total_electricity_use[i] + time_series_input1_values[i]
-                            for i in range(len(total_electricity_use))
-                        ]
+                # input1 of the assets created by the scenario generator is derived from the demand and the yields
+                input1 = availability_series(asset[cte.AVAILABILITY_TS])[cte.VALUE_INPUT1]
+                total_electricity_use = add_electricity_consumption(total_electricity_use, input1)
                 if asset[cte.GENERATION_SYSTEM_ID] in cooling_hps_list:
                     cooling_asset = True
                 if asset[cte.GENERATION_SYSTEM_ID] in dhw_hps_list:
@@ -223,38 +228,30 @@ def calculate_building_indicators(consumption_profile,
                 fuels_id=generation_system_profile[system_type][cte.ENERGY_CARRIER_INPUT1_ID ]
                 total_final_energy[fuels_id].add_new_consumption(consumption)
 
+        electric_asset = None
         for asset in building_energy_asset:
             if asset[cte.GENERATION_SYSTEM_ID] in electric_asset_list:
-                # PV system, scale output by pmax_scalar
-                # Perform element-wise summation for time_series_input1
-                time_series_input1_values =asset[cte.AVAILABILITY_TS][cte.VALUE_INPUT1].copy()
-                # Handle None by replacing it with 0
-                pmax_scalar = asset[cte.PMAX_SCALAR] if asset[cte.PMAX_SCALAR] is not None else 0
-
-                total_PV = [x * pmax_scalar for x in time_series_input1_values]
+                # As before, only the last electric asset is used for the self-consumption indicators
+                electric_asset = asset
                 electricity_asset = True
-                # Calculate self-consumption
-                self_consumption = calculate_self_consumption(total_electricity_use, total_PV)
-
-                # Calculate rate of self-consumption
-                rate_of_self_consumption = calculate_rate_of_self_consumption(self_consumption, total_PV)
-
-                # Calculate grid consumption
-                grid_consumption = calculate_grid_consumption(total_electricity_use, self_consumption)
-
-                #Calculate self-sufficiency
-                self_sufficiency = calculate_self_sufficiency(self_consumption, total_electricity_use)
 
 
             if asset[cte.GENERATION_SYSTEM_ID] not in list_of_hps and asset[
                 cte.GENERATION_SYSTEM_ID] not in electric_asset_list:
-                    time_series_input1_values = asset[cte.AVAILABILITY_TS][cte.VALUE_INPUT1].copy()
+                    time_series_input1_values = availability_series(asset[cte.AVAILABILITY_TS])[cte.VALUE_INPUT1]
                     total_input1 = [x * asset[cte.PMAX_SCALAR] for x in time_series_input1_values]
-                    system = filter_energy_systems_catalogue(energy_systems_catalogue, asset[cte.GENERATION_SYSTEM_ID])
+                    system = energy_systems_catalogue.view(asset[cte.GENERATION_SYSTEM_ID])
                     fuels_id=int(system[cte.ENERGY_CARRIER_INPUT1_ID ])
                     total_final_energy[fuels_id].add_new_consumption(total_input1)
 
-        if electricity_asset == False:
+        if electricity_asset:
+            # PV system, scale output by pmax_scalar
+            # Handle None by replacing it with 0
+            pmax_scalar = electric_asset[cte.PMAX_SCALAR] if electric_asset[cte.PMAX_SCALAR] is not None else 0
+            total_PV = to_hourly_array(electric_asset[cte.AVAILABILITY_TS][cte.VALUE_INPUT1]) * pmax_scalar
+            (self_consumption, grid_consumption, rate_of_self_consumption,
+             self_sufficiency) = self_consumption_kernel(total_electricity_use, total_PV)
+        else:
             # If no electricity asset, set grid_consumption equal to total_electricity_use
             grid_consumption = total_electricity_use
             # Set rate_of_self_consumption and self_sufficiency to lists of 8760 zeros
@@ -265,7 +262,8 @@ def calculate_building_indicators(consumption_profile,
     else:
         #there is no asset in this building
         # Initialize total_electricity_use with the base consumption profile
-        total_electricity_use = consumption_profile[cte.ELECTRICITY_CONSUMPTION].copy()
+        # a missing or empty series counts as a zero series so the heat pumps can be added to it
+        total_electricity_use = to_hourly_array(consumption_profile.get(cte.ELECTRICITY_CONSUMPTION), timestep_count)
         for system_name, system_id in generation_system_profile.items():
             # Check if the value is an integer (system ID)
             if not isinstance(system_id, int):
@@ -296,8 +294,43 @@ def calculate_building_indicators(consumption_profile,
                     total_final_energy[fuels_id].add_new_consumption(consumption)
 
     total_final_energy[12].add_new_consumption(grid_consumption)
-    KPIs = {}  # Dictionary to store the BuildingKPIs objects
+    return (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+            grid_consumption, total_final_energy)
 
+def select_national_data(data, country_id=DEFAULT_COUNTRY_ID):
+    """
+    Finds the entry of a country in a national_energy_carrier_production list (or single dictionary),
+    the European country_id (31) is used if there is no match. None if neither is found
+    """
+    # Handle both list and single dictionary cases
+    if isinstance(data, list):
+        # Look for a match in the list
+        kpi_data = next((item for item in data if item['country_id'] == country_id), None)
+        if kpi_data is None:  # If no match is found, use `country_id=31`
+            kpi_data = next((item for item in data if item['country_id'] == 31), None)
+    else:
+        # Single dictionary case: Check if `country_id` matches
+        if data['country_id'] == country_id:
+            kpi_data = data
+        else:  # Use `country_id=31` if no match
+            kpi_data = data if data['country_id'] == 31 else None
+    return kpi_data
+
+def select_carrier_kpi_data(generation_system_profile, country_id=DEFAULT_COUNTRY_ID):
+    """
+    Selects the national KPI factors (pef, CO2, costs) of every final energy carrier used by the generation systems
+
+    Parameters
+    ----------
+    generation_system_profile is the dictionary of the energy systems
+    country_id: country of the factors (27 by default), the European country_id (31) is used if there is no data
+
+    Returns
+    -------
+    Dictionary {energy_carrier_id: kpi_data}
+    """
+    conversion_factor_matrix = get_conversion_factor_matrix()
+    kpi_data_per_carrier = {}
     # Loop through the generation_system_profile
     for system_name, system in generation_system_profile.items():
         if system_name.endswith(
@@ -305,20 +338,12 @@ def calculate_building_indicators(consumption_profile,
             if cte.ENERGY_CARRIER_INPUT1 in system and system[cte.ENERGY_CARRIER_INPUT1].get("final") == True:
                 # Get the ID and KPI data
                 energy_carrier_id = system[cte.ENERGY_CARRIER_INPUT1][cte.ID]
-                data = system[cte.ENERGY_CARRIER_INPUT1][cte.NATIONAL_ENERGY_CARRIER_DATA]
-                target_country_id = 27  # Replace with the desired country_id, e.g., 31
-                # Handle both list and single dictionary cases
-                if isinstance(data, list):
-                    # Look for a match in the list
-                    kpi_data = next((item for item in data if item['country_id'] == target_country_id), None)
-                    if kpi_data is None:  # If no match is found, use `country_id=31`
-                        kpi_data = next((item for item in data if item['country_id'] == 31), None)
-                else:
-                    # Single dictionary case: Check if `country_id` matches
-                    if data['country_id'] == target_country_id:
-                        kpi_data = data
-                    else:  # Use `country_id=31` if no match
-                        kpi_data = data if data['country_id'] == 31 else None
+                # Factors are taken from the precomputed (carrier x country) matrix
+                kpi_data = conversion_factor_matrix.kpi_data(energy_carrier_id, country_id)
+                if kpi_data is None:
+                    # Carrier unknown to the matrix, use the national data embedded in the profile
+                    kpi_data = select_national_data(system[cte.ENERGY_CARRIER_INPUT1][cte.NATIONAL_ENERGY_CARRIER_DATA],
+                                                    country_id)
                     #kpi_data = {'pef_nren': float,
                     # 'f_co2_eq_g_kwh': float,
                     # 'non_h_costs_eur_kwh': float,
@@ -333,20 +358,37 @@ def calculate_building_indicators(consumption_profile,
                 if kpi_data is None:
                     raise ValueError("No matching or fallback country_id found in the data.")
 
-                if kpi_data is not None:
-                    KPIs[energy_carrier_id] = BuildingKPIs(total_final_energy[energy_carrier_id], kpi_data)
-                    if energy_carrier_id==12:
-                        cost_of_electricity_household = kpi_data.get("house_costs_eur_kwh", 0) if kpi_data.get(
-                            "house_costs_eur_kwh") is not None else 0
-                        cost_of_electricity_non_household = kpi_data.get("non_h_costs_eur_kwh", 0) if kpi_data.get(
-                            "non_h_costs_eur_kwh") is not None else 0
+                kpi_data_per_carrier[energy_carrier_id] = kpi_data
+    return kpi_data_per_carrier
 
-    for asset in building_energy_asset:
+def calculate_building_costs(building_energy_asset, building_use_id, total_PV, self_consumption, grid_consumption,
+                             electricity_kpi_data, electricity_final_energy):
+    """
+    Calculates the costs of the PV system (id 83) of a building against the electricity costs
+
+    Parameters
+    ----------
+    building_energy_asset is a list of several assets
+    building_use_id: 1, 2, 3 are residential (household costs), other uses get non household costs
+    total_PV, self_consumption, grid_consumption: hourly series of the building
+    electricity_kpi_data: national KPI factors of the electricity grid (energy carrier 12), can be None
+    electricity_final_energy: FinalEnergy instance of the electricity grid
+
+    Returns
+    -------
+    Dictionary of costs (see calculate_costs), empty if there is no PV system
+    """
+    costs = {}
+    electricity_kpi_data = electricity_kpi_data or {}
+    cost_of_electricity_household = electricity_kpi_data.get("house_costs_eur_kwh") or 0
+    cost_of_electricity_non_household = electricity_kpi_data.get("non_h_costs_eur_kwh") or 0
+    for asset in building_energy_asset or []:
         if asset.get(cte.GENERATION_SYSTEM_ID,0)==83:
             if building_use_id in [1, 2, 3]:
                 # print('to be modified in the future')
-                total_energy_costs_now=KPIs[12].household_costs_yearly
-                total_energy_costs_baseline=(sum(self_consumption)+sum(grid_consumption))*cost_of_electricity_household
+                # yearly costs of the electricity grid in k€ as in BuildingKPIs
+                total_energy_costs_now=electricity_final_energy.yearly_data*cost_of_electricity_household*1e-3
+                total_energy_costs_baseline=float(np.sum(self_consumption)+np.sum(grid_consumption))*cost_of_electricity_household
                 costs = calculate_costs(capacity=asset[cte.PMAX_SCALAR],
                                                               generation_system_id=83,
                                                               generation_time_series=total_PV,
@@ -354,8 +396,8 @@ def calculate_building_indicators(consumption_profile,
                                                               total_energy_costs_baseline=total_energy_costs_baseline
                                                               )
             else:
-                total_energy_costs_now = KPIs[12].non_h_costs_yearly
-                total_energy_costs_baseline = (sum(self_consumption) + sum(
+                total_energy_costs_now = electricity_final_energy.yearly_data*cost_of_electricity_non_household*1e-3
+                total_energy_costs_baseline = float(np.sum(self_consumption) + np.sum(
                     grid_consumption)) * cost_of_electricity_non_household
                 costs = calculate_costs(capacity=asset[cte.PMAX_SCALAR],
                                                               generation_system_id=83,
@@ -366,9 +408,50 @@ def calculate_building_indicators(consumption_profile,
             #     total_energy_cost = sum(total_non_h_costs)
             # area_building = building_asset_context.get(BUILDING, {}).get(AREA)
             #
+    return costs
+
+def calculate_building_indicators(consumption_profile,
+                                  generation_system_profile,
+                                  building_energy_asset,
+                                  timestep_count,
+                                  building_use_id,
+                                  country_id=DEFAULT_COUNTRY_ID):
+    """
+
+    Parameters
+    ----------
+    consumption_profile is the dictionary of consumption, typically:
+        BUILDING_CONSUMPTION:{
+            ID: int,
+            HEAT_CONSUMPTION:[],
+            DHW_CONSUMPTION:[],
+            ELECTRICITY_CONSUMPTION:[],
+            COOL_CONSUMPTION:[]
+            }
+    generation_system_profile is the dictionary of the energy systems
+    building_energy_asset is a list of several assets
+    country_id: country of the primary energy, CO2 and cost factors
+
+    Returns
+    -------
 
-    return (total_PV,rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
-            total_final_energy, KPIs, costs)
+    """
+    (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+     grid_consumption, total_final_energy) = calculate_building_final_energy(consumption_profile,
+                                                                            generation_system_profile,
+                                                                            building_energy_asset,
+                                                                            timestep_count)
+    kpi_data_per_carrier = select_carrier_kpi_data(generation_system_profile, country_id)
+    KPIs = {}  # Dictionary to store the BuildingKPIs objects
+    for energy_carrier_id, kpi_data in kpi_data_per_carrier.items():
+        KPIs[energy_carrier_id] = BuildingKPIs(total_final_energy[energy_carrier_id], kpi_data)
+    costs = calculate_building_costs(building_energy_asset, building_use_id, total_PV, self_consumption,
+                                     grid_consumption, kpi_data_per_carrier.get(12), total_final_energy[12])
+
+    # Time series are returned as lists so the indicators stay JSON serializable
+    return (np.asarray(total_PV).tolist(), np.asarray(rate_of_self_consumption).tolist(),
+            np.asarray(self_sufficiency).tolist(), np.asarray(total_electricity_use).tolist(),
+            np.asarray(self_consumption).tolist(), total_final_energy, KPIs, costs)
 
 def aggregate_demand_profiles(demand_profile):
     # Initialize a dictionary to store the aggregated demand
@@ -471,12 +554,35 @@ def community_KPIs(citizen_KPIs,total_demand,areas_buildings):
     # `aggregate_KPIs` now contains the summed values for each KPI across all buildings
     return aggregate_KPIs
 
+def get_totals(hourly_kpis, timestep_count=None):
+    """
+    Totals of the KPI series over the energy carriers and the citizen equivalences, for a building or a community
+
+    Parameters
+    ----------
+    hourly_kpis: np.ndarray (carriers x 6 x hours) for a building or (buildings x carriers x 6 x hours) for a
+        community, with the rows of BuildingKPIs.KPI_SERIES (kWh, kWh, kWh, g, euros, euros)
+    timestep_count: number of time steps kept, all by default
+
+    Returns
+    -------
+    totals: np.ndarray (6 x hours) or (buildings x 6 x hours) in the order of BuildingKPIs.KPI_SERIES
+    equivalences: np.ndarray (9 x hours) or (9 x buildings x hours) in the order of CITIZEN_EQUIVALENCES
+    """
+    hourly_kpis = np.asarray(hourly_kpis, dtype=float)[..., :timestep_count]
+    # one reduction over the carriers axis
+    totals = hourly_kpis.sum(axis=-3)
+    total_primary_energy_kWh = totals[..., 0, :]  # it is already in kWh unless we decide otherwise
+    total_co2_kg = totals[..., 3, :] / 1000
+    equivalences = citizen_equivalences(kpi_ctz_factors(), total_primary_energy_kWh, total_co2_kg)
+    return totals, equivalences
+
 def get_totals_per_building (KPIs,timestep_count,final_energy):
     """
 
     Parameters
     ----------
-    KPIs
+    KPIs: dictionary of BuildingKPIs per energy carrier
     timestep_count
     final_energy
 
@@ -484,82 +590,23 @@ def get_totals_per_building (KPIs,timestep_count,final_energy):
     -------
 
     """
-    # Initialize totals for the current building
-    total_primary_energy= [0] * timestep_count
-    total_primary_energy_renewable = [0] * timestep_count
-    total_primary_energy_non_renewable = [0] * timestep_count
-    total_non_h_costs = [0] * timestep_count
-    total_h_costs = [0] * timestep_count
-    total_co2= [0] * timestep_count
-    for id_carrier, energy_instance in KPIs.items():
-        if energy_instance is not None:
-            # Use dot notation to access the energy instance attributes
-            total_primary_energy = [
-                total_primary_energy[i] + energy_instance.PEF_total[i]
-                for i in range(timestep_count)
-            ]
-
-            total_primary_energy_renewable = [
-                total_primary_energy_renewable[i] + energy_instance.PEF_ren[i]
-                for i in range(timestep_count)
-            ]
-
-            total_primary_energy_non_renewable = [
-                total_primary_energy_non_renewable[i] + energy_instance.PEF_nren[i]
-                for i in range(timestep_count)
-            ]
-
-            total_non_h_costs = [
-                total_non_h_costs[i] + energy_instance.non_h_costs[i]
-                for i in range(timestep_count)
-            ]
-
-            total_h_costs= [
-                total_h_costs[i] + energy_instance.household_costs[i]
-                for i in range(timestep_count)
-            ]
-
-            total_co2 = [
-                total_co2[i] + energy_instance.co2[i]
-                for i in range(timestep_count)
-            ]
-    total_primary_energy_kWh = total_primary_energy  # it is already in kWh unless we decide otherwise
-    total_co2_kg = [x / 1000 for x in total_co2]
-    # Extract dictionary of citizen_kpis_factors
-    citizen_kpis_factors = kpi_ctz_factors()
-    # KPI Equivalent TV hours
-    TV_h = tv_h(citizen_kpis_factors=citizen_kpis_factors,
-                total_primary_energy=total_primary_energy_kWh)
-    # KPI Equivalent streaming hours
-    streaming_hours = streaming_h(citizen_kpis_factors=citizen_kpis_factors,
-                                  total_primary_energy=total_primary_energy_kWh)
-    # KPI equivalent pizza items
-    Pizza_h = pizza_h(citizen_kpis_factors=citizen_kpis_factors,
-                      total_primary_energy=total_primary_energy_kWh)
-    # Equivalent battery usage estimation
-    Battery_charges = battery_charges(citizen_kpis_factors=citizen_kpis_factors,
-                                      total_primary_energy=total_primary_energy_kWh)
-    # Equivalent electric car charging times
-    ElCar_charges = el_car_charges(citizen_kpis_factors=citizen_kpis_factors,
-                                   total_primary_energy=total_primary_energy_kWh)
-    # Equivalent trees - - CO2
-    Trees_number = trees_number(citizen_kpis_factors=citizen_kpis_factors, total_co2=total_co2_kg)
-
-    # Equivalent Streaming impact in emissions - - CO2
-    streaming_emissionhours = streaming_emission_hours(citizen_kpis_factors=citizen_kpis_factors,
-                                                       total_co2=total_co2_kg)
-    # - - CO2
-    ICV_km = icv_km(citizen_kpis_factors=citizen_kpis_factors, total_co2=total_co2_kg)
-    # Equivalent wine bottles produced - - CO2
-    Wine_bottles = wine_bottles(citizen_kpis_factors=citizen_kpis_factors,
-                                total_primary_energy=total_primary_energy_kWh)
+    # (carriers x 6 x hours) block of the building, the carriers are summed by get_totals
+    hourly_blocks = [energy_instance.hourly_block[:, :timestep_count] for energy_instance in KPIs.values()
+                     if energy_instance is not None]
+    if not hourly_blocks:
+        hourly_blocks = np.zeros((0, len(BuildingKPIs.KPI_SERIES), timestep_count))
+    totals, equivalences = get_totals(hourly_blocks, timestep_count)
+    (total_primary_energy_kWh, total_primary_energy_non_renewable, total_primary_energy_renewable, total_co2,
+     total_non_h_costs, total_h_costs) = totals.tolist()
+    (TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number, streaming_emissionhours, ICV_km,
+     Wine_bottles) = equivalences.tolist()
     FinalEnergy_dic = {}
 
     for key, energy_instance in final_energy.items():
         # Check if there"s any non-zero value in hourly_data
-        if any(value > 0 for value in energy_instance.hourly_data):
-            # Add to the dictionary with the appropriate name as key
-            FinalEnergy_dic[f"final_energy_{energy_instance.name}"] = energy_instance.hourly_data
+        if (energy_instance.hourly_data > 0).any():
+            # Add to the dictionary with the appropriate name as key (as list so it stays JSON serializable)
+            FinalEnergy_dic[f"final_energy_{energy_instance.name}"] = energy_instance.hourly_data.tolist()
 
     return (total_primary_energy_kWh, total_co2,total_primary_energy_non_renewable, total_primary_energy_renewable,
             total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number,
@@ -625,68 +672,172 @@ def filter_values(filename, building_use_id, construction_year, country_id):
     building_use_id = int(building_use_id) if building_use_id is not None else None
     construction_year = int(construction_year) if construction_year is not None else None
     country_id = int(country_id) if country_id is not None else None
+    # The table is read once and indexed, the fallback chain (no year, country 31, defaults) is solved there
+    return get_national_benchmarks(filename).lookup(building_use_id, construction_year, country_id)
 
-    parent_directory = os.path.dirname(os.path.abspath(__file__))
-    csv_path = os.path.join(parent_directory, "data", filename)
+def filter_values_batch(filename, buildings):
+    """
 
-    try:
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
-    except FileNotFoundError:
-        # print(f"Error: The file {filename} does not exist in the specified directory. , average values provided: 	234.87, 22, 43149.28568")
-        return 234.87, 22, 43149.28568
-    except Exception as e:
-        # print(f"Error loading file {filename}: {e}")
-        return 234.87, 22, 43149.28568
+    Parameters
+    ----------
+    filename: total_primary_energy_GHG_costs_intensity.csv
+    buildings: list of (building_use_id, construction_year, country_id)
 
+    Returns
+    -------
+    np.ndarray (n_buildings x 3) with the national averages: total_primary_energy_intensity,
+    total_energy_cost_intensity, total_CO2_intensity
 
+    """
+    return get_national_benchmarks(filename).lookup_many(buildings)
 
-    # Ensure required columns are present
-    required_columns = {"country_id","building_use_id", "construction_year", "total_primary_energy_intensity", "total_energy_cost_intensity", "total_CO2_intensity"}
-    if not required_columns.issubset(df.columns):
-        # print(f"Error: The file {filename} must contain the following columns: {required_columns}, average values provided: 	234.87, 22, 43149.28568")
-        return 234.87, 22, 43149.28568
-    # Cast relevant DataFrame columns to int
-    df[cte.BUILDING_USE_ID] = df[cte.BUILDING_USE_ID].astype("Int64")
-    df[cte.CONSTRUCTION_YEAR] = df[cte.CONSTRUCTION_YEAR].astype("Int64")
-    df[cte.COUNTRY_ID] = df[cte.COUNTRY_ID].astype("Int64")
+def baseline_building_indicators(task):
+    """
+    KPIs of one building of get_indicators_from_baseline. It is a top-level function so it can run in a worker process
 
+    Parameters
+    ----------
+    task: (building_id, generation_system_profile, building_use_id, construction_year, area_building,
+        building_consumption, demand_profile_building)
+
+    Returns
+    -------
+    building_id and list of citizen KPIs of the building
+    """
+    (building_id, generation_system_profile, building_use_id, construction_year, area_building,
+     building_consumption, demand_profile_building) = task
+    heating_consumption = building_consumption.get(cte.HEAT_CONSUMPTION, [0] * 8760)
+    electricity_consumption = building_consumption.get(cte.ELECTRICITY_CONSUMPTION, [0] * 8760)
+    cooling_consumption = building_consumption.get(cte.COOL_CONSUMPTION, [0] * 8760)
+    dhw_consumption = building_consumption.get(cte.DHW_CONSUMPTION, [0] * 8760)
+
+
+    # Define the systems to process (linking them to the profiles)
+    systems = {
+        cte.HEATING_SYSTEM: heating_consumption,
+        "electricity_system": electricity_consumption,
+        cte.COOLING_SYSTEM: cooling_consumption,
+        cte.DHW_SYSTEM: dhw_consumption
+    }
+
+    building_energy_asset=[]
+    (
+        total_PV,
+        rate_of_self_consumption,
+        self_sufficiency,
+        total_electricity_use,
+        self_consumption,
+        total_final_energy,
+        KPIs,
+        costs
+    ) = calculate_building_indicators(consumption_profile=building_consumption,
+                                      generation_system_profile=generation_system_profile,
+                                      building_energy_asset=building_energy_asset,
+                                      timestep_count=len(dhw_consumption),
+                                      building_use_id=building_use_id)
+
+    (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
+     total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number,
+     streaming_emissionhours, ICV_km, Wine_bottles, FinalEnergy_dic) = get_totals_per_building(KPIs,
+                                                                                               timestep_count=len(
+                                                                                                   dhw_consumption),
+                                                                                               final_energy=total_final_energy)
+    KPI_peak_heat_demand = max(demand_profile_building[cte.HEATING_DEMAND])
+    # calculate peak cooling demand
+    KPI_peak_elec_demand = max(total_electricity_use)
+
+    # Extract country_id from generation_system_profile
     try:
-        # Perform filtering for each variable
-        total_primary_energy_intensity_filtered = filter_function(
-            df=df,
-            variable="total_primary_energy_intensity",
-            building_use_id=building_use_id,
-            construction_year=construction_year,
-            country_id=country_id,
-        )
-        total_energy_cost_filtered = filter_function(
-            df=df,
-            variable="total_energy_cost_intensity",
-            building_use_id=building_use_id,
-            construction_year=construction_year,
-            country_id=country_id,
-        )
-        total_CO2_filtered = filter_function(
-            df=df,
-            variable="total_CO2_intensity",
-            building_use_id=building_use_id,
-            construction_year=construction_year,
-            country_id=country_id,
-        )
-        if total_primary_energy_intensity_filtered is None:
-            total_primary_energy_intensity_filtered= 234.87
-        if total_energy_cost_filtered is None:
-            total_energy_cost_filtered =22
-        if total_CO2_filtered is None:
-            total_CO2_filtered= 43149.28568
-
-        return total_primary_energy_intensity_filtered, total_energy_cost_filtered, total_CO2_filtered
-    except Exception as e:
-        # print(f"Error during filtering: {e}, average values provided: 	234.87, 22, 43149.28568")
-        return 234.87, 22, 43149.28568
+        country_id = generation_system_profile[cte.ELECTRICITY_SYSTEM][cte.ENERGY_CARRIER_INPUT1][
+            cte.NATIONAL_ENERGY_CARRIER_DATA][0][cte.COUNTRY_ID]
+    except (KeyError, IndexError, TypeError):
+        print(f"Error: Unable to extract {cte.COUNTRY_ID} from {cte.GENERATION_SYSTEM_PROFILE}.")
+        country_id = None
+
+    national_average_total_primary_energy_intensity, national_average_total_CO2, national_average_total_energy_cost = filter_values(
+        filename="total_primary_energy_GHG_costs_intensity.csv",
+        building_use_id=building_use_id,
+        construction_year=construction_year,
+        country_id=country_id)
+
+
+    # building_use_mapping = {
+    #     1: "residential",  # residential
+    #     2: "residential",  # residential
+    #     3: "residential",  # residential
+    #     4: "office",  # office
+    #     5: "commerce",  # commerce
+    #     6: "education",  # education
+    # }
+    if building_use_id in [1, 2, 3]:
+        total_energy_cost = sum(total_h_costs)
+    else:
+        total_energy_cost = sum(total_non_h_costs)
+
+    if area_building > 0:
+        total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
+        total_co2_intensity = sum(total_co2) / area_building
+        total_energy_cost_intensity = total_energy_cost / area_building
+    else:
+        area_building = 1
+        total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
+        total_co2_intensity = sum(total_co2) / area_building
+        total_energy_cost_intensity = total_energy_cost / area_building
+
+
+    # Store citizen KPIs for the building
+    citizen_KPIs = [
+        {cte.ID: 1, "name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
+        {cte.ID: 2, "name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
+        {cte.ID: 3, "name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh,
+         "unit": "kWh"},
+        {cte.ID: 4, "name": "num_members", "value": 0, "unit": "a.u."},
+        {cte.ID: 5, "name": "EquivalentTVHours_[h]", "value": TV_h, "unit": "h"},
+        {cte.ID: 6, "name": "EquivalentstreamingHours_[h]", "value": streaming_hours, "unit": "h"},
+        {cte.ID: 7, "name": "PizzaConsumptionComparison_[pizza]", "value": Pizza_h, "unit": "pizza"},
+        {cte.ID: 8, "name": "BatteryUsageEstimation_[charges]", "value": Battery_charges,
+         "unit": "charges"},
+        {cte.ID: 9, "name": "ElectricCarChargingEstimation_[charges]", "value": ElCar_charges,
+         "unit": "charges"},
+        {cte.ID: 10, "name": "WineBottlesProduction_[bottles]", "value": Wine_bottles, "unit": "bottles"},
+        {cte.ID: 11, "name": "TreesRequiredForCarbonOffset_[trees]", "value": Trees_number,
+         "unit": "trees"},
+        {cte.ID: 12, "name": "streamingEmissionsImpact_[hours]", "value": streaming_emissionhours,
+         "unit": "hours"},
+        {cte.ID: 13, "name": "CarbonEmissionsPerKilometer_[km]", "value": ICV_km, "unit": "km"},
+        {cte.ID: 14, "name": "Total_PV_[kWh]", "value": total_PV, "unit": "kWh"},
+        {cte.ID: 15, "name": "Total_self_consumption", "value": self_consumption, "unit": "a.u."},
+        {cte.ID: 16, "name": "Total_self_sufficiency", "value": self_sufficiency, "unit": "a.u."},
+        {cte.ID: 17, "name": "rate_of_self_consumption", "value": rate_of_self_consumption,
+         "unit": "%"},
+        {cte.ID: 18, "name": "renewable_primary_energy_[kWh]",
+         "value": total_primary_energy_renewable[building_id], "unit": "kWh"},
+        {cte.ID: 19, "name": "non_renewable_primary_energy_[kWh]",
+         "value": total_primary_energy_non_renewable[building_id], "unit": "kWh"},
+        {cte.ID: 20, "name": "non_households_costs_[€]", "value": total_non_h_costs[building_id], "unit": "€"},
+        {cte.ID: 21, "name": "households_costs_[€]", "value": total_h_costs[building_id], "unit": "€"},
+        {cte.ID: 22, "name": "Total_co2", "value": total_co2, "unit": "g CO2eq"},
+        {cte.ID: 23, "name": "total_primary_energy_intensity", "value": total_primary_energy_intensity_kWh,
+         "unit": "kWh/m2"},
+        {cte.ID: 24, "name": "national_average_total_primary_energy_intensity",
+         "value": national_average_total_primary_energy_intensity, "unit": "kWh/m2"},
+        {cte.ID: 25, "name": "total_CO2_intensity", "value": total_co2_intensity, "unit": "g/m2"},
+        {cte.ID: 26, "name": "national_average_total_CO2_intensity", "value": national_average_total_CO2,
+         "unit": "g/m2"},
+        {cte.ID: 27, "name": "total_energy_cost_intensity", "value": total_energy_cost_intensity, "unit": "€/m2"},
+        {cte.ID: 28, "name": "national_average_total_energy_cost_intensity",
+         "value": national_average_total_energy_cost, "unit": "€/m2"}
+    ]
+    id_for_citizen_kpi = 29
+    for key, energy_instance in FinalEnergy_dic.items():
+        citizen_KPIs.append(
+            {cte.ID: id_for_citizen_kpi, "name": key, "value": energy_instance, "unit": "kWh"})
+        id_for_citizen_kpi += 1
+
+    return building_id, citizen_KPIs
 
-def get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile):
+def get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile, parallel=False,
+                                 executor=None, max_workers=None, chunk_size=None):
     """
 
     Parameters
@@ -694,21 +845,19 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
     front_data = {
     data
     building_consumption_dict
+    parallel: True to evaluate the buildings in worker processes (see parallel_evaluation), serial by default
+    executor: optional executor for the parallel mode, the shared process pool by default
+    max_workers: number of workers of the shared process pool
+    chunk_size: number of buildings sent to a worker at a time
 
     Returns
     -------
 
     """
-    rate_of_self_consumption = {}
-    self_sufficiency = {}
-    total_electricity_use = {}
-    self_consumption = {}
-    total_final_energy = {}
-    total_PV = {}
     # groups
-    KPIs = {}
     citizen_KPIs = {}
-    costs={}
+    # inputs of every building, evaluated by baseline_building_indicators
+    tasks = []
     # Define the number of hours for each month (non-leap year)
     hours_per_month = {
         "January": 744, "February": 672, "March": 744, "April": 720,
@@ -719,6 +868,9 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
     # Total hours in a day
     hours_per_day = 24
     areas_buildings={}
+    # geometries of the buildings parsed once, shared with the other stages (see helpers.geometry)
+    if isinstance(front_data, list):
+        building_areas = get_geometry_layer([item.get("geom") for item in front_data]).areas()
 
     for i, item in enumerate(front_data):
         # Case 1: building_statistics_profile_id is in front_data and there is a loop for each item in front_data (per building)
@@ -734,15 +886,11 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
             generation_system_profile = building_profile.get(cte.GENERATION_SYSTEM_PROFILE, {})
             building_use_id = item.get(cte.BUILDING_USE_ID)
             construction_year= item.get(cte.CONSTRUCTION_YEAR)
-            # Check the type of item["geom"] and process accordingly
-            if isinstance(item["geom"], str):
-                # If it's a string, assume it's WKT and convert it to a Shapely geometry object
-                wkt_geom = item["geom"]
-                geom = wkt.loads(wkt_geom)
-            else:
-                # Otherwise, assume it's a GeoJSON-like dictionary and use shape()
-                geom = shape(item["geom"])
-            area_building = geom.area
+            # item["geom"] is WKT or a GeoJSON-like dictionary, already parsed in the layer
+            area_building = float(building_areas[i])
+            if not np.isfinite(area_building):
+                # the layer gives NaN for a missing geometry or one that could not be parsed
+                raise ValueError(f"Geometry of building {i + 1} is missing or could not be parsed")
             # Check if area_building is 0 and assign 100 if true
             if area_building < 10:
                 area_building = 100
@@ -752,14 +900,10 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
             generation_system_profile = building_statistics_profiles.get(cte.GENERATION_SYSTEM_PROFILE, {})
             building_use_id = front_data.get(cte.BUILDING_USE_ID)
             construction_year = front_data.get(cte.CONSTRUCTION_YEAR)
-            if isinstance(front_data["location"], str):
-                # If it's a string, assume it's WKT and convert it to a Shapely geometry object
-                wkt_geom = front_data["location"]
-                geom = wkt.loads(wkt_geom)
-            else:
-                # Otherwise, assume it's a GeoJSON-like dictionary and use shape()
-                geom = shape(front_data["location"])
-            area_building = geom.area
+            # front_data["location"] is WKT or a GeoJSON-like dictionary
+            area_building = float(get_geometry_layer([front_data["location"]]).areas()[0])
+            if not np.isfinite(area_building):
+                raise ValueError("Location geometry is missing or could not be parsed")
             # Check if area_building is 0 and assign 100 if true
             if area_building < 10:
                 area_building = 100 * front_data["num_building"]
@@ -777,11 +921,6 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
         if not building_consumption:
             building_consumption = building_consumption_dict.get("building_id_1", {})
 
-        heating_consumption = building_consumption.get(cte.HEAT_CONSUMPTION, [0] * 8760)
-        electricity_consumption = building_consumption.get(cte.ELECTRICITY_CONSUMPTION, [0] * 8760)
-        cooling_consumption = building_consumption.get(cte.COOL_CONSUMPTION, [0] * 8760)
-        dhw_consumption = building_consumption.get(cte.DHW_CONSUMPTION, [0] * 8760)
-
         # Check if demand_profile contains multiple buildings or a single building
         if isinstance(demand_profile, list):
             # Multiple buildings: loop through each building
@@ -792,131 +931,14 @@ def get_indicators_from_baseline(front_data, data, building_consumption_dict, de
             demand_profile_building = demand_profile[cte.DEMAND_PROFILE]
             # Process the single building profile here
 
-        # Define the systems to process (linking them to the profiles)
-        systems = {
-            cte.HEATING_SYSTEM: heating_consumption,
-            "electricity_system": electricity_consumption,
-            cte.COOLING_SYSTEM: cooling_consumption,
-            cte.DHW_SYSTEM: dhw_consumption
-        }
-
-        building_energy_asset=[]
-        (
-            total_PV[building_id],
-            rate_of_self_consumption[building_id],
-            self_sufficiency[building_id],
-            total_electricity_use[building_id],
-            self_consumption[building_id],
-            total_final_energy[building_id],
-            KPIs[building_id],
-            costs[building_id]
-        ) = calculate_building_indicators(consumption_profile=building_consumption,
-                                          generation_system_profile=generation_system_profile,
-                                          building_energy_asset=building_energy_asset,
-                                          timestep_count=len(dhw_consumption),
-                                          building_use_id=building_use_id)
-
-        (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
-         total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges, Trees_number,
-         streaming_emissionhours, ICV_km, Wine_bottles, FinalEnergy_dic) = get_totals_per_building(KPIs[building_id],
-                                                                                                   timestep_count=len(
-                                                                                                       dhw_consumption),
-                                                                                                   final_energy=
-                                                                                                   total_final_energy[
-                                                                                                           building_id])
-        KPI_peak_heat_demand = max(demand_profile_building[cte.HEATING_DEMAND])
-        # calculate peak cooling demand
-        KPI_peak_elec_demand = max(total_electricity_use[building_id])
-
-        # Extract country_id from generation_system_profile
-        try:
-            country_id = generation_system_profile[cte.ELECTRICITY_SYSTEM][cte.ENERGY_CARRIER_INPUT1][
-                cte.NATIONAL_ENERGY_CARRIER_DATA][0][cte.COUNTRY_ID]
-        except (KeyError, IndexError, TypeError):
-            print(f"Error: Unable to extract {cte.COUNTRY_ID} from {cte.GENERATION_SYSTEM_PROFILE}.")
-            country_id = None
-
-        national_average_total_primary_energy_intensity, national_average_total_CO2, national_average_total_energy_cost = filter_values(
-            filename="total_primary_energy_GHG_costs_intensity.csv",
-            building_use_id=building_use_id,
-            construction_year=construction_year,
-            country_id=country_id)
-
-
-        # building_use_mapping = {
-        #     1: "residential",  # residential
-        #     2: "residential",  # residential
-        #     3: "residential",  # residential
-        #     4: "office",  # office
-        #     5: "commerce",  # commerce
-        #     6: "education",  # education
-        # }
-        if building_use_id in [1, 2, 3]:
-            total_energy_cost = sum(total_h_costs)
-        else:
-            total_energy_cost = sum(total_non_h_costs)
-
-        if area_building > 0:
-            total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
-            total_co2_intensity = sum(total_co2) / area_building
-            total_energy_cost_intensity = total_energy_cost / area_building
-        else:
-            area_building = 1
-            total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
-            total_co2_intensity = sum(total_co2) / area_building
-            total_energy_cost_intensity = total_energy_cost / area_building
-
-
-        # Store citizen KPIs for the building
-        citizen_KPIs[building_id] = [
-            {cte.ID: 1, "name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
-            {cte.ID: 2, "name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
-            {cte.ID: 3, "name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh,
-             "unit": "kWh"},
-            {cte.ID: 4, "name": "num_members", "value": 0, "unit": "a.u."},
-            {cte.ID: 5, "name": "EquivalentTVHours_[h]", "value": TV_h, "unit": "h"},
-            {cte.ID: 6, "name": "EquivalentstreamingHours_[h]", "value": streaming_hours, "unit": "h"},
-            {cte.ID: 7, "name": "PizzaConsumptionComparison_[pizza]", "value": Pizza_h, "unit": "pizza"},
-            {cte.ID: 8, "name": "BatteryUsageEstimation_[charges]", "value": Battery_charges,
-             "unit": "charges"},
-            {cte.ID: 9, "name": "ElectricCarChargingEstimation_[charges]", "value": ElCar_charges,
-             "unit": "charges"},
-            {cte.ID: 10, "name": "WineBottlesProduction_[bottles]", "value": Wine_bottles, "unit": "bottles"},
-            {cte.ID: 11, "name": "TreesRequiredForCarbonOffset_[trees]", "value": Trees_number,
-             "unit": "trees"},
-            {cte.ID: 12, "name": "streamingEmissionsImpact_[hours]", "value": streaming_emissionhours,
-             "unit": "hours"},
-            {cte.ID: 13, "name": "CarbonEmissionsPerKilometer_[km]", "value": ICV_km, "unit": "km"},
-            {cte.ID: 14, "name": "Total_PV_[kWh]", "value": total_PV[building_id], "unit": "kWh"},
-            {cte.ID: 15, "name": "Total_self_consumption", "value": self_consumption[building_id], "unit": "a.u."},
-            {cte.ID: 16, "name": "Total_self_sufficiency", "value": self_sufficiency[building_id], "unit": "a.u."},
-            {cte.ID: 17, "name": "rate_of_self_consumption", "value": rate_of_self_consumption[building_id],
-             "unit": "%"},
-            {cte.ID: 18, "name": "renewable_primary_energy_[kWh]",
-             "value": total_primary_energy_renewable[building_id], "unit": "kWh"},
-            {cte.ID: 19, "name": "non_renewable_primary_energy_[kWh]",
-             "value": total_primary_energy_non_renewable[building_id], "unit": "kWh"},
-            {cte.ID: 20, "name": "non_households_costs_[€]", "value": total_non_h_costs[building_id], "unit": "€"},
-            {cte.ID: 21, "name": "households_costs_[€]", "value": total_h_costs[building_id], "unit": "€"},
-            {cte.ID: 22, "name": "Total_co2", "value": total_co2, "unit": "g CO2eq"},
-            {cte.ID: 23, "name": "total_primary_energy_intensity", "value": total_primary_energy_intensity_kWh,
-             "unit": "kWh/m2"},
-            {cte.ID: 24, "name": "national_average_total_primary_energy_intensity",
-             "value": national_average_total_primary_energy_intensity, "unit": "kWh/m2"},
-            {cte.ID: 25, "name": "total_CO2_intensity", "value": total_co2_intensity, "unit": "g/m2"},
-            {cte.ID: 26, "name": "national_average_total_CO2_intensity", "value": national_average_total_CO2,
-             "unit": "g/m2"},
-            {cte.ID: 27, "name": "total_energy_cost_intensity", "value": total_energy_cost_intensity, "unit": "€/m2"},
-            {cte.ID: 28, "name": "national_average_total_energy_cost_intensity",
-             "value": national_average_total_energy_cost, "unit": "€/m2"}
-        ]
-        id_for_citizen_kpi = 29
-        for key, energy_instance in FinalEnergy_dic.items():
-            citizen_KPIs[building_id].append(
-                {cte.ID: id_for_citizen_kpi, "name": key, "value": energy_instance, "unit": "kWh"})
-            id_for_citizen_kpi += 1
-
+        tasks.append((building_id, generation_system_profile, building_use_id, construction_year, area_building,
+                      building_consumption, demand_profile_building))
 
+    # results are merged in the order of the buildings, whatever the number of workers
+    for building_id, building_citizen_KPIs in map_buildings(baseline_building_indicators, tasks, parallel=parallel,
+                                                            executor=executor, max_workers=max_workers,
+                                                            chunk_size=chunk_size):
+        citizen_KPIs[building_id] = building_citizen_KPIs
     return citizen_KPIs, areas_buildings
 
 
@@ -1048,9 +1070,7 @@ def calculate_costs(capacity, generation_system_id, generation_time_series,
         total_energy_costs_now = [0] * len(generation_time_series)
     # Load system profile
     energy_systems_catalogue = load_energy_system_catalogue()
-    system_profile = filter_energy_systems_catalogue(
-        energy_systems_catalogue=energy_systems_catalogue,
-        new_generation_system_id=generation_system_id)
+    system_profile = energy_systems_catalogue.view(generation_system_id)
     # Ensure system_profile is not None
     if system_profile is None:
         CAPEX = 1000  # Default: 1000 EUR/kW
@@ -1067,7 +1087,7 @@ def calculate_costs(capacity, generation_system_id, generation_time_series,
     # Calculate CAPEX
     total_capex = calculate_total_capex(capacity, CAPEX)
     # Total annual generation
-    annual_generation = sum(generation_time_series)
+    annual_generation = float(np.sum(generation_time_series))
     # Maintenance and operating costs
     annual_maintenance_cost = calculate_annual_opex(annual_generation=annual_generation, opex_per_kwh=OPEX)
     # Total energy costs per year
@@ -1121,188 +1141,52 @@ def calculate_costs(capacity, generation_system_id, generation_time_series,
     }
 
 
-def recalculate_indicators (community_context):
-    #dictionary handlers for every KPI and every building
-    rate_of_self_consumption={}
-    self_sufficiency={}
-    total_electricity_use={}
-    self_consumption={}
-    total_final_energy={}
-    total_PV={}
-    #groups of KPIs
-    KPIs={}
-    citizen_KPIs={}
-    costs={}
-    areas_buildings = {}
-    # Totals
-    hourly_KPIs = {}
-    demand_profiles_context=[]
-    if cte.BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[cte.BUILDING_ASSET_CONTEXT], list):
-        for building_asset_context in community_context[cte.BUILDING_ASSET_CONTEXT]:
-            building_id_increment=0
-            # Check if GENERATION_SYSTEM_PROFILE_ID is in the building_dic
-            if cte.GENERATION_SYSTEM_PROFILE_ID in building_asset_context:
-                # Handle building_id: If it doesn"t exist, assign an incremented id
-                building_id = building_asset_context.get(cte.ID, f"building_{building_id_increment + 1}")  # Incremental ID if missing
-                # Handle consumption_profile: Raise an error if it doesn"t exist
-                if cte.BUILDING_CONSUMPTION not in building_asset_context or building_asset_context[
-                    cte.BUILDING_CONSUMPTION] is None:
-                    raise ValueError(f"Consumption profile does not exist for building ID: {building_id}")
-                consumption_profile = building_asset_context[cte.BUILDING_CONSUMPTION]
-                # Handle timestep_count: If null, use the length of any of the consumption profile arrays
-                timestep_count = community_context.get("timestep_count")
-                if timestep_count is None:
-                    if len(consumption_profile) > 0:
-                        timestep_count = len(
-                            next(iter(consumption_profile.values())))  # Length of first consumption array
-                    else:
-                        raise ValueError(f"Timestep count could not be determined for building ID: {building_id}")
-                # Handle building_energy_asset: Assign None if it doesn"t exist
-                building_energy_asset = building_asset_context.get("building_energy_asset", None)
-
-
-                # Handle generation_system_profile: Assign None if it doesn"t exist
-                generation_system_profile = building_asset_context.get(cte.GENERATION_SYSTEM_PROFILE, None)
-                demand_profile=handle_demand_profile(building_asset_context,generation_system_profile,consumption_profile)
-                demand_profiles_context.append({cte.DEMAND_PROFILE: demand_profile})
-                building_use_id = building_asset_context.get(cte.BUILDING, {}).get(cte.BUILDING_USE_ID)
-                # Further processing such as adding to KPIs, calculating other values, etc.
-                #timestep_count=community_context["timestep_count"]
-                #building_id = building_asset_context[ID]
-                #building_energy_asset = building_asset_context["building_energy_asset"]
-                #generation_system_profile = building_asset_context[GENERATION_SYSTEM_PROFILE]
-                #consumption_profile = building_asset_context[BUILDING_CONSUMPTION]
-                #demand_profile=building_asset_context[BUILDING][DEMANDPROFILE]
-                hourly_KPIs[building_id] = {}
-                # Calculate building indicators
-                (
-                    total_PV[building_id],
-                    rate_of_self_consumption[building_id],
-                    self_sufficiency[building_id],
-                    total_electricity_use[building_id],
-                    self_consumption[building_id],
-                    total_final_energy[building_id],
-                    KPIs[building_id],
-                    costs[building_id]
-                ) = calculate_building_indicators(consumption_profile, generation_system_profile, building_energy_asset,
-                                                  timestep_count,building_use_id)
-
-                # Add consumption_profile and demand_profile
-                for key, value in consumption_profile.items():
-                    hourly_KPIs[building_id].update({
-                        f"consumption_profile_{key}": value})
-
-                for key, value in demand_profile.items():
-                    hourly_KPIs[building_id].update({
-                        f"demand_profile_{key}" : value})
-                building_id_increment+=1
-            (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
-             total_h_costs, total_non_h_costs, TV_h, streaming_hours, Pizza_h, Battery_charges, ElCar_charges,
-             Trees_number,
-             streaming_emissionhours, ICV_km, Wine_bottles, FinalEnergy_dic) = get_totals_per_building(KPIs[building_id],
-                                                                                                       timestep_count=timestep_count,
-                                                                                                       final_energy=total_final_energy[building_id])
-            # calculate peak heat demand
-            KPI_peak_heat_demand = max(demand_profile[cte.HEATING_DEMAND])
-            # calculate peak cooling demand
-            KPI_peak_elec_demand = max(total_electricity_use[building_id])
-            try:
-                # Extract country_id from generation_system_profile
-                data = generation_system_profile[cte.ELECTRICITY_SYSTEM][cte.ENERGY_CARRIER_INPUT1][
-                    cte.NATIONAL_ENERGY_CARRIER_DATA]
-                if isinstance(data, list):
-                    # Look for a match in the list
-                    country_id=data[0][cte.COUNTRY_ID]
-                else:
-                    country_id=data[cte.COUNTRY_ID]
-            except (KeyError, IndexError, TypeError):
-                # print(f"Error: Unable to extract {COUNTRY_ID} from {GENERATION_SYSTEM_PROFILE}.")
-                #assign European country id (31)
-                country_id = 31
-            try:
-                #get national averages for KPIs comparison
-                national_average_total_primary_energy_intensity,national_average_total_CO2,national_average_total_energy_cost =filter_values(filename="total_primary_energy_GHG_costs_intensity.csv",
-                                                                          building_use_id=building_use_id,
-                                                                          construction_year=building_asset_context.get(cte.BUILDING, {}).get(cte.CONSTRUCTION_YEAR),
-                                                                          country_id=country_id)
-            except (KeyError, IndexError, TypeError):
-                print(f"Error: national_average_total_primary_energy_intensity, "
-                      f"national_average_total_CO2 or national_average_total_energy_cost "
-                      f"is None  ")
-            areas_buildings[building_id]={}
-            # building_use_mapping = {
-            #     1: "residential",  # residential
-            #     2: "residential",  # residential
-            #     3: "residential",  # residential
-            #     4: "office",  # office
-            #     5: "commerce",  # commerce
-            #     6: "education",  # education
-            # }
-            if building_use_id in [1,2,3]:
-                total_energy_cost=sum(total_h_costs)
-            else:
-                total_energy_cost=sum(total_non_h_costs)
-            area_building = building_asset_context.get(cte.BUILDING, {}).get(cte.AREA)
-            if area_building>1:
-                total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
-                total_co2_intensity=sum(total_co2)/ area_building
-                total_energy_cost_intensity=total_energy_cost/area_building
-            else:
-                # print(f"Error: building area cannot be close to 0, e.g. 1*10-6, 100m2 is assumed")
-                area_building=100 #m2 assumption
-                total_primary_energy_intensity_kWh = sum(total_primary_energy_kWh) / area_building
-                total_co2_intensity=sum(total_co2)/ area_building
-                total_energy_cost_intensity=total_energy_cost/area_building
-            areas_buildings[building_id][cte.AREA]=area_building
-            #get cost data
-            total_capex = costs[building_id]["total_capex"] if building_energy_asset else 0
-            total_lifetime_costs = costs[building_id]["total_lifetime_costs"] if building_energy_asset else 0
-            total_savings = costs[building_id]["total_savings"] if building_energy_asset else 0
-            payback_period = costs[building_id]["payback_period_years"] if building_energy_asset else 0
-            # Store citizen KPIs for the building
-            citizen_KPIs[building_id] = [
-                {cte.ID: 1, "name": "KPI_peak_heat_demand_[kWh]", "value": KPI_peak_heat_demand, "unit": "kWh"},
-                {cte.ID: 2, "name": "KPI_peak_elec_demand_[kWh]", "value": KPI_peak_elec_demand, "unit": "kWh"},
-                {cte.ID: 3, "name": "total_primary_energy_[kWh]", "value": total_primary_energy_kWh, "unit": "kWh"},
-                {cte.ID: 4, "name": "num_members", "value": 0, "unit": "a.u."},
-                {cte.ID: 5, "name": "EquivalentTVHours_[h]", "value": TV_h, "unit": "h"},
-                {cte.ID: 6, "name": "EquivalentstreamingHours_[h]", "value": streaming_hours, "unit": "h"},
-                {cte.ID: 7, "name": "PizzaConsumptionComparison_[pizza]", "value": Pizza_h, "unit": "pizza"},
-                {cte.ID: 8, "name": "BatteryUsageEstimation_[charges]", "value": Battery_charges,
-                 "unit": "charges"},
-                {cte.ID: 9, "name": "ElectricCarChargingEstimation_[charges]", "value": ElCar_charges,
-                 "unit": "charges"},
-                {cte.ID: 10, "name": "WineBottlesProduction_[bottles]", "value": Wine_bottles, "unit": "bottles"},
-                {cte.ID: 11, "name": "TreesRequiredForCarbonOffset_[trees]", "value": Trees_number,
-                 "unit": "trees"},
-                {cte.ID: 12, "name": "streamingEmissionsImpact_[hours]", "value": streaming_emissionhours,
-                 "unit": "hours"},
-                {cte.ID: 13, "name": "CarbonEmissionsPerKilometer_[km]", "value": ICV_km, "unit": "km"},
-                {cte.ID: 14, "name": "Total_PV_[kWh]", "value": total_PV[building_id], "unit": "kWh"},
-                {cte.ID: 15, "name": "Total_self_consumption", "value": self_consumption[building_id], "unit": "a.u."},
-                {cte.ID: 16, "name": "Total_self_sufficiency", "value": self_sufficiency[building_id], "unit": "a.u."},
-                {cte.ID: 17, "name": "rate_of_self_consumption", "value": rate_of_self_consumption[building_id], "unit": "%"},
-                {cte.ID: 18, "name": "renewable_primary_energy_[kWh]", "value": total_primary_energy_renewable, "unit": "kWh"},
-                {cte.ID: 19, "name": "non_renewable_primary_energy_[kWh]", "value": total_primary_energy_non_renewable, "unit": "kWh"},
-                {cte.ID: 20, "name": "non_households_costs_[€]", "value": total_non_h_costs, "unit": "€"},
-                {cte.ID: 21, "name": "households_costs_[€]", "value": total_h_costs, "unit": "€"},
-                {cte.ID: 22, "name": "Total_co2", "value": total_co2, "unit": "g"},
-                {cte.ID: 23, "name": "total_primary_energy_intensity","value": total_primary_energy_intensity_kWh, "unit": "kWh/m2"},
-                {cte.ID: 24, "name": "national_average_total_primary_energy_intensity","value": national_average_total_primary_energy_intensity, "unit": "kWh/m2"},
-                {cte.ID: 25, "name": "total_CO2_intensity","value": total_co2_intensity, "unit": "g/m2"},
-                {cte.ID: 26, "name": "national_average_total_CO2_intensity","value": national_average_total_CO2, "unit": "g/m2"},
-                {cte.ID: 27, "name": "total_energy_cost_intensity","value": total_energy_cost_intensity, "unit": "€/m2"},
-                {cte.ID: 28, "name": "national_average_total_energy_cost_intensity","value": national_average_total_energy_cost, "unit": "€/m2"},
-                {cte.ID: 29, "name": "total_capex", "value": total_capex, "unit": "€"},
-                {cte.ID: 30, "name": "total_lifetime_costs", "value": total_lifetime_costs, "unit": "€"},
-                {cte.ID: 31, "name": "total_savings", "value": total_savings, "unit": "€"},
-                {cte.ID: 32, "name": "payback_period_years", "value": payback_period, "unit": "years"}
-            ]
-            id_for_citizen_kpi = 33
-            for key, energy_instance in FinalEnergy_dic.items():
-                citizen_KPIs[building_id].append({cte.ID: id_for_citizen_kpi, "name": key, "value": energy_instance, "unit": "kWh"})
-                id_for_citizen_kpi += 1
-    else:
-        print("community context structure is not correct, should be a list")
-    return citizen_KPIs, demand_profiles_context,areas_buildings
+def get_building_country_id(generation_system_profile):
+    """
+    Extracts the country_id of a building from the national data of its electricity system.
+    The European country id (31) is returned if it cannot be found
+    """
+    try:
+        # Extract country_id from generation_system_profile
+        data = generation_system_profile[cte.ELECTRICITY_SYSTEM][cte.ENERGY_CARRIER_INPUT1][
+            cte.NATIONAL_ENERGY_CARRIER_DATA]
+        if isinstance(data, list):
+            # Look for a match in the list
+            country_id=data[0][cte.COUNTRY_ID]
+        else:
+            country_id=data[cte.COUNTRY_ID]
+    except (KeyError, IndexError, TypeError):
+        # print(f"Error: Unable to extract {COUNTRY_ID} from {GENERATION_SYSTEM_PROFILE}.")
+        #assign European country id (31)
+        country_id = 31
+    return country_id
+
+def recalculate_indicators (community_context, parallel=False, executor=None, max_workers=None, chunk_size=None):
+    """
+    Citizen KPIs of every building of the community context, calculated by CommunityKPIEngine (see
+    community_kpi_engine.py)
+
+    Parameters
+    ----------
+    community_context: community context with the building_asset_context list
+    parallel: True to evaluate the buildings in worker processes (see parallel_evaluation), serial by default
+    executor: optional executor for the parallel mode, the shared process pool by default
+    max_workers: number of workers of the shared process pool
+    chunk_size: number of buildings sent to a worker at a time
 
+    Returns
+    -------
+    citizen_KPIs, demand_profiles_context, areas_buildings (in the order of the buildings)
+    """
+    # imported here as the engine is built on the functions of this module
+    from community_kpi_engine import CommunityKPIEngine, DEMAND_TYPES
+    if not (cte.BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[cte.BUILDING_ASSET_CONTEXT], list)):
+        print("community context structure is not correct, should be a list")
+        return {}, [], {}
+    # Only the buildings with GENERATION_SYSTEM_PROFILE_ID are evaluated
+    engine = CommunityKPIEngine(community_context, parallel=parallel, executor=executor, max_workers=max_workers,
+                                chunk_size=chunk_size)
+    demand_profiles_context = [
+        {cte.DEMAND_PROFILE: {demand_type: result["demand"][d].tolist() for d, demand_type in enumerate(DEMAND_TYPES)}}
+        for result in engine.building_results]
+    return engine.citizen_KPIs(), demand_profiles_context, engine.areas_buildings()
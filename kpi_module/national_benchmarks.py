@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-indexed table of national averages (total primary energy, energy cost and CO2 intensity) used to benchmark the
+buildings. The CSV is read once per process and indexed by (building_use_id, construction_year, country_id).
+
+The fallback chain of filter_values is kept:
+    1. full match (building_use_id, construction_year, country_id)
+    2. match without construction_year (first row of the building use and country)
+    3. match with the European country_id (31)
+    4. default values 234.87, 22, 43149.28568
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import helpers.constants as cte
+from helpers.result_cache import clear_result_caches
+
+DEFAULT_BENCHMARKS = (234.87, 22, 43149.28568)
+EUROPEAN_COUNTRY_ID = 31
+BENCHMARK_VARIABLES = ["total_primary_energy_intensity", "total_energy_cost_intensity", "total_CO2_intensity"]
+
+
+class NationalAverageBenchmarks:
+    def __init__(self, csv_path):
+        """
+        :param csv_path: path of total_primary_energy_GHG_costs_intensity.csv
+        """
+        self.csv_path = csv_path
+        self._full_match = None  # {(building_use_id, construction_year, country_id): values}
+        self._without_year = None  # {(building_use_id, country_id): values of the first row}
+        self._resolved = {}  # fallback chain already solved for a key
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._full_match is None:
+            with self._lock:
+                if self._full_match is None:
+                    self._load()
+
+    def _load(self):
+        full_match = {}
+        without_year = {}
+        try:
+            df = pd.read_csv(self.csv_path)
+        except Exception:
+            # Missing or unreadable file, every lookup returns the default values
+            df = None
+        required_columns = {cte.COUNTRY_ID, cte.BUILDING_USE_ID, cte.CONSTRUCTION_YEAR, *BENCHMARK_VARIABLES}
+        if df is not None and required_columns.issubset(df.columns):
+            values = df[BENCHMARK_VARIABLES].to_numpy(dtype=float)
+            building_use_ids = df[cte.BUILDING_USE_ID].to_numpy(dtype=float)
+            construction_years = df[cte.CONSTRUCTION_YEAR].to_numpy(dtype=float)
+            country_ids = df[cte.COUNTRY_ID].to_numpy(dtype=float)
+            for row in range(len(df)):
+                if np.isnan(building_use_ids[row]) or np.isnan(country_ids[row]):
+                    continue
+                building_use_id, country_id = int(building_use_ids[row]), int(country_ids[row])
+                row_values = tuple(values[row].tolist())
+                # setdefault keeps the first row, as [0] did on the filtered DataFrame
+                without_year.setdefault((building_use_id, country_id), row_values)
+                if not np.isnan(construction_years[row]):
+                    full_match.setdefault((building_use_id, int(construction_years[row]), country_id), row_values)
+        self._without_year = without_year
+        self._full_match = full_match
+        self._resolved = {}
+
+    def reload(self):
+        """
+        Re-reads the CSV file, the results calculated with the previous values are cleared
+        """
+        with self._lock:
+            self._load()
+        clear_result_caches()
+
+    def lookup(self, building_use_id, construction_year, country_id):
+        """
+        National averages of a building following the fallback chain
+
+        Returns
+        -------
+        total_primary_energy_intensity, total_energy_cost_intensity, total_CO2_intensity
+        """
+        # A missing key could not be filtered before either, so the default values are returned
+        if building_use_id is None or construction_year is None or country_id is None:
+            return DEFAULT_BENCHMARKS
+        key = (int(building_use_id), int(construction_year), int(country_id))
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            self._ensure_loaded()
+            building_use_id, construction_year, country_id = key
+            resolved = (self._full_match.get(key)
+                        or self._without_year.get((building_use_id, country_id))
+                        or self._without_year.get((building_use_id, EUROPEAN_COUNTRY_ID))
+                        or DEFAULT_BENCHMARKS)
+            self._resolved[key] = resolved
+        return resolved
+
+    def lookup_many(self, keys):
+        """
+        Batch lookup for a list of buildings
+
+        Parameters
+        ----------
+        keys: list of (building_use_id, construction_year, country_id)
+
+        Returns
+        -------
+        np.ndarray (n_buildings x 3) with total_primary_energy_intensity, total_energy_cost_intensity,
+        total_CO2_intensity
+        """
+        return np.array([self.lookup(*key) for key in keys], dtype=float).reshape(len(keys), 3)
+
+
+_benchmark_tables = {}
+
+
+def get_national_benchmarks(filename="total_primary_energy_GHG_costs_intensity.csv"):
+    """
+    Shared NationalAverageBenchmarks of a file of the kpi_module data folder
+    """
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", filename)
+    if csv_path not in _benchmark_tables:
+        _benchmark_tables[csv_path] = NationalAverageBenchmarks(csv_path)
+    return _benchmark_tables[csv_path]
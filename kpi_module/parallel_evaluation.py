@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Optional process pool for the per building KPI evaluation.
+
+The buildings of a community are independent, so their indicators can be calculated in worker processes. The tasks
+are sent in chunks and the results are returned in the order of the tasks, so the merged output does not depend on
+the number of workers. Every worker loads the read-only catalogues (generation systems catalogue, conversion factors,
+energy carriers and national averages) once, when it starts, and reuses them for all its chunks.
+
+If the pool cannot be used (a single core, few buildings, or the pool breaks) the tasks are evaluated serially in the
+calling process.
+"""
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Below this number of buildings the pool overhead is bigger than the gain
+MIN_PARALLEL_BUILDINGS = 32
+# Chunks per worker when the chunk size is not given, a few chunks per worker balance uneven buildings
+CHUNKS_PER_WORKER = 4
+
+_executor = None
+_executor_workers = None
+_lock = threading.Lock()
+
+
+def initialise_worker():
+    """
+    Loads the read-only catalogues once per worker process
+    """
+    from catalogue_registry import generation_systems_catalogue
+    from conversion_factors import get_conversion_factor_matrix
+    from final_energy_template import final_energy_template
+    from national_benchmarks import get_national_benchmarks
+
+    len(generation_systems_catalogue)
+    get_conversion_factor_matrix()
+    final_energy_template.carrier_ids
+    get_national_benchmarks().lookup(1, 2000, 31)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def get_executor(max_workers=None):
+    """
+    Process pool shared by the process, created on first use (and again if the number of workers changes)
+    """
+    global _executor, _executor_workers
+    max_workers = max_workers or default_workers()
+    with _lock:
+        if _executor is None or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=max_workers, initializer=initialise_worker)
+            _executor_workers = max_workers
+        return _executor
+
+
+def shutdown_executor():
+    global _executor, _executor_workers
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = None
+        _executor_workers = None
+
+
+def chunk_size_for(n_tasks, max_workers):
+    return max(1, math.ceil(n_tasks / (max_workers * CHUNKS_PER_WORKER)))
+
+
+def map_buildings(function, tasks, parallel=True, executor=None, max_workers=None, chunk_size=None):
+    """
+    Applies function to every task, in worker processes if possible
+
+    Parameters
+    ----------
+    function: top-level (picklable) function of one argument
+    tasks: list of arguments, one per building
+    parallel: False to always evaluate serially
+    executor: optional executor (e.g. a ProcessPoolExecutor created by the caller), the shared pool by default
+    max_workers: number of workers of the shared pool, number of cores by default
+    chunk_size: number of buildings sent to a worker at a time, a few chunks per worker by default
+
+    Returns
+    -------
+    List with the results in the order of the tasks
+    """
+    tasks = list(tasks)
+    max_workers = max_workers or default_workers()
+    if not parallel or (executor is None and (max_workers < 2 or len(tasks) < MIN_PARALLEL_BUILDINGS)):
+        return [function(task) for task in tasks]
+    if chunk_size is None:
+        chunk_size = chunk_size_for(len(tasks), max_workers)
+    shared = executor is None
+    try:
+        if shared:
+            executor = get_executor(max_workers)
+        # map submits all the chunks (starting the workers) and keeps the order of the tasks whatever worker finishes
+        # first
+        results = executor.map(function, tasks, chunksize=chunk_size)
+    except (BrokenProcessPool, OSError, NotImplementedError) as error:
+        # the pool cannot be created or started, e.g. no semaphores or processes allowed on the platform
+        return _serial_fallback(function, tasks, error, shared)
+    try:
+        return list(results)
+    except BrokenProcessPool as error:
+        # a worker died. Errors raised by the function itself are not caught, they would be raised again serially
+        return _serial_fallback(function, tasks, error, shared)
+
+
+def _serial_fallback(function, tasks, error, shared):
+    print(f"Process pool not available ({error}), buildings evaluated serially")
+    if shared:
+        # a caller-supplied executor is left to the caller
+        shutdown_executor()
+    return [function(task) for task in tasks]
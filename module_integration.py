@@ -1,17 +1,33 @@
+import asyncio
+import functools
+import time
 # import api.services.scripts.KPI_module as KPI_module
 from kpi_module import KPI_module as KPI_module
 # from api.services.scripts.RESbased_scenario_generator import res_based_generator_list_technologies, generate_geojson, fetch_geojson, baseline_pathway_simple, baseline_pathway_intermediate, demand_statistics, demand_thermagrid
 from scenario_generator.RESbased_scenario_generator import res_based_generator_list_technologies
 from scenario_generator.RESbased_scenario_generator import generate_geojson, fetch_geojson, baseline_pathway_simple, baseline_pathway_intermediate, demand_statistics, demand_thermagrid
-from kpi_module.key_performance_indicators import recalculate_indicators, get_indicators_from_baseline, aggregate_demand_profiles, community_KPIs
+from scenario_generator.RESbased_scenario_generator import generate_demand_inputs, get_thermagrid_client, electricity_demand_profiles
+from kpi_module.key_performance_indicators import get_indicators_from_baseline, aggregate_demand_profiles, community_KPIs
+from kpi_module.community_kpi_engine import incremental_community_KPIs
 # , generate_geojson
 # from api.services.scripts.energy_consumption import generation_system_function
 from kpi_module.energy_consumption import generation_system_function
-from scenario_generator.get_new_context import resbased_generator_context_creation
-# from data_packages.transform_structure import transform_whole_structure, reverse_whole_structure
-# from data_packages.processing import  merge_building_assets, merge_community_assets
+from scenario_generator.get_new_context import resbased_generator_context_creation, current_creation_date
+from scenario_generator.scenario_batch import evaluate_scenario_batch
+from helpers.result_cache import result_cache, request_key
+from data_packages.transform_structure import transform_whole_structure, reverse_whole_structure
+from data_packages.processing import merge_building_assets, merge_community_assets
 
-def get_new_context(goal, community_context,recommendations_dic):
+def get_new_context(goal, community_context,recommendations_dic, cache=result_cache):
+    # the same request (goal, context and recommendations, whatever the order of their keys) is answered from the
+    # result cache, cache=None to disable it
+    if cache is not None:
+        key = request_key("get_new_context", goal, community_context, recommendations_dic)
+        new_context_updated, community_indicators = cache.get_or_compute(key, get_new_context, goal, community_context,
+                                                                         recommendations_dic, cache=None)
+        # a hit is still a new context, with the date of this request and not the one of the cached result
+        new_context_updated["creation_date"] = current_creation_date()
+        return new_context_updated, community_indicators
     # front data: "goals": 2
     # backend data: community context from database
     # recommendations_dic --> selection of the user from the result of generate_resbased_generator_list_technologies(front_data)
@@ -23,26 +39,36 @@ def get_new_context(goal, community_context,recommendations_dic):
     #Transform ARTELYS Outputs
     merged_context_with_building_assets=merge_building_assets(new_context,ARTELYS_output)
     merged_context=merge_community_assets(merged_context_with_building_assets, ARTELYS_output)
-    #with new structure calculate indicators
-    citizen_KPIs_per_building, demand_profiles_context,areas_buildings=recalculate_indicators(merged_context)
-    #calculate total aggregated demand
-    total_demand = aggregate_demand_profiles(demand_profiles_context)
-    #calculate total community indicators
-    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand,areas_buildings)
+    #with new structure calculate indicators of all the buildings at once, the engine of the parent community is
+    #reused so only the buildings changed by the actions are recalculated
+    community_indicators = incremental_community_KPIs(merged_context, key=merged_context.get("context_parent"))
     # reverse node structure
     new_context_updated = transform_whole_structure(merged_context)
     return new_context_updated,community_indicators
 
-def calculate_indicators(community_context):
+def get_new_contexts(goal, community_context, recommendation_sets, **ranking):
+    # same as get_new_context for several recommendation sets (e.g. subsets of the technologies of
+    # generate_resbased_generator_list_technologies), the weather, the actions table and the baseline buildings are
+    # shared by all the scenarios. ranking: rank_by (KPI name) and ascending
+    community_context_updated = reverse_whole_structure(community_context)
+    ranked_table, scenarios = evaluate_scenario_batch(goal, community_context_updated, recommendation_sets, **ranking)
+    #ARTELYS is not called yet, its merge would not change the contexts
+    new_contexts = [(transform_whole_structure(new_context), community_indicators)
+                    for new_context, community_indicators in scenarios]
+    return ranked_table, new_contexts
+
+def calculate_indicators(community_context, cache=result_cache):
+    # an identical context (e.g. submitted again by the front on a refresh) is answered from the result cache,
+    # cache=None to disable it
+    if cache is not None:
+        key = request_key("calculate_indicators", community_context)
+        return cache.get_or_compute(key, calculate_indicators, community_context, cache=None)
     #adapt structure
     community_context_updated=reverse_whole_structure(community_context)
-    #with new structure calculate indicators
-    citizen_KPIs_per_building, demand_profiles_context,areas_buildings=recalculate_indicators(community_context_updated)
-    #calculate total aggregated demand
-    total_demand = aggregate_demand_profiles(demand_profiles_context)
-    #calculate total community indicators
-    community_indicators = community_KPIs(citizen_KPIs_per_building, total_demand,areas_buildings)
-    #devolver más adelante citizen_KPIs_per_building
+    #with new structure calculate indicators of all the buildings at once (buildings already evaluated are cached)
+    community_indicators = incremental_community_KPIs(community_context_updated,
+                                                      key=community_context_updated.get("id"))
+    #devolver más adelante kpi_engine.citizen_KPIs()
     return community_indicators
 
 def generate_resbased_generator_list_technologies(front_data):
@@ -62,7 +88,7 @@ def generate_baseline_pathway_intermediate(data, front_data):
     #create baseline object
     baseline = baseline_pathway_intermediate(data=data, front_data=front_data, geojson_file=geojson_file, demand_profile=demand_profile, building_consumption_dict=building_consumption_dict )
     #calculate kpis per building
-    citizen_KPIs_per_building,areas_buildings = get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile)
+    citizen_KPIs_per_building,areas_buildings = get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile, parallel=True)
     #calculate total aggregated demand
     total_demand = aggregate_demand_profiles(demand_profile)
     #calculate total community indicators
@@ -70,6 +96,63 @@ def generate_baseline_pathway_intermediate(data, front_data):
     #devolver más adelante citizen_KPIs_per_building,
     return baseline,  community_indicators
 
+async def _run_stage(timings, origin, name, stage_executor, function, /, *args, **kwargs):
+    # runs a blocking stage in stage_executor (None: default thread pool of the loop) and records its start and end,
+    # in seconds since origin
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    result = await loop.run_in_executor(stage_executor, functools.partial(function, *args, **kwargs))
+    end = time.perf_counter()
+    timings[name] = {"start": start - origin, "end": end - origin, "duration": end - start}
+    return result
+
+async def generate_baseline_pathway_intermediate_async(data, front_data, executor=None, client=None, timings=None):
+    # same result as generate_baseline_pathway_intermediate with the independent stages overlapped:
+    #   - weather (PVGIS TMY and façade irradiance) -> ThermaGrid: one after the other, the weather is an input of
+    #     ThermaGrid
+    #   - LPG electricity profiles: they only need front_data, so they are loaded while the weather and ThermaGrid
+    #     are waited for
+    # the waits run in the default thread pool. The CPU stages (consumption, baseline, aggregation and community KPIs)
+    # run in executor (e.g. a ProcessPoolExecutor, the default thread pool if None) and the KPIs of the buildings are
+    # sent to it by get_indicators_from_baseline (its shared process pool if None)
+    # client: ThermaGridClient (e.g. of the local stub), the shared one by default
+    # timings: optional dict filled with the start, end and duration (s) of every stage and the total
+    timings = {} if timings is None else timings
+    origin = time.perf_counter()
+    if client is None:
+        client = get_thermagrid_client()
+
+    async def thermagrid_demands():
+        geojson_object = await _run_stage(timings, origin, "geojson", None, generate_geojson, front_data=front_data)
+        inputs_thermagrid = await _run_stage(timings, origin, "weather", None, generate_demand_inputs,
+                                             geojson_object=geojson_object)
+        geojson_file = await _run_stage(timings, origin, "thermagrid", None, client.fetch, inputs_thermagrid)
+        return geojson_file
+
+    geojson_file, electricity_profiles = await asyncio.gather(
+        thermagrid_demands(),
+        _run_stage(timings, origin, "lpg_profiles", None, electricity_demand_profiles, front_data))
+    demand_profile = await _run_stage(timings, origin, "demand_profile", None, demand_thermagrid, data=data,
+                                      front_data=front_data, geojson_file=geojson_file,
+                                      electricity_profiles=electricity_profiles)
+    #calculate energy consumption based on the technology
+    building_consumption_dict = await _run_stage(timings, origin, "consumption", executor, generation_system_function,
+                                                 data=data, front_data=front_data, demand_profile=demand_profile)
+    #baseline object, kpis per building and total aggregated demand only depend on the consumption
+    baseline, (citizen_KPIs_per_building, areas_buildings), total_demand = await asyncio.gather(
+        _run_stage(timings, origin, "baseline", executor, baseline_pathway_intermediate, data=data,
+                   front_data=front_data, geojson_file=geojson_file, demand_profile=demand_profile,
+                   building_consumption_dict=building_consumption_dict),
+        _run_stage(timings, origin, "building_kpis", None, get_indicators_from_baseline, front_data, data,
+                   building_consumption_dict, demand_profile, parallel=True, executor=executor),
+        _run_stage(timings, origin, "total_demand", executor, aggregate_demand_profiles, demand_profile))
+    #calculate total community indicators
+    community_indicators = await _run_stage(timings, origin, "community_kpis", executor, community_KPIs,
+                                            citizen_KPIs_per_building, total_demand, areas_buildings)
+    total = time.perf_counter() - origin
+    timings["total"] = {"start": 0.0, "end": total, "duration": total}
+    return baseline,  community_indicators
+
 def generate_baseline_pathway_simple(data, front_data):
     #calculate electricity and heat demand
     demand_profile=demand_statistics(data=data, front_data=front_data)
@@ -80,7 +163,7 @@ def generate_baseline_pathway_simple(data, front_data):
     #calculate kpis
     #kpis_community = inner_perform_kpis(data=data, front_data=front_data, building_consumption_dict=building_consumption_dict, demand_profile=demand_profile)
     #calculate kpis per building
-    citizen_KPIs_per_building,areas_buildings = get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile)
+    citizen_KPIs_per_building,areas_buildings = get_indicators_from_baseline(front_data, data, building_consumption_dict, demand_profile, parallel=True)
     #calculate total aggregated demand
     total_demand = aggregate_demand_profiles(demand_profile)
     #calculate total community indicators
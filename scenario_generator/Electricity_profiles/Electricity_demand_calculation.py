@@ -28,7 +28,6 @@ import json
 import pandas as pd
 import numpy as np
 import os
-import random
 
 # Function to compare the UI usuario answer and those from LPG in the case of no exact match
 def are_dicts_similar(dict1, dict2, threshold):
@@ -53,6 +52,199 @@ def are_dicts_similar(dict1, dict2, threshold):
     return common_elements >= threshold
 
 
+HOURS_IN_YEAR = 8760
+CONSUMPTION_COLUMN = 'Consumption [kWh]'
+# Minimum number of equal characteristics of a similar household (see are_dicts_similar)
+SIMILARITY_THRESHOLD = 4
+# Optional path of the compiled store (matrix in a .npy file memory-mapped, index in a .json file)
+COMPILED_STORE_ENV = "ENPOWER_LPG_PROFILE_STORE"
+# Values of the characteristics missing in the UI answer or in the household, they never match
+_MISSING_ANSWER = object()
+_MISSING_HOUSEHOLD = object()
+
+
+def household_characteristics(household):
+    """
+    Characteristics of a household ({"usuario": {...}} as in the JSON files and the UI answer, or the inner dictionary)
+    """
+    if isinstance(household, dict) and isinstance(household.get("usuario"), dict):
+        return household["usuario"]
+    return household
+
+
+class LPGProfileStore:
+    def __init__(self, names, households, matrix, source_times=None):
+        """
+        Electricity profiles of the LPG households, loaded once in a (profiles x 8760) matrix. The profiles are
+        served as read-only views of the matrix:
+        - exact: the household with the same characteristics as the answer (dictionary lookup)
+        - nearest: the household with the same number of family members and most characteristics in common (at least
+        SIMILARITY_THRESHOLD, as are_dicts_similar), compared for all the households at once
+        - average: mean of all the profiles, calculated once
+        :param names: name of each profile (CHR01...), one per row of the matrix
+        :param households: {name: characteristics} of the households with a profile
+        :param matrix: (profiles x hours) array, e.g. memory-mapped
+        :param source_times: modification times of the source files, to know if a compiled store is up to date
+        """
+        self.names = list(names)
+        self.matrix = matrix
+        if isinstance(self.matrix, np.ndarray) and not isinstance(self.matrix, np.memmap):
+            self.matrix.flags.writeable = False
+        self.source_times = source_times or {}
+        self.row = {name: i for i, name in enumerate(self.names)}
+        self.households = {name: household_characteristics(household) for name, household in households.items()
+                           if name in self.row}
+        self.household_names = sorted(self.households)
+        self.fields = sorted({field for household in self.households.values() for field in household})
+        # characteristics of all the households as a (households x fields) table, to compare them in one step
+        self.characteristics = np.array([[self.households[name].get(field, _MISSING_HOUSEHOLD)
+                                          for field in self.fields] for name in self.household_names],
+                                        dtype=object).reshape(len(self.household_names), len(self.fields))
+        self.signatures = {}
+        for name in self.household_names:
+            self.signatures.setdefault(self.signature(self.households[name]), name)
+        self._average = None
+        self._matches = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def signature(self, household):
+        """
+        Hashable key of the characteristics of a household
+        """
+        household = household_characteristics(household)
+        return tuple(sorted((field, value) for field, value in household.items()))
+
+    @classmethod
+    def from_folders(cls, ruta_jsons, ruta_csvs):
+        """
+        Reads the JSON files of the households and the CSV files of their profiles
+        """
+        households = {}
+        for json_file in sorted(archivo for archivo in os.listdir(ruta_jsons) if archivo.endswith('.json')):
+            with open(os.path.join(ruta_jsons, json_file)) as file:
+                households[os.path.splitext(json_file)[0]] = json.load(file)
+        names = []
+        profiles = []
+        for csv_file in sorted(archivo for archivo in os.listdir(ruta_csvs) if archivo.endswith('.csv')):
+            demanda = pd.read_csv(os.path.join(ruta_csvs, csv_file), usecols=[CONSUMPTION_COLUMN])
+            names.append(os.path.splitext(csv_file)[0])
+            profiles.append(demanda[CONSUMPTION_COLUMN].to_numpy(dtype=float))
+        matrix = np.vstack(profiles) if profiles else np.zeros((0, HOURS_IN_YEAR))
+        return cls(names, households, matrix, source_times(ruta_jsons, ruta_csvs))
+
+    def save(self, path):
+        """
+        Compiles the store into path.npy (the matrix) and path.json (names, households and source times)
+        """
+        np.save(f"{path}.npy", np.asarray(self.matrix))
+        with open(f"{path}.json", "w") as file:
+            json.dump({"names": self.names, "households": self.households, "source_times": self.source_times}, file)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Store compiled by save, the matrix is memory-mapped (read-only) by default
+        """
+        with open(f"{path}.json") as file:
+            index = json.load(file)
+        matrix = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        return cls(index["names"], index["households"], matrix, index["source_times"])
+
+    def exact(self, answer):
+        """
+        Name of the household with the same characteristics as the answer, None if there is none
+        """
+        return self.signatures.get(self.signature(answer))
+
+    def nearest(self, answer, threshold=SIMILARITY_THRESHOLD):
+        """
+        Name of the household with the same number of family members and most characteristics in common with the
+        answer (at least threshold), None if there is none. Ties go to the first household by name
+        """
+        answer = household_characteristics(answer)
+        if not self.household_names:
+            return None
+        values = np.array([answer.get(field, _MISSING_ANSWER) for field in self.fields], dtype=object)
+        common = (self.characteristics == values).sum(axis=1)
+        if "number_of_family_members" in self.fields:
+            members = self.characteristics[:, self.fields.index("number_of_family_members")]
+            common = np.where(members == answer.get("number_of_family_members", _MISSING_ANSWER), common, -1)
+        best = int(np.argmax(common))
+        return self.household_names[best] if common[best] >= threshold else None
+
+    def average(self):
+        if self._average is None:
+            average = np.asarray(self.matrix).mean(axis=0)
+            average.flags.writeable = False
+            self._average = average
+        return self._average
+
+    def match(self, answer):
+        """
+        ("exact" | "nearest" | "average", name of the household or None), memoised per answer
+        """
+        key = self.signature(answer)
+        if key not in self._matches:
+            name = self.exact(answer)
+            if name is not None:
+                self._matches[key] = ("exact", name)
+            else:
+                name = self.nearest(answer)
+                self._matches[key] = ("nearest", name) if name is not None else ("average", None)
+        return self._matches[key]
+
+    def profile(self, answer):
+        """
+        Profile of the answer as a read-only view: exact match, else nearest household, else average of all
+        """
+        kind, name = self.match(answer)
+        if name is None:
+            return self.average()
+        return self.matrix[self.row[name]]
+
+
+def source_times(ruta_jsons, ruta_csvs):
+    return {os.path.join(folder, archivo): os.stat(os.path.join(folder, archivo)).st_mtime_ns
+            for folder, extension in ((ruta_jsons, '.json'), (ruta_csvs, '.csv'))
+            for archivo in sorted(os.listdir(folder)) if archivo.endswith(extension)}
+
+
+_profile_stores = {}
+
+
+def get_profile_store(ruta_jsons, ruta_csvs, compiled_path=None):
+    """
+    LPGProfileStore of the folders, loaded once per process. With compiled_path (or the ENPOWER_LPG_PROFILE_STORE
+    environment variable) the store is memory-mapped from the compiled files, which are compiled again if the source
+    files changed
+    """
+    key = (os.path.abspath(ruta_jsons), os.path.abspath(ruta_csvs))
+    if key not in _profile_stores:
+        compiled_path = compiled_path or os.environ.get(COMPILED_STORE_ENV)
+        store = None
+        if compiled_path:
+            if os.path.exists(f"{compiled_path}.npy") and os.path.exists(f"{compiled_path}.json"):
+                store = LPGProfileStore.load(compiled_path)
+                if store.source_times != source_times(ruta_jsons, ruta_csvs):
+                    store = None
+            if store is None:
+                LPGProfileStore.from_folders(ruta_jsons, ruta_csvs).save(compiled_path)
+                store = LPGProfileStore.load(compiled_path)
+        else:
+            store = LPGProfileStore.from_folders(ruta_jsons, ruta_csvs)
+        _profile_stores[key] = store
+    return _profile_stores[key]
+
+
+def reload_profile_stores():
+    """
+    Forgets the loaded stores, e.g. after adding LPG households (they are loaded again on the next call)
+    """
+    _profile_stores.clear()
+
+
 def lpg_electricity_profile_generator(ruta_jsons, ruta_csvs, answer):
     '''
     This function generates an electricity consumption profile based on user input and available data.
@@ -68,58 +260,16 @@ def lpg_electricity_profile_generator(ruta_jsons, ruta_csvs, answer):
 
     Returns
     -------
-    np.array
-        An array representing the electricity consumption profile.
+    pd.Series
+        The electricity consumption profile ('Consumption [kWh]', read-only values).
 
     Notes
     -----
-    This function attempts to match the user input with available household specifications and assigns the corresponding electricity consumption profile.
-    If no exact match is found, it offers three options:
-    1. Assign a random profile from available data.
-    2. Assign the closest matching profile.
-    3. Assign the average of all available profiles.
+    The households and profiles are read once per process (see LPGProfileStore and get_profile_store).
+    The answer is matched with the household specifications:
+    1. The household with the same characteristics.
+    2. If there is none, the closest matching household (same number of family members, see are_dicts_similar).
+    3. If there is none, the average of all available profiles.
     '''
-    usuarios = {}
-    demandas = {}
-
-    json_files = [archivo for archivo in os.listdir(ruta_jsons) if archivo.endswith('.json')]
-    csv_files = [archivo for archivo in os.listdir(ruta_csvs) if archivo.endswith('.csv')]
-    
-    # Storing all the households in a proper dictionary
-    for json_file in json_files:
-        with open(os.path.join(ruta_jsons,json_file)) as file:
-            usuario = json.load(file)                    #.json of a specific household
-            json_name = os.path.splitext(json_file)[0]   #.json file name without the extension
-            usuarios[json_name] = usuario                # Dictionary containing all the types of households (The key is CHR_)
-    
-    # Storing all the Electricity Consumption Profiles in a dictionary of dataframes in which the access key is the household ID
-    for csv_file in csv_files:
-        demanda = pd.read_csv(os.path.join(ruta_csvs, csv_file))
-        csv_name = os.path.splitext(csv_file)[0]
-        demandas[csv_name] = demanda
-    
-
-    profile = np.zeros(8760)
-    n = 0
-    
-    for key1,value1 in usuarios.items():
-        for key2,value2 in demandas.items():
-            if key1 == answer:
-                profile = demandas[key2]['Consumption [kWh]']
-                
-    if profile.sum() == 0:  # This means the assignment did not work as no available usuario matches the answer from the UI
-            #Option1 - Random profile
-            profile = random.choice(list(demandas.values()))['Consumption [kWh]']
-            
-            #Option2 - Similar profile
-            for key1,value1 in usuarios.items():
-                if are_dicts_similar(answer,value1,4) and value1["number_of_family_members"] == answer["number_of_family_members"]:
-                    profile = demandas[key1]
-                
-            #Option3 - Average of all profiles
-            for key in demandas:
-                profile = profile + demandas[key]['Consumption [kWh]']
-                n = n+1
-            profile = profile/n
-            
-    return profile    
\ No newline at end of file
+    profile = get_profile_store(ruta_jsons, ruta_csvs).profile(answer)
+    return pd.Series(profile, name=CONSUMPTION_COLUMN)
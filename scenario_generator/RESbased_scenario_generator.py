@@ -33,17 +33,16 @@ import os
 from pathlib import Path
 import pandas as pd
 import json
-import requests
 import geopandas as gpd
-from shapely import wkt
-from shapely.geometry import shape
-from shapely.ops import unary_union 
-import pvlib 
-from pvlib.location import Location
+from helpers.geometry import get_geometry_layer
 #
 # from api.constants import SRID, THERMAGRID_API_KEY, THERMAGRID_API_URL
 from Electricity_profiles import Electricity_demand_calculation as el
-from country_RES_library import  country_res_recommendations
+import copy
+import threading
+from country_RES_library import  country_res_recommendations, load_country_scenarios
+from thermagrid_client import ThermaGridClient
+from irradiance_service import irradiance_service, FACADE_TILT
 
 building_use_mapping = {
         1: "residential",  # residential
@@ -93,28 +92,63 @@ def res_based_generator_list_technologies(inputs_users):
     #read inputs from users
     user_objective=inputs_users['goals']
     country_code=inputs_users['country']
-    #translate to string
-    goals = {
-        "1": "Higher rate of renewable energy",
-        "2": "Higher efficiency",
-        "3": "Energy self-sufficiency",
-        "4": "Decarbonisation of H&C",
-        "5": "Electrification",
-        "6": "E-mobility",
-        "7": "Otra cosa,No estoy seguro"
-    }
+    # the recommendations only depend on the goal and the country, they are calculated once (see RecommendationTable)
+    return recommendation_table.recommendations(user_objective, country_code)
+
+
+#translate to string
+GOALS = {
+    "1": "Higher rate of renewable energy",
+    "2": "Higher efficiency",
+    "3": "Energy self-sufficiency",
+    "4": "Decarbonisation of H&C",
+    "5": "Electrification",
+    "6": "E-mobility",
+    "7": "Otra cosa,No estoy seguro"
+}
+ACTION_NAMES = {
+    1:'reduction_of_demand',
+    2:'demand_response',
+    3:'solar_fleet',
+    4: 'wind_fleet',
+    5: 'solar_thermal',
+    6: 'biomass_boiler',
+    7: 'heat_pump',
+    8: 'biomass_chp',
+    9: 'battery_storage',
+    10: 'heat_storage',
+    11: 'creation_of_dhn',
+    12: 'charging_station'
+}
+RES_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),'data', 'RESlibrary')
+RES_LIBRARY_FILES = ('country_scenarios_recommended.json', 'country_vs_actions.json', 'goals_vs_actions.json',
+                     'action_keys.csv')
+
+
+def calculate_recommendations(user_objective, country_code, library):
+    """
+    MCDA of res_based_generator_list_technologies for one goal and country
+
+    Parameters
+    ----------
+    user_objective : goal, e.g. "3"
+    country_code : e.g. "AT"
+    library : RES library files already loaded (see RecommendationTable.load)
+
+    Returns
+    -------
+    output_dictionary : see res_based_generator_list_technologies
+    """
     goal_numeric_value=float(user_objective)
-    user_objective = goals[str(user_objective)]
+    user_objective = GOALS[str(user_objective)]
     #create country object and obtain recommended scenarios for the country selected
-    country_properties= country_res_recommendations(country_code=country_code)
-    #read the tables Country_VS_Actions and Goals_VS_Actions to make the MCDA analysis
-    directory_path =os.path.join(os.path.dirname(os.path.abspath(__file__)),'data', 'RESlibrary')
-    json_file_path_country_vs_actions_df=os.path.join(directory_path,'country_vs_actions.json')
-    json_file_path_goals_vs_actions_df=os.path.join(directory_path,'goals_vs_actions.json')
+    country_properties= country_res_recommendations(country_code=country_code,
+                                                    country_scenarios=library['country_scenarios_recommended.json'])
+    #the tables Country_VS_Actions and Goals_VS_Actions to make the MCDA analysis
     #obtain w2
-    w2_df=calculate_action_values (goal_numeric_value, country_properties,json_file_path_country_vs_actions_df)
+    w2_df=calculate_action_values (goal_numeric_value, country_properties, library['country_vs_actions.json'])
     # obtain w1
-    goals_vs_actions_df_filtered = get_goal_values(user_objective, json_file_path_goals_vs_actions_df)
+    goals_vs_actions_df_filtered = get_goal_values(user_objective, library['goals_vs_actions.json'])
     if goal_numeric_value != 7:
         #obtain wT
         wT=  goals_vs_actions_df_filtered.iloc[:, 1:]
@@ -129,32 +163,104 @@ def res_based_generator_list_technologies(inputs_users):
         list_technologies=top_values(wT_final)
 
     list_technologies=list_technologies.reset_index()
-    data = {
-        1:'reduction_of_demand',
-        2:'demand_response',
-        3:'solar_fleet',
-        4: 'wind_fleet',
-        5: 'solar_thermal',
-        6: 'biomass_boiler',
-        7: 'heat_pump',
-        8: 'biomass_chp',
-        9: 'battery_storage',
-        10: 'heat_storage',
-        11: 'creation_of_dhn',
-        12: 'charging_station'
-    }
     #translate into a useful json
     output_dictionary = {}
     for idx, row in list_technologies.iterrows():
         id_ = row['index'] + 1  # Increment by 1 to do match with the previous dictionary
-        action_name = data[id_]
+        action_name = ACTION_NAMES[id_]
         output_dictionary[idx] = {'id': id_, 'action_name': action_name}
-    actions_keys_csv_file_path=os.path.join(directory_path, 'action_keys.csv')
-    action_keys = pd.read_csv(actions_keys_csv_file_path)
-    output_dictionary_matched=match_actions(action_keys, output_dictionary)
+    output_dictionary_matched=match_actions(library['action_keys.csv'], output_dictionary)
     return output_dictionary_matched
 
 
+class RecommendationTable:
+    def __init__(self, directory_path=RES_LIBRARY_PATH):
+        """
+        Recommendations of res_based_generator_list_technologies per (goal, country). The RES library files are read
+        once and every combination is calculated the first time it is asked (or all of them with precompute), the
+        following requests are a dictionary lookup. The table is reloaded if the files of the library change
+        :param directory_path: folder of the RES library
+        """
+        self.directory_path = directory_path
+        self.library = None
+        self.file_times = None
+        self.table = {}
+        self._lock = threading.RLock()
+
+    def _file_times(self):
+        return tuple(os.stat(os.path.join(self.directory_path, file_name)).st_mtime_ns
+                     for file_name in RES_LIBRARY_FILES)
+
+    def load(self):
+        """
+        Reads the RES library files and empties the table
+        """
+        with self._lock:
+            file_times = self._file_times()
+            library = {}
+            for file_name in RES_LIBRARY_FILES:
+                file_path = os.path.join(self.directory_path, file_name)
+                if file_name.endswith('.csv'):
+                    library[file_name] = pd.read_csv(file_path, encoding='utf-8-sig')
+                elif file_name == 'country_scenarios_recommended.json':
+                    library[file_name] = load_country_scenarios(file_path)
+                else:
+                    with open(file_path, 'r') as file:
+                        library[file_name] = json.load(file)
+            self.library = library
+            self.file_times = file_times
+            self.table = {}
+
+    def reload(self):
+        """
+        Reload hook, e.g. after the RES library files were updated
+        """
+        self.load()
+
+    def reload_if_changed(self):
+        with self._lock:
+            if self.library is None or self._file_times() != self.file_times:
+                self.load()
+
+    def countries(self):
+        self.reload_if_changed()
+        return [entry['Country'] for entry in self.library['country_scenarios_recommended.json']]
+
+    def recommendations(self, user_objective, country_code):
+        """
+        Recommended actions for a goal and a country (a copy, it can be modified by the caller)
+        """
+        self.reload_if_changed()
+        key = (str(user_objective), country_code)
+        with self._lock:
+            if key not in self.table:
+                self.table[key] = calculate_recommendations(user_objective, country_code, self.library)
+            return copy.deepcopy(self.table[key])
+
+    def precompute(self):
+        """
+        Calculates the recommendations of all the goals and countries of the library, e.g. at startup
+        """
+        for country_code in self.countries():
+            for user_objective in GOALS:
+                try:
+                    self.recommendations(user_objective, country_code)
+                except (ValueError, SyntaxError, KeyError, AttributeError, TypeError) as e:
+                    # entries of the library that are not countries (e.g. the sources)
+                    print(f"No recommendations for goal {user_objective} and country {country_code}: {e!r}")
+        return len(self.table)
+
+
+recommendation_table = RecommendationTable()
+
+
+def reload_recommendation_table():
+    """
+    Reloads the RES library files (the recommendations are calculated again when they are asked)
+    """
+    recommendation_table.reload()
+
+
 # Define a function to match action names with the data dictionary
 def match_actions(action_keys, data):
     matched_actions = {}
@@ -176,9 +282,12 @@ def match_actions(action_keys, data):
 
 
 def calculate_action_values(goal_numeric_value,country_properties,json_file_path_country_vs_actions_df):
-    # Load the JSON file
-    with open(json_file_path_country_vs_actions_df, 'r') as file:
-        country_vs_actions_data = json.load(file)
+    # Load the JSON file (or use its content, already loaded by RecommendationTable)
+    if isinstance(json_file_path_country_vs_actions_df, (str, os.PathLike)):
+        with open(json_file_path_country_vs_actions_df, 'r') as file:
+            country_vs_actions_data = json.load(file)
+    else:
+        country_vs_actions_data = json_file_path_country_vs_actions_df
 
     # Prepare a list to store the results
     results_list = []
@@ -245,9 +354,12 @@ def goal_vs_country(goal_numeric_value):
 
 
 def get_goal_values(goal_name, json_file_path_goals_vs_actions_df):
-    # Load the JSON file
-    with open(json_file_path_goals_vs_actions_df, 'r') as file:
-        data = json.load(file)
+    # Load the JSON file (or use its content, already loaded by RecommendationTable)
+    if isinstance(json_file_path_goals_vs_actions_df, (str, os.PathLike)):
+        with open(json_file_path_goals_vs_actions_df, 'r') as file:
+            data = json.load(file)
+    else:
+        data = json_file_path_goals_vs_actions_df
 
     # Iterate over each entry to collect the values for the specified goal
     goal_values = {}
@@ -503,10 +615,11 @@ def calculate_areas(geojson_file):
     areas = {}
     heights = {}
     community_demand = []
+    # geometries parsed once, shared with the other stages (see helpers.geometry)
+    feature_areas = get_geometry_layer([feature['geometry'] for feature in geojson_file['features']]).areas()
     
     for i, feature in enumerate(geojson_file['features']):
-        geom = shape(feature['geometry'])
-        area = geom.area
+        area = float(feature_areas[i])
         height = feature['properties']['height']
         building_demand = {
             'id': feature['id'],
@@ -615,71 +728,59 @@ def baseline_pathway_intermediate(data, front_data, geojson_file, demand_profile
 ###############################################
 '''
 
-def fetch_geojson(geojson_object):
+_thermagrid_client = None
+_thermagrid_client_lock = threading.Lock()
+
+
+def get_thermagrid_client():
+    """
+    ThermaGrid client shared by the requests of the process (one pooled session)
+    """
+    global _thermagrid_client
+    with _thermagrid_client_lock:
+        if _thermagrid_client is None:
+            _thermagrid_client = ThermaGridClient(THERMAGRID_API_URL, str(THERMAGRID_API_KEY))
+        return _thermagrid_client
+
+
+def fetch_geojson(geojson_object, client=None):
     """
     Fetches a GeoJSON file from the API.
+    The buildings are sent in chunks, concurrently, with timeouts and retries (see thermagrid_client.py)
 
     Parameters:
-    api_url (str): The URL of the API endpoint.
-    payload (dict): The data to send in the POST request.
+    geojson_object (dict): GeoJSON of the buildings (output of generate_geojson).
+    client (ThermaGridClient): optional, e.g. pointing to the local stub (thermagrid_stub.py), the shared client
+    of THERMAGRID_API_URL by default.
 
     Returns:
-    dict: The GeoJSON object received from the API.
+    dict: The GeoJSON object received from the API, with the buildings in the order of geojson_object.
     """
-    api_url = THERMAGRID_API_URL
-    
     inputs_thermagrid = generate_demand_inputs(geojson_object=geojson_object)
-    api_key = str(THERMAGRID_API_KEY)
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': api_key
-    }
-
-    params_json = json.dumps(inputs_thermagrid, indent=2)
-    #response = requests.post(api_url, json=params_json, data=api_key)
-    response = requests.post(api_url, data=params_json, headers=headers, timeout=None)
-    if response.status_code == 200:
-        print("response 200 OK")
-        geojson_file = response.json()
-        return geojson_file
-    else:
-        response.raise_for_status()
-        print("Error in response request")
+    if client is None:
+        client = get_thermagrid_client()
+    geojson_file = client.fetch(inputs_thermagrid)
+    print("response 200 OK")
+    return geojson_file
 
-def demand_thermagrid(data, front_data, geojson_file):
+def electricity_demand_profiles(front_data):
     """
-    Reads demand data from a file and generates a demand profile for each user profile in the list.
+    Hourly electricity demand of every building of front_data, from the LPG profile of its occupants.
+    It does not depend on the ThermaGrid demands, so it can be calculated while ThermaGrid is called
 
     Parameters:
-    data (dict): Dictionary containing the API request payload.
     front_data (list): List of dictionaries containing user profile data.
 
     Returns:
-    list: List of generated demand profiles.
+    list: Electricity demand list of every building, in the order of front_data.
     """
-    # api_url = 'http://teide:8101/calculate_demand_demand_post'  # Asegúrate de usar la URL correcta del endpoint de la API
-    areas, heights, community_demand = calculate_areas(geojson_file=geojson_file)
-    # areas = {}
-    # heights = {}
-    # community_demand = []
+    # Generate electricity profile
+    route_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Electricity_profiles")
+
+    route_jsons = os.path.join(route_base, "Unique_Usuarios")
+    route_csvs = os.path.join(route_base, "Electricity_Profiles_LPG_Hourly")
+    electricity_profiles = []
 
-    # for i, feature in enumerate(geojson_file['features']):
-    #     geom = shape(feature['geometry'])
-    #     area = geom.area
-    #     height = feature['properties']['height']
-    #     building_demand = {
-    #         'id': feature['id'],
-    #         'heating': feature['properties'].get('heating', 0),
-    #         'cooling': feature['properties'].get('cooling', 0),
-    #         'dhw': feature['properties'].get('dhw', 0)
-    #     }
-    #     areas[i] = area
-    #     heights[i] = height
-    #     community_demand.append(building_demand)
-    
-    demand_profiles = []
-    buildings_id = 0
-    
     for buildings in front_data:
         common_profile = buildings["common_profile_id"]
         occupants = buildings["occupants"]
@@ -742,15 +843,52 @@ def demand_thermagrid(data, front_data, geojson_file):
                 }
             }
 
-        # Generate electricity profile
-        route_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Electricity_profiles")
-
-        route_jsons = os.path.join(route_base, "Unique_Usuarios")
-        route_csvs = os.path.join(route_base, "Electricity_Profiles_LPG_Hourly")
         profile = el.lpg_electricity_profile_generator(ruta_jsons=route_jsons, ruta_csvs=route_csvs, answer=answer)
         electricity_profile_df = profile.to_frame(name='electricity_demand')
-        electricity_profile = electricity_profile_df['electricity_demand'].tolist()
-        
+        electricity_profiles.append(electricity_profile_df['electricity_demand'].tolist())
+
+    return electricity_profiles
+
+
+def demand_thermagrid(data, front_data, geojson_file, electricity_profiles=None):
+    """
+    Reads demand data from a file and generates a demand profile for each user profile in the list.
+
+    Parameters:
+    data (dict): Dictionary containing the API request payload.
+    front_data (list): List of dictionaries containing user profile data.
+    electricity_profiles (list): optional electricity demand of the buildings (output of
+    electricity_demand_profiles), calculated here if not given.
+
+    Returns:
+    list: List of generated demand profiles.
+    """
+    # api_url = 'http://teide:8101/calculate_demand_demand_post'  # Asegúrate de usar la URL correcta del endpoint de la API
+    areas, heights, community_demand = calculate_areas(geojson_file=geojson_file)
+    # areas = {}
+    # heights = {}
+    # community_demand = []
+
+    # for i, feature in enumerate(geojson_file['features']):
+    #     geom = shape(feature['geometry'])
+    #     area = geom.area
+    #     height = feature['properties']['height']
+    #     building_demand = {
+    #         'id': feature['id'],
+    #         'heating': feature['properties'].get('heating', 0),
+    #         'cooling': feature['properties'].get('cooling', 0),
+    #         'dhw': feature['properties'].get('dhw', 0)
+    #     }
+    #     areas[i] = area
+    #     heights[i] = height
+    #     community_demand.append(building_demand)
+    
+    if electricity_profiles is None:
+        electricity_profiles = electricity_demand_profiles(front_data)
+    demand_profiles = []
+    buildings_id = 0
+    
+    for electricity_profile in electricity_profiles:
         demand_profile = {
             "demand_profile": {
                 "id": community_demand[buildings_id]['id'],  # Use the ID from community_demand
@@ -785,9 +923,8 @@ def generate_demand_inputs(geojson_object):
     URL = 'https://re.jrc.ec.europa.eu/api/v5_2/'
 
     # Calculate the centroid of the provided multipolygons
-    multipolygons = [shape(feature['geometry']) for feature in geojson_object['features']]
-    union_multipolygon = unary_union(multipolygons)
-    centroid = union_multipolygon.centroid
+    layer = get_geometry_layer([feature['geometry'] for feature in geojson_object['features']])
+    centroid = layer.community_centroid
     longitude, latitude = centroid.x, centroid.y
     
     #------------------------------------------------------
@@ -802,9 +939,9 @@ def generate_demand_inputs(geojson_object):
     print(f"latitude: {latitude}")
     print(f"longitude: {longitude}")
 
-    # Call PVGIS API (with pvlib) to get TMY data
-    tmy_data, months_selected, inputs, meta = pvlib.iotools.get_pvgis_tmy(
-        latitude, longitude, map_variables=False, url=URL)
+    # Get TMY data from PVGIS, downloaded once per location (see irradiance_service.py)
+    tmy_data, months_selected, inputs, meta = irradiance_service.tmy(latitude, longitude, url=URL)
+    tmy_data = tmy_data.copy()
 
     # Ensure 'tmy_data' index is in datetime format
     tmy_data.index = pd.to_datetime(tmy_data.index)
@@ -812,21 +949,6 @@ def generate_demand_inputs(geojson_object):
     # Define the location using 'inputs' data
     latitude = inputs['location']['latitude']
     longitude = inputs['location']['longitude']
-    site = Location(latitude, longitude)  # Use Location class directly
-
-    # Get solar data
-    solar_position = site.get_solarposition(times=tmy_data.index)
-
-    # Define orientations of vertical surfaces
-    orientations = {
-        'rad_n': 0,
-        'rad_s': 180,
-        'rad_e': 90,
-        'rad_o': 270  # 'rad_o' changed to 'rad_w' for clarity
-    }
-
-    # Tilt angle (90 degrees for vertical surfaces)
-    tilt_angle = 90
 
     # Create the output dictionary (json)
     inputs_thermagrid = {
@@ -834,18 +956,9 @@ def generate_demand_inputs(geojson_object):
         "temperature": tmy_data['T2m'].tolist()  # Temperature list
     }
 
-    for orientation_name, azimuth_angle in orientations.items():
-        irradiance = pvlib.irradiance.get_total_irradiance(
-            surface_tilt=tilt_angle,
-            surface_azimuth=azimuth_angle,
-            solar_zenith=solar_position['apparent_zenith'],
-            solar_azimuth=solar_position['azimuth'],
-            dni=tmy_data['Gb(n)'],
-            ghi=tmy_data['G(h)'],
-            dhi=tmy_data['Gd(h)'],
-        )
-        
-        inputs_thermagrid[orientation_name] = irradiance['poa_global'].tolist()  # Radiation list
+    # Radiation lists of the vertical surfaces (tilt 90), all the orientations in one batch. No altitude is given,
+    # so it is looked up by pvlib as Location(latitude, longitude) does
+    inputs_thermagrid.update(irradiance_service.facade_irradiance(latitude, longitude, None, tmy_data, FACADE_TILT))
 
     # Create the "outputs" folder if it doesn't exist
     output_folder = "outputs"
@@ -870,7 +983,8 @@ def generate_geojson(front_data):
     dict: A GeoJSON object with the building information.
     """
     gdf = gpd.GeoDataFrame(front_data)
-    gdf["geometry"]=gdf["geom"].apply(wkt.loads)
+    # same parsed geometries as get_indicators_from_baseline
+    gdf["geometry"]=get_geometry_layer(list(gdf["geom"])).geometries
     gdf.set_geometry("geometry")
     gdf.drop("geom",axis=1)
     gdf.set_crs(epsg=SRID, inplace=True)
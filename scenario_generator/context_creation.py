@@ -41,13 +41,13 @@ import os
 from kpi_module.key_performance_indicators import load_energy_system_catalogue, filter_energy_systems_catalogue
 from pvlib.iotools.pvgis import get_pvgis_hourly
 from pvlib.iotools import get_pvgis_tmy
-from pvlib.irradiance import get_total_irradiance
 import geopandas as gpd
-from shapely import wkt
 # from shapely.geometry import shape
 # from shapely.ops import unary_union
-from shapely.errors import GEOSException
-from pvlib.location import Location
+from pvgis_cache import pvgis_cache, seed_offline_cache, RAW, DERIVED, SEED_TMY_PATH
+from irradiance_service import irradiance_service
+from sizing_statistics import sizing_capacities, signature_demands
+from helpers.geometry import get_geometry_layer
 
 BUILDING_ASSET_CONTEXT="building_asset_context"
 def ungroup_buildings_to_context(grouped_buildings):
@@ -153,76 +153,144 @@ def group_buildings_by_generation_system(bd):
 
 
 def peak_load_distribution_curve (demand):
-
+    """
+    70 % and 90 % of the peak of the demand and its load distribution curve (demand sorted in descending order).
+    To size a system without the curve use sizing_statistics.sizing_capacities, which does not sort the demand
+    """
+    capacity_70, capacity_90 = sizing_capacities(demand)
     # Sort the demand data in descending order to create the load distribution curve
-    sorted_demand = sorted(demand, reverse=True)
+    sorted_demand = np.sort(np.asarray(demand, dtype=float))[::-1].tolist()
+    return capacity_70, capacity_90, sorted_demand
 
-    # Calculate the peak
-    max_peak=max(sorted_demand)
+def obtain_energy_signature (outdoor_temperatures,demand, mode):
+    """
+    Same as peak_load_distribution_curve for the demand of the hours below 18 °C (mode 0, heating) or above 26 °C
+    (cooling). sizing_statistics.sizing_statistics gives the capacities of many buildings without the curves
+    """
+    # Filter the demand of the hours of the signature
+    filtered_demand = signature_demands(outdoor_temperatures, demand, mode)[0]
+    filtered_demand = filtered_demand[~np.isnan(filtered_demand)]
+    if filtered_demand.size == 0:
+        raise ValueError("No demand in the temperature range of the energy signature")
+    return peak_load_distribution_curve(filtered_demand)
 
-    # Capacity at 80% and 90% demand
-    capacity_70 =  0.7 * max_peak
-    capacity_90 = 0.9 * max_peak
 
-    # print(f"Capacity to meet 80% of demand: {capacity_70:.2f}")
-    # print(f"Capacity to meet 90% of demand: {capacity_90:.2f}")
-    return capacity_70, capacity_90, sorted_demand
+# Systems of a generation_system_profile, in the order of the key of the profile index
+PROFILE_SYSTEM_KEYS = ("electricity_system_id", "dhw_system_id", "heating_system_id", "cooling_system_id")
+PROFILE_INDEX_COLUMNS = ("electricity_id", "dhw_id", "heating_id", "cooling_id")
 
-def obtain_energy_signature (outdoor_temperatures,demand, mode):
-    if mode ==0:
-        #This is for heating
-        # Filter heating demand for temperatures below 18°C
-        filtered_demand = [demand[i] for i in range(len(outdoor_temperatures)) if outdoor_temperatures[i] < 18]
-    else:
-        # Filter cooling demand for temperatures above 26°C
-        filtered_demand = [demand[i] for i in range(len(outdoor_temperatures)) if outdoor_temperatures[i] > 26]
+_system_profile_indexes = {}
 
-    # Sort the demands to create load duration curves (in descending order)
-    sorted_demand = sorted(filtered_demand, reverse=True)
-    # Calculate the peak
-    max_peak = max(sorted_demand)
 
-    # Capacity at 80% and 90% demand
-    capacity_70 =  0.7 * max_peak
-    capacity_90 = 0.9 * max_peak
+def normalise_system_id(system_id):
+    """
+    System id as a key component: int, or None for a missing system (None or NaN)
+    """
+    if system_id is None or pd.isna(system_id):
+        return None
+    return int(system_id)
 
-    # print(f"Capacity to meet 80% of demand: {capacity_70:.2f}")
-    # print(f"Capacity to meet 90% of demand: {capacity_90:.2f}")
-    return capacity_70, capacity_90, sorted_demand
 
-def get_generation_system_profile_id(electricity_id, dhw_id, heating_id, cooling_id):
+def load_system_profile_index(file_path=None):
+    """
+    Dictionary (electricity_id, dhw_id, heating_id, cooling_id) -> generation_system_profile_id of all_profiles.csv,
+    read once per process. Missing systems are None in the key, and if a combination is repeated the first row is kept
+    """
+    if file_path is None:
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalogues", "all_profiles.csv")
+    if file_path not in _system_profile_indexes:
+        system_profile_combinations = pd.read_csv(file_path)
+        profile_index = {}
+        for row in zip(*(system_profile_combinations[column] for column in PROFILE_INDEX_COLUMNS),
+                       system_profile_combinations["id"]):
+            key = tuple(normalise_system_id(system_id) for system_id in row[:-1])
+            profile_index.setdefault(key, int(row[-1]))
+        _system_profile_indexes[file_path] = profile_index
+    return _system_profile_indexes[file_path]
+
+
+def get_generation_system_profile_id(electricity_id, dhw_id, heating_id, cooling_id, profile_index=None):
     """
     This function takes in system type IDs for electricity, DHW, heating, and cooling,
-    looks them up in the DataFrame, and returns the corresponding generation_system_profile_id.
+    looks them up in the profile index of all_profiles.csv, and returns the corresponding generation_system_profile_id.
 
     Parameters:
     - electricity_id: The ID of the electricity system type.
     - dhw_id: The ID of the DHW system type.
     - heating_id: The ID of the heating system type.
     - cooling_id: The ID of the cooling system type.
-    - df: DataFrame containing the system types and generation_system_profile_id.
+    - profile_index: optional output of load_system_profile_index, the one of catalogues/all_profiles.csv by default.
+    None (or NaN) ids match the combinations without that system.
 
     Returns:
     - generation_system_profile_id if a match is found, otherwise None.
     """
-    system_profile_combinations_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                                   "catalogues", "all_profiles.csv")
-    system_profile_combinations=pd.read_csv(system_profile_combinations_csv)
-    # Filter the DataFrame to match the provided system type IDs
-    # Filtrar el DataFrame para que coincida con los valores proporcionados, considerando NaN
-    matched_row = system_profile_combinations[
-        (system_profile_combinations["electricity_id"] == electricity_id) &
-        ((system_profile_combinations["dhw_id"] == dhw_id) | (pd.isna(system_profile_combinations["dhw_id"]) & (dhw_id is None))) &
-        ((system_profile_combinations["heating_id"] == heating_id) | (pd.isna(system_profile_combinations["heating_id"]) & (heating_id is None))) &
-        ((system_profile_combinations["cooling_id"] == cooling_id) | (pd.isna(system_profile_combinations["cooling_id"]) & (cooling_id is None)))
-    ]
-
-    # Check if we found a match
-    if not matched_row.empty:
-        return int(matched_row.iloc[0]["id"])  # This column contains the generation_system_profile_id
-    else:
-        return None
+    if profile_index is None:
+        profile_index = load_system_profile_index()
+    key = tuple(normalise_system_id(system_id) for system_id in (electricity_id, dhw_id, heating_id, cooling_id))
+    return profile_index.get(key)
+
+
+def get_generation_system_profile_ids(generation_system_profiles, profile_index=None):
+    """
+    Batch version of get_generation_system_profile_id, e.g. for all the buildings of a community
+
+    Parameters:
+    - generation_system_profiles: list of generation_system_profile dictionaries (electricity_system_id,
+    dhw_system_id, heating_system_id, cooling_system_id) or of (electricity_id, dhw_id, heating_id, cooling_id) tuples
+    - profile_index: optional output of load_system_profile_index
+
+    Returns:
+    - list of generation_system_profile_id (None if the combination is not in the catalogue), in the same order
+    """
+    if profile_index is None:
+        profile_index = load_system_profile_index()
+    profile_ids = []
+    for systems in generation_system_profiles:
+        if isinstance(systems, dict):
+            systems = [systems.get(system_key) for system_key in PROFILE_SYSTEM_KEYS]
+        profile_ids.append(profile_index.get(tuple(normalise_system_id(system_id) for system_id in systems)))
+    return profile_ids
+
 
+# System slots of the generation_system_profile (and the community storage) looked up by the actions
+ACTION_SYSTEM_TYPES = ("electricity_system_id", "heating_system_id", "cooling_system_id", "dhw_system_id", "storage")
+
+
+class ActionSystemIndex:
+    def __init__(self, actions_to_generation_systems):
+        """
+        Lookup table (action_key, system type) -> new system id, compiled once from actions_to_generation_systems.csv
+        so the actions do not filter the DataFrame for every building and system. It gives the same id as the mask in
+        get_system_type_for_action: the first row of the action whose name_system_type contains the system type
+        :param actions_to_generation_systems: DataFrame with the action_key, name_system_type and id columns
+        """
+        # rows of every action, in the order of the file
+        self.rows = {}
+        for action_key, name_system_type, system_id in zip(actions_to_generation_systems["action_key"],
+                                                           actions_to_generation_systems["name_system_type"],
+                                                           actions_to_generation_systems["id"]):
+            if pd.isna(action_key) or pd.isna(system_id) or pd.isna(name_system_type):
+                continue
+            self.rows.setdefault(int(action_key), []).append((str(name_system_type), int(system_id)))
+        self.ids = {}
+        for action_key in self.rows:
+            for system in ACTION_SYSTEM_TYPES:
+                self.lookup(action_key, system)
+
+    def lookup(self, action_key, system):
+        """
+        New system id of the action for the system type, None if the action does not change that system
+        """
+        key = (action_key, system)
+        if key not in self.ids:
+            # system types that were not compiled are resolved once and kept
+            self.ids[key] = next((system_id for name_system_type, system_id in self.rows.get(action_key, ())
+                                  if system in name_system_type), None)
+        return self.ids[key]
+
+    def __len__(self):
+        return len(self.ids)
 
 
 def get_system_type_for_action(actions_to_generation_systems, action_key,system):
@@ -235,7 +303,8 @@ def get_system_type_for_action(actions_to_generation_systems, action_key,system)
       and then updates the system profile for the building with the new ID.
     Parameters
     ----------
-    actions_to_generation_systems is a DataFrame that contains action information, including the action_key and name_system_type columns.
+    actions_to_generation_systems is an ActionSystemIndex (see compile_action_system_index) or a DataFrame that contains
+    action information, including the action_key and name_system_type columns.
     action_key represents an identifier for a recommended action.
     system represents the type of system (electricity, dhw, cooling, heating)
 
@@ -243,6 +312,8 @@ def get_system_type_for_action(actions_to_generation_systems, action_key,system)
     -------
     new_system_id
     """
+    if isinstance(actions_to_generation_systems, ActionSystemIndex):
+        return actions_to_generation_systems.lookup(action_key, system)
     # Create a mask to filter the DataFrame where action_key matches and name_system_type contains the system key
     mask = (actions_to_generation_systems["action_key"] == action_key) & (
         actions_to_generation_systems["name_system_type"].str.contains(system))
@@ -257,6 +328,14 @@ def get_system_type_for_action(actions_to_generation_systems, action_key,system)
     corrected_id=handle_new_system_id(new_system_id)
     return corrected_id
 
+
+def compile_action_system_index(actions_to_generation_systems):
+    """
+    ActionSystemIndex of the actions_to_generation_systems DataFrame, to be passed instead of the DataFrame to
+    update_building_system, update_community_energy_assets and get_system_type_for_action
+    """
+    return ActionSystemIndex(actions_to_generation_systems)
+
 def get_centroid(group_of_geoms,target_epsg=4326):
 
     """
@@ -276,41 +355,24 @@ def get_centroid(group_of_geoms,target_epsg=4326):
     community centroid
     """
 
-    geoms_list = []
-    names_list = []
-    ids_list = []
-
-    for building_id, data in group_of_geoms.items():
-        try:
-            # Try converting the string geometry (WKT) to a Shapely geometry object
-            geometry = wkt.loads(data["geom"])
-
-            # Check if the geometry is valid
-            if not geometry.is_valid:
-                # print(f"Warning: Geometry for building {building_id} is invalid, attempting to fix...")
-                geometry = geometry.buffer(0)  # Try to fix the geometry by buffering it
-
-            # Append the valid geometry to the list
-            geoms_list.append(geometry)
-            names_list.append(data["name"])
-            ids_list.append(building_id)
-
-        except GEOSException as e:
-            # If there's an issue loading the geometry, log it and skip
-            print(f"Error loading geometry for building {building_id}: {e}")
+    building_ids = list(group_of_geoms)
+    # parsed and repaired once per community, shared with the other stages (see helpers.geometry)
+    layer = get_geometry_layer([group_of_geoms[building_id]["geom"] for building_id in building_ids],
+                               crs=f"EPSG:{target_epsg}")
+    # buildings whose geometry could not be loaded are skipped
+    loaded = ~layer.missing
+    if not loaded.all():
+        print(f"Error loading geometry for buildings {[b for b, ok in zip(building_ids, loaded) if not ok]}")
 
     # Create the GeoDataFrame
-    gdf = gpd.GeoDataFrame({"id": ids_list, "name": names_list, "geometry": geoms_list})
-    # Assign a default CRS (you might want to choose a different CRS depending on the data source)
-    gdf.set_crs(epsg=target_epsg, inplace=True)
-
-    # Reproject the GeoDataFrame to the target CRS (e.g., EPSG:4326 for geographic coordinates)
-    gdf = gdf.to_crs(epsg=target_epsg)
+    gdf = gpd.GeoDataFrame({"id": [b for b, ok in zip(building_ids, loaded) if ok],
+                            "name": [group_of_geoms[b]["name"] for b, ok in zip(building_ids, loaded) if ok],
+                            "geometry": layer.geometries[loaded]}, crs=f"EPSG:{target_epsg}")
     # Calculate the centroid of each individual geometry
-    gdf["centroid"] = gdf.geometry.centroid
+    gdf["centroid"] = gpd.GeoSeries(layer.centroids[loaded], index=gdf.index, crs=gdf.crs)
 
     # Calculate the centroid of the entire group of geometries
-    community_centroid = gdf.unary_union.centroid
+    community_centroid = layer.community_centroid
 
     # ------------------------------------------------------
     # ASSUMES INPUT AND OUTPUT CRS IS EPSG 4326
@@ -346,34 +408,16 @@ def wind_power(wind_speed):
     return wind_potential_kWh_per_kWp
 
 
-def call_PVGIS(longitude, latitude,tilt_angle):
+def fetch_PVGIS(longitude, latitude, tilt_angle, url=None):
         """
-        Calculate temperatures and radiations based on TMY data and return a JSON for
-        the given centroid returning temperatures, and radiations.
-
-        Parameters
-        ----------
-        centroid : point (X Y)
+        Calls PVGIS (hourly series with PV calculation and TMY) for a location
 
         Returns
         -------
         dict
-            A dictionary containing the original GeoJSON, temperatures, and calculated radiations.
-            From PVGIS tmy_data is obtained such as:
-                    {'T2m': {'description': '2-m air temperature', 'units': 'degree Celsius'},
-                    'RH': {'description': 'relative humidity', 'units': '%'},
-                     'G(h)': {'description': 'Global irradiance on the horizontal plane', 'units': 'W/m2'},
-                      'Gb(n)': {'description': 'Beam/direct irradiance on a plane always normal to sun rays', 'units': 'W/m2'},
-                      'Gd(h)': {'description': 'Diffuse irradiance on the horizontal plane', 'units': 'W/m2'},
-                      'IR(h)': {'description': 'Surface infrared (thermal) irradiance on a horizontal plane', 'units': 'W/m2'},
-                      'WS10m': {'description': '10-m total wind speed', 'units': 'm/s'},
-                      'WD10m': {'description': '10-m wind direction (0 = N, 90 = E)', 'units': 'degree'},
-                       'SP': {'description': 'Surface (air) pressure', 'units': 'Pa'}}
-
-                       surface azimuth 180º which is south, 0=fixed
-
+            "hourly": response of get_pvgis_hourly, "tmy": response of get_pvgis_tmy
         """
-        URL = 'https://re.jrc.ec.europa.eu/api/v5_3/'
+        URL = url or pvgis_cache.url
         pv_data=get_pvgis_hourly (latitude, longitude, start=2023, end=2023,components=True,
                                 surface_tilt=tilt_angle, surface_azimuth=180,
                                 outputformat='json',
@@ -382,6 +426,22 @@ def call_PVGIS(longitude, latitude,tilt_angle):
                                 mountingplace='free', loss=0, trackingtype=0,
                                 optimal_surface_tilt=False, optimalangles=False,
                                 url=URL, map_variables=True, timeout=30)
+        # Call PVGIS API (with pvlib) to get TMY data
+        tmy_response = get_pvgis_tmy(latitude, longitude, map_variables=False, url=URL)
+        return {"hourly": pv_data, "tmy": tmy_response}
+
+
+def derive_PVGIS_outputs(pvgis_responses, tilt_angle):
+        """
+        Series used by the scenarios from the PVGIS responses of fetch_PVGIS (or of the PVGIS cache)
+
+        Returns
+        -------
+        dict
+            "irradiance", "pv_profile", "solar_elevation_midday", "T2m" and "wind_potential"
+        """
+        pv_data = pvgis_responses["hourly"]
+        tmy_response = pvgis_responses["tmy"]
         pv_profile_in_kWh_kWp=pv_data[0]['P'].tolist() # PV system power (W)
         pv_profile_in_kWh_kWp = [x/1000 for x in pv_profile_in_kWh_kWp]  # PV system power in kW/kWp
         solar_elevation=pv_data[0]['solar_elevation'].copy() #     Sun height / elevation(degrees) dataframe
@@ -393,8 +453,8 @@ def call_PVGIS(longitude, latitude,tilt_angle):
                       (solar_elevation['time'].dt.time <= pd.to_datetime('14:00').time())
         filtered_rows = solar_elevation[date_filter & time_filter]
         solar_elevation_midday_values = filtered_rows[['time', 'solar_elevation']]
-        # Call PVGIS API (with pvlib) to get TMY data
-        tmy_data, months_selected, inputs, meta = get_pvgis_tmy(latitude, longitude, map_variables=False, url=URL)
+        tmy_data, months_selected, inputs, meta = tmy_response
+        tmy_data = tmy_data.copy()
 
         # Ensure 'tmy_data' index is in datetime format
         tmy_data.index = pd.to_datetime(tmy_data.index)
@@ -406,42 +466,90 @@ def call_PVGIS(longitude, latitude,tilt_angle):
         # Define the location using 'inputs' data
         latitude = inputs['location']['latitude']
         longitude = inputs['location']['longitude']
-        site = Location(latitude, longitude,altitude=inputs['location']['elevation'])  # Use Location class directly
-        #Location class sets times as UTC
-
-        # The angles apparent zenith and azimuth are obtained
-        solar_position = site.get_solarposition(times=tmy_data.index)
-
-        # Define orientations of vertical surfaces
-        orientations = {
-            'rad_n': 0,
-            'rad_s': 180,
-            'rad_e': 90,
-            'rad_o': 270  # 'rad_o' changed to 'rad_w' for clarity
-        }
-
-        # Tilt angle (90 degrees for vertical surfaces)
-        tilt_angle = tilt_angle
-        irradiance_dic={}
-        for orientation_name, azimuth_angle in orientations.items():
-            irradiance = get_total_irradiance(
-                surface_tilt=tilt_angle,
-                surface_azimuth=azimuth_angle,
-                solar_zenith=solar_position['apparent_zenith'], #The angles are in degrees.
-                solar_azimuth=solar_position['azimuth'],#The angles are in degrees.
-                dni=tmy_data['Gb(n)'], #units': 'W/m2
-                ghi=tmy_data['G(h)'],
-                dhi=tmy_data['Gd(h)'],
-            )
-
-            irradiance_dic[orientation_name] = irradiance['poa_global'].tolist()  # Radiation list
+        # Solar position and irradiance of the façades, calculated once per location (see irradiance_service.py)
+        irradiance_dic = irradiance_service.facade_irradiance(latitude, longitude, inputs['location']['elevation'],
+                                                              tmy_data, tilt_angle)
 
         irradiance_dic_with_tmy_data=irradiance_dic
         irradiance_dic_with_tmy_data['Gb(n)']=tmy_data['Gb(n)'].tolist()
         irradiance_dic_with_tmy_data['G(h)']=tmy_data['G(h)'].tolist()
         irradiance_dic_with_tmy_data['Gd(h)']=tmy_data['Gd(h)'].tolist()
 
-        return irradiance_dic, pv_profile_in_kWh_kWp, solar_elevation_midday_values, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data
+        return {"irradiance": irradiance_dic_with_tmy_data, "pv_profile": pv_profile_in_kWh_kWp,
+                "solar_elevation_midday": solar_elevation_midday_values, "T2m": T2m,
+                "wind_potential": wind_potential_kWh_per_kWp}
+
+
+def get_PVGIS_outputs(longitude, latitude, tilt_angle, cache=None):
+        """
+        Derived PVGIS series of a location, from the cache when possible. PVGIS is only called if there is no raw
+        entry either, and never in offline mode (the nearest cached location is used instead)
+        """
+        cache = cache or pvgis_cache
+        outputs = cache.load(latitude, longitude, tilt_angle, kind=DERIVED)
+        if outputs is not None:
+            return outputs
+        # In offline mode an empty cache is seeded with the local TMY and hourly series
+        if cache.offline and not cache.entries() and os.path.exists(SEED_TMY_PATH):
+            seed_offline_cache(cache)
+        pvgis_responses = cache.load(latitude, longitude, tilt_angle, kind=RAW)
+        if pvgis_responses is None and cache.offline:
+            outputs, metadata = cache.nearest(latitude, longitude, tilt_angle, kind=DERIVED)
+            if outputs is None:
+                pvgis_responses, metadata = cache.nearest(latitude, longitude, tilt_angle, kind=RAW)
+            if metadata is None:
+                raise RuntimeError(f"PVGIS offline mode: no cached data for tilt {tilt_angle}, "
+                                   "seed the cache with seed_offline_cache")
+            print(f"PVGIS offline mode: data of ({metadata['latitude']}, {metadata['longitude']}) used for "
+                  f"({latitude}, {longitude})")
+            if outputs is None:
+                # Stored at the cached location, not at the requested one
+                outputs = derive_PVGIS_outputs(pvgis_responses, tilt_angle)
+                cache.store(metadata["latitude"], metadata["longitude"], tilt_angle, outputs, kind=DERIVED,
+                            source=metadata.get("source", "PVGIS"))
+            return outputs
+        elif pvgis_responses is None:
+            pvgis_responses = fetch_PVGIS(longitude, latitude, tilt_angle, url=cache.url)
+            cache.store(latitude, longitude, tilt_angle, pvgis_responses, kind=RAW)
+        outputs = derive_PVGIS_outputs(pvgis_responses, tilt_angle)
+        cache.store(latitude, longitude, tilt_angle, outputs, kind=DERIVED)
+        return outputs
+
+
+def call_PVGIS(longitude, latitude,tilt_angle):
+        """
+        Calculate temperatures and radiations based on TMY data and return a JSON for
+        the given centroid returning temperatures, and radiations.
+
+        Parameters
+        ----------
+        centroid : point (X Y)
+
+        Returns
+        -------
+        dict
+            A dictionary containing the original GeoJSON, temperatures, and calculated radiations.
+            From PVGIS tmy_data is obtained such as:
+                    {'T2m': {'description': '2-m air temperature', 'units': 'degree Celsius'},
+                    'RH': {'description': 'relative humidity', 'units': '%'},
+                     'G(h)': {'description': 'Global irradiance on the horizontal plane', 'units': 'W/m2'},
+                      'Gb(n)': {'description': 'Beam/direct irradiance on a plane always normal to sun rays', 'units': 'W/m2'},
+                      'Gd(h)': {'description': 'Diffuse irradiance on the horizontal plane', 'units': 'W/m2'},
+                      'IR(h)': {'description': 'Surface infrared (thermal) irradiance on a horizontal plane', 'units': 'W/m2'},
+                      'WS10m': {'description': '10-m total wind speed', 'units': 'm/s'},
+                      'WD10m': {'description': '10-m wind direction (0 = N, 90 = E)', 'units': 'degree'},
+                       'SP': {'description': 'Surface (air) pressure', 'units': 'Pa'}}
+
+                       surface azimuth 180º which is south, 0=fixed
+
+            The PVGIS responses and these outputs are cached on disk (see pvgis_cache.py)
+        """
+        outputs = get_PVGIS_outputs(longitude, latitude, tilt_angle)
+        # irradiance_dic and irradiance_dic_with_tmy_data were the same dictionary
+        irradiance_dic = {name: list(values) for name, values in outputs["irradiance"].items()}
+        irradiance_dic_with_tmy_data = irradiance_dic
+        return (irradiance_dic, list(outputs["pv_profile"]), outputs["solar_elevation_midday"].copy(),
+                list(outputs["T2m"]), list(outputs["wind_potential"]), irradiance_dic_with_tmy_data)
 
 
 
@@ -537,7 +645,7 @@ def handle_dhw_system(updated_generation_system_profile, new_gen_system_id, dhw_
                    67, 68, 73]
     if float(new_gen_system_id) in list_of_hps:  # heat pump
         filtered_systems_info = filter_energy_systems_catalogue(energy_systems_catalogue, new_gen_system_id)
-        capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(dhw_demand)
+        capacity_70, capacity_90 = sizing_capacities(dhw_demand)
         updated_generation_system_profile["dhw_system"] = filtered_systems_info
         name=filtered_systems_info["name"]
         new_building_energy_asset = BuildingEnergyAsset(
@@ -563,7 +671,7 @@ def handle_dhw_system(updated_generation_system_profile, new_gen_system_id, dhw_
         #     #1kW
     else:
         filtered_systems_info = filter_energy_systems_catalogue(energy_systems_catalogue, new_gen_system_id)
-        capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(dhw_demand)
+        capacity_70, capacity_90 = sizing_capacities(dhw_demand)
         updated_generation_system_profile["dhw_system"] = filtered_systems_info
         name=updated_generation_system_profile["dhw_system"]["name"]
         new_building_energy_asset = BuildingEnergyAsset(
@@ -600,7 +708,7 @@ def handle_heating_system(updated_generation_system_profile, new_gen_system_id,
                    67, 68, 73]
     if float(new_gen_system_id) in list_of_hps:  # heat pump
         filtered_systems_info = filter_energy_systems_catalogue(energy_systems_catalogue, new_gen_system_id)
-        capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(heating_demand)
+        capacity_70, capacity_90 = sizing_capacities(heating_demand)
         updated_generation_system_profile["heating_system"] = filtered_systems_info
         name=updated_generation_system_profile["heating_system"]["name"]
         new_building_energy_asset = BuildingEnergyAsset(
@@ -622,7 +730,7 @@ def handle_heating_system(updated_generation_system_profile, new_gen_system_id,
         del new_building_energy_asset
     else:
         filtered_systems_info = filter_energy_systems_catalogue(energy_systems_catalogue, new_gen_system_id)
-        capacity_70, capacity_90, sorted_demand = peak_load_distribution_curve(heating_demand)
+        capacity_70, capacity_90 = sizing_capacities(heating_demand)
         updated_generation_system_profile["heating_system"] = filtered_systems_info
         name = updated_generation_system_profile["heating_system"]["name"]
         new_building_energy_asset = BuildingEnergyAsset(
@@ -678,9 +786,9 @@ def update_building_system(goal, building_id,building_geom, demandprofile,pvprof
         The dictionary within the list can represent the current energy asset for the building (if available).
         If no asset is present, this is `None` or []
 
-    actions_to_generation_systems : pd.DataFrame
-        A DataFrame that maps action keys to corresponding system types and system IDs. This is used to look up
-        the new system IDs based on the action being applied.
+    actions_to_generation_systems : ActionSystemIndex or pd.DataFrame
+        The compiled lookup table (or the DataFrame) that maps action keys to corresponding system types and system
+        IDs. This is used to look up the new system IDs based on the action being applied.
 
     action_key : int
         The key representing the recommended action to be applied to the building's systems. This key is used to look
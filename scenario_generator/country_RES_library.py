@@ -31,11 +31,16 @@ This part of the code manages and creates the Country class
 
 """
         
+import ast
 import json
 import os
 import csv
 import pandas as pd
 
+# Flags of the recommended scenarios of every country
+SCENARIO_FLAGS = ("Ambitious_renovator", "HighDHN", "HighElectrification", "Biomass", "Solar", "SmartHeating",
+                  "Allow_gas")
+
 #Class country  
 #it must have a name and country code
 #any other data you want to add is up to you !
@@ -59,27 +64,41 @@ class Country:
         attributes.update(vars(self))
         return attributes
 
-def country_res_recommendations (country_code):
-    #read the recommended scenarios per country according to scenarios from https://www.researchgate.net/publication/333371930_Development_of_Energy_demand_for_buildings_industry_and_transport_in_the_SET-Nav_pathways_-_WP5_Summary_report
-    recommendations='country_scenarios_recomended.csv'
-    json_file_path= os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                 'data', 'RESlibrary','country_scenarios_recommended.json')
+def parse_flag(value):
+    """
+    Value of a flag of the RES library ("True"/"False" in the json files), parsed as a Python literal without eval
+    """
+    if isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        # e.g. countries without data (null flags)
+        raise TypeError(f"Flag {value!r} of the RES library is not a string")
+    return ast.literal_eval(value.strip())
+
+
+def load_country_scenarios(json_file_path=None):
+    if json_file_path is None:
+        json_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      'data', 'RESlibrary', 'country_scenarios_recommended.json')
     # Load the JSON file
     with open(json_file_path, 'r') as file:
-        data = json.load(file)
+        return json.load(file)
+
+
+def country_res_recommendations (country_code, country_scenarios=None):
+    """
+    :param country_code: e.g. "AT"
+    :param country_scenarios: optional content of country_scenarios_recommended.json, read from the RES library by
+    default
+    """
+    #read the recommended scenarios per country according to scenarios from https://www.researchgate.net/publication/333371930_Development_of_Energy_demand_for_buildings_industry_and_transport_in_the_SET-Nav_pathways_-_WP5_Summary_report
+    if country_scenarios is None:
+        country_scenarios = load_country_scenarios()
 
     # Iterate over each entry to find the properties for the specified country
-    for entry in data:
+    for entry in country_scenarios:
         if entry['Country'] == country_code:
-            properties = {
-                "Ambitious_renovator": eval(entry['properties']["Ambitious_renovator"]),
-                "HighDHN": eval(entry['properties']["HighDHN"]),
-                "HighElectrification": eval(entry['properties']["HighElectrification"]),
-                "Biomass": eval(entry['properties']["Biomass"]),
-                "Solar": eval(entry['properties']["Solar"]),
-                "SmartHeating": eval(entry['properties']["SmartHeating"]),
-                "Allow_gas": eval(entry['properties']["Allow_gas"]),
-            }
+            properties = {flag: parse_flag(entry['properties'][flag]) for flag in SCENARIO_FLAGS}
             return properties
 
     # If the country is not found, return an empty dictionary or a message
@@ -8,9 +8,11 @@ import pandas as pd
 import os
 from context_creation import (update_building_system, get_centroid, call_PVGIS, update_community_energy_assets,
                               create_grid_community_asset, convert_geometries_to_strings,
-                              update_building_consumption, get_system_type_for_action)
+                              update_building_consumption, get_system_type_for_action, compile_action_system_index,
+                              get_generation_system_profile_ids)
 from datetime import datetime
 from kpi_module.key_performance_indicators import handle_demand_profile
+from scenario_context import ScenarioContext, share_unchanged
 
 # Define constants for recurring string literals
 AVAILABILITY_TS = "availability_ts"
@@ -49,35 +51,49 @@ ELECTRICITY_SYSTEM_ID="electricity_system_id"
 
 
 def assign_incremental_ids_to_community_assets(community_energy_asset):
+    # the assets (and their nodes) are copied before setting the ids, they can be shared with the parent context
     current_id = 1  # Start with an initial id value
     nodes_id=1
+    updated_community_energy_asset = []
     # Loop through each building in the list
     for assets in community_energy_asset:
         # Loop through each energy asset within the building
+            assets = dict(assets)
             assets["id_temp"] = current_id
             if assets[AVAILABILITY_TS] is not None:
+                assets[AVAILABILITY_TS] = dict(assets[AVAILABILITY_TS])
                 assets[AVAILABILITY_TS]["id_temp"]= current_id
+            assets["input_node"] = dict(assets["input_node"])
             assets["input_node"]["id_temp"] = nodes_id #DE MOMENTO MIRA AL MISMO ID, CAMBIAR SI SE CAMBIA GEOMETRIA
             # nodes_id+=1
             if "output_node" in assets:
+                assets["output_node"] = dict(assets["output_node"])
                 assets["output_node"]["id_temp"] = nodes_id
                 # nodes_id += 1
+            updated_community_energy_asset.append(assets)
             # Increment the id for the next asset
             current_id += 1
 
-    return community_energy_asset
+    return updated_community_energy_asset
 def assign_incremental_ids(building_asset_context):
+    # the assets are copied before setting the ids (the buildings are the copies of the scenario, their assets can
+    # be shared with the parent context)
     current_id = 1  # Start with an initial id value
 
     # Loop through each building in the list
     for building_assets_context in building_asset_context:
+        building_energy_assets = []
         # Loop through each energy asset within the building
         for building_energy_asset in building_assets_context["building_energy_asset"]:
+            building_energy_asset = dict(building_energy_asset)
             # Assign the current incremental id to the "id" field
             building_energy_asset["id_temp"] = current_id
+            building_energy_asset[AVAILABILITY_TS] = dict(building_energy_asset[AVAILABILITY_TS])
             building_energy_asset[AVAILABILITY_TS]["id_temp"]= current_id
+            building_energy_assets.append(building_energy_asset)
             # Increment the id for the next asset
             current_id += 1
+        building_assets_context["building_energy_asset"] = building_energy_assets
 
     return building_asset_context
 
@@ -89,9 +105,91 @@ def asset_exists(community_context, new_gen_system_id):
                 return True
     return False
 
-def resbased_generator_context_creation(goal, community_context,recommendations_dic):
+def current_creation_date():
     """
-    Modifies the systems of each building, according to the list of recommended actions for one scenario
+    creation_date of a context created now
+    """
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+_actions_to_generation_systems = {}
+
+
+def load_actions_to_generation_systems(file_path=None):
+    """
+    actions_to_generation_systems.csv, read once per process
+    """
+    if file_path is None:
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                 "actions_to_generation_systems.csv")
+    if file_path not in _actions_to_generation_systems:
+        _actions_to_generation_systems[file_path] = pd.read_csv(file_path)
+    return _actions_to_generation_systems[file_path]
+
+
+_action_system_indexes = {}
+
+
+def load_action_system_index(file_path=None):
+    """
+    (action_key, system type) -> system id lookup table of actions_to_generation_systems.csv, compiled once per process
+    """
+    if file_path is None:
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
+                                 "actions_to_generation_systems.csv")
+    if file_path not in _action_system_indexes:
+        _action_system_indexes[file_path] = compile_action_system_index(load_actions_to_generation_systems(file_path))
+    return _action_system_indexes[file_path]
+
+
+def prepare_scenario_invariants(community_context):
+    """
+    Inputs of resbased_generator_context_creation that do not depend on the recommended actions, so they can be
+    shared by all the scenarios of a community: centroid of the buildings, PVGIS data of the centroid and the
+    actions to generation systems table
+
+    Parameters
+    ----------
+    community_context: The context input of the energy community
+
+    Returns
+    -------
+    dict with "gdf", "community_centroid", "longitude", "latitude", the outputs of call_PVGIS and
+    "actions_to_generation_systems" (compiled lookup table, see load_action_system_index)
+    """
+    group_of_geoms = {}
+    for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
+        # get group of geoms
+        group_of_geoms[building_asset_context["building"]["id"]] = {
+            "geom": building_asset_context["building"]["geom"],
+            "name": building_asset_context["name"]
+        }
+    # get gdf and centroids
+    gdf, community_centroid = get_centroid(group_of_geoms)
+    longitude, latitude = community_centroid.x, community_centroid.y
+    # get pv_profile, wind profile and temperature for the centroid of the community
+    irradiance_dic, pv_profile_kWh_per_kWp, solar_elevation, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data= call_PVGIS(longitude, latitude, tilt_angle=35)
+    return {
+        "gdf": gdf,
+        "community_centroid": community_centroid,
+        "longitude": longitude,
+        "latitude": latitude,
+        "irradiance_dic": irradiance_dic,
+        "pv_profile_kWh_per_kWp": pv_profile_kWh_per_kWp,
+        "solar_elevation": solar_elevation,
+        "T2m": T2m,
+        "wind_potential_kWh_per_kWp": wind_potential_kWh_per_kWp,
+        "irradiance_dic_with_tmy_data": irradiance_dic_with_tmy_data,
+        # translate actions to new generation systems
+        "actions_to_generation_systems": load_action_system_index(),
+    }
+
+
+def resbased_generator_context_creation(goal, community_context,recommendations_dic, invariants=None):
+    """
+    Modifies the systems of each building, according to the list of recommended actions for one scenario.
+    community_context is not modified: the buildings of the new context are shallow copies and only the parts changed
+    by the actions are replaced, the rest (e.g. the consumption series) is shared with community_context
 
     Parameters
     ----------
@@ -104,6 +202,7 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
             "6": "E-mobility",
     community_context: The context input of the energy community
     recommendations_dic : ids of the recommended actions
+    invariants: optional, output of prepare_scenario_invariants for this community (shared by several scenarios)
 
     Returns
     -------
@@ -115,8 +214,10 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
     #añadir nuevos energy assets
 
     # Call the function and get the grouped buildings
-    community_context_updated = community_context.copy()
-    group_of_geoms = {}
+    community_context_updated = dict(community_context)
+    if isinstance(community_context.get(BUILDING_ASSET_CONTEXT), list):
+        community_context_updated[BUILDING_ASSET_CONTEXT] = [dict(building_asset_context) for building_asset_context
+                                                             in community_context[BUILDING_ASSET_CONTEXT]]
     community_context_updated["context_parent"]=community_context.get("id")
     community_context_updated["id_temp"]= community_context_updated["context_parent"]+1
     if "id" in community_context_updated:
@@ -125,23 +226,15 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
     if BUILDING_ASSET_CONTEXT in community_context and isinstance(community_context[BUILDING_ASSET_CONTEXT], list):
         new_buildings_asset_contexts=[]
         temp_id = 1
-        for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
-            # get group of geoms
-            group_of_geoms[building_asset_context["building"]["id"]] = {
-                "geom": building_asset_context["building"]["geom"],
-                "name": building_asset_context["name"]
-            }
-        # get gdf and centroids
-        gdf, community_centroid = get_centroid(group_of_geoms)
-        longitude, latitude = community_centroid.x, community_centroid.y
-        # get pv_profile, wind profile and temperature for the centroid of the community
-        irradiance_dic, pv_profile_kWh_per_kWp, solar_elevation, T2m, wind_potential_kWh_per_kWp, irradiance_dic_with_tmy_data= call_PVGIS(longitude, latitude, tilt_angle=35)
-        # translate actions to new generation systems
-        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data",
-                                 "actions_to_generation_systems.csv")
-        actions_to_generation_systems = pd.read_csv(file_path)
+        if invariants is None:
+            invariants = prepare_scenario_invariants(community_context)
+        community_centroid = invariants["community_centroid"]
+        pv_profile_kWh_per_kWp = invariants["pv_profile_kWh_per_kWp"]
+        solar_elevation = invariants["solar_elevation"]
+        wind_potential_kWh_per_kWp = invariants["wind_potential_kWh_per_kWp"]
+        actions_to_generation_systems = invariants["actions_to_generation_systems"]
 
-        for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
+        for building_asset_context in community_context_updated[BUILDING_ASSET_CONTEXT]:
             # Check if GENERATION_SYSTEM_PROFILE_ID is in the building_dic
             if GENERATION_SYSTEM_PROFILE_ID in building_asset_context:
                 for i, actions in recommendations_dic.items():
@@ -171,16 +264,21 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
                             #get the name of actions applied to the scenario
                             name_of_actions_applied += f"_{action_key} with name {actions["action_name"]}_"
                             # print(f"Processing action_key {action_key} with name {actions["action_name"]}")
-                            #get existing building energy assets
+                            #get existing building energy assets (copied, the new assets are appended)
                             building_energy_asset = building_asset_context["building_energy_asset"]
-                            # get generation system profile dics
-                            generation_system = building_asset_context[GENERATION_SYSTEM_PROFILE]
+                            if building_energy_asset is not None:
+                                building_energy_asset = list(building_energy_asset)
+                            # get generation system profile dics (copied, the systems are replaced)
+                            generation_system = dict(building_asset_context[GENERATION_SYSTEM_PROFILE])
                             #get building footprint
                             building_geom=float(building_asset_context["building"]["area_conditioned"])
-                            #get connsumption profile
-                            consumption_profile= building_asset_context["building_consumption"]
+                            #get connsumption profile (copied, handle_demand_profile can set some services to 0)
+                            parent_consumption_profile = building_asset_context["building_consumption"]
+                            consumption_profile= dict(parent_consumption_profile)
                             # get building demand profile
                             demandprofile=handle_demand_profile(building_asset_context,generation_system,consumption_profile)
+                            building_asset_context["building_consumption"] = share_unchanged(parent_consumption_profile,
+                                                                                             consumption_profile)
                             #change building system
                             updated_generation_system_profile,updated_building_energy_asset,new_system= update_building_system (goal=goal, building_id=building_id_geom,
                                                                                                                                  building_geom=building_geom,demandprofile=demandprofile,pvprofile=pv_profile_kWh_per_kWp,
@@ -213,7 +311,7 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
     else:
         print("building_asset_context is not a valid list in bd")
 
-    for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]:
+    for building_asset_context in community_context_updated[BUILDING_ASSET_CONTEXT]:
         # del (building_asset_context[GENERATION_SYSTEM_PROFILE][ELECTRICITY_SYSTEM])
         # del (building_asset_context[GENERATION_SYSTEM_PROFILE][HEATING_SYSTEM])
         # del (building_asset_context[GENERATION_SYSTEM_PROFILE][COOLING_SYSTEM])
@@ -255,7 +353,7 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
 
     updated_community_energy_asset=assign_incremental_ids_to_community_assets(community_energy_asset=updated_community_energy_asset)
                                    #create new context (id=2) with context_parent=bd.get("id")
-    community_context["building_asset_context"]=assign_incremental_ids(new_buildings_asset_contexts)
+    assign_incremental_ids(new_buildings_asset_contexts)
     #update community assets and nodes (Alberto)
     if COMMUNITY_ENERGY_ASSET in community_context and not community_context[COMMUNITY_ENERGY_ASSET]:
         # If it"s an empty list, replace it with `updated_community_energy_asset`
@@ -266,9 +364,40 @@ def resbased_generator_context_creation(goal, community_context,recommendations_
         for asset in updated_community_energy_asset:
             community_context_updated[COMMUNITY_ENERGY_ASSET].append(asset)
     # datetime object containing current date and time
-    community_context_updated["creation_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    community_context_updated["creation_date"] = current_creation_date()
     community_context_updated["name"] =name_of_actions_applied
     community_context_updated["description"] = name_of_actions_applied+ f"with goal {goal}"
     return community_context_updated
 
 
+def derive_scenario_context(goal, community_context, recommendations_dic, invariants=None):
+    """
+    Same as resbased_generator_context_creation, but the scenario is returned as a ScenarioContext that only stores
+    what the actions changed (the rest is shared with community_context, which can be another ScenarioContext)
+
+    Returns
+    -------
+    ScenarioContext, use to_dict() to get the context as a dictionary
+    """
+    community_context_updated = resbased_generator_context_creation(goal, community_context, recommendations_dic,
+                                                                    invariants)
+    return ScenarioContext.from_contexts(community_context, community_context_updated)
+
+
+def resolve_generation_system_profile_ids(community_context, profile_index=None):
+    """
+    generation_system_profile_id of the current systems of every building of a community (e.g. a scenario whose
+    actions changed the generation_system_profile), resolved in one pass over the profile index of all_profiles.csv
+
+    Parameters
+    ----------
+    community_context: community context (or ScenarioContext) with the building_asset_context list
+    profile_index: optional output of load_system_profile_index
+
+    Returns
+    -------
+    list with the generation_system_profile_id of each building (None if the combination is not in the catalogue)
+    """
+    generation_system_profiles = [building_asset_context.get(GENERATION_SYSTEM_PROFILE) or {}
+                                  for building_asset_context in community_context[BUILDING_ASSET_CONTEXT]]
+    return get_generation_system_profile_ids(generation_system_profiles, profile_index)
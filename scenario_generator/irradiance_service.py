@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Solar geometry and irradiance on tilted planes (façades, PV) shared by generate_demand_inputs and call_PVGIS.
+
+The solar position of a location is calculated once per TMY (same location and same hours) and all the requested
+(tilt, azimuth) planes are evaluated in one vectorised call of get_total_irradiance, broadcasting the planes against
+the hours. The results are kept in memory and on disk, in the PVGIS cache folder (see pvgis_cache.py), addressed by a
+hash of the location, the weather series and the planes, so every baseline and scenario of the same location reuses
+them.
+
+The TMY downloaded by generate_demand_inputs is cached in the same folder, by rounded location and API version.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pvlib.iotools import get_pvgis_tmy
+from pvlib.irradiance import get_total_irradiance
+from pvlib.location import Location
+
+from pvgis_cache import PVGISCache, pvgis_cache, read_seed_tmy, SEED_TMY_PATH
+
+# Azimuths (degrees from north) of the façades
+FACADE_ORIENTATIONS = {
+    'rad_n': 0,
+    'rad_s': 180,
+    'rad_e': 90,
+    'rad_o': 270
+}
+# Tilt of vertical surfaces
+FACADE_TILT = 90
+# PVGIS TMY columns (map_variables=False) of the beam normal, global horizontal and diffuse horizontal irradiance
+DNI_COLUMN, GHI_COLUMN, DHI_COLUMN = 'Gb(n)', 'G(h)', 'Gd(h)'
+# Bump it when the calculation of the irradiance changes, the disk entries of older versions are not used
+IRRADIANCE_FORMAT_VERSION = 1
+TMY = "tmy"
+# Solar positions kept in memory (one per location and TMY)
+MAX_CACHED_POSITIONS = 16
+
+
+def _location_request(latitude, longitude, altitude):
+    # exact coordinates: the solar position is not calculated for a rounded location
+    return {"latitude": float(latitude), "longitude": float(longitude),
+            "altitude": None if altitude is None else float(altitude)}
+
+
+def _hash_series(digest, times, *series):
+    times = pd.DatetimeIndex(times)
+    digest.update(f"{times.tz}".encode())
+    digest.update(times.asi8.tobytes())
+    for values in series:
+        digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+
+
+def solar_position_key(latitude, longitude, altitude, times):
+    digest = hashlib.sha256(json.dumps(_location_request(latitude, longitude, altitude), sort_keys=True).encode())
+    _hash_series(digest, times)
+    return digest.hexdigest()[:32]
+
+
+def irradiance_key(latitude, longitude, altitude, weather, planes):
+    """
+    Content address of the irradiance of some planes: sha256 of the location, the planes, the format version and the
+    hours and values of the weather series
+    """
+    request = _location_request(latitude, longitude, altitude)
+    request["planes"] = sorted([name, float(tilt), float(azimuth)] for name, (tilt, azimuth) in planes.items())
+    request["format_version"] = IRRADIANCE_FORMAT_VERSION
+    digest = hashlib.sha256(json.dumps(request, sort_keys=True).encode())
+    _hash_series(digest, weather.index, weather[DNI_COLUMN], weather[GHI_COLUMN], weather[DHI_COLUMN])
+    return "irradiance_" + digest.hexdigest()[:32]
+
+
+def batch_irradiance(planes, solar_position, weather):
+    """
+    Total irradiance (W/m²) of several planes in one call: the planes are the rows, the hours the columns
+
+    Parameters
+    ----------
+    planes: {name: (tilt, azimuth)} in degrees
+    solar_position: DataFrame with the "apparent_zenith" and "azimuth" of every hour
+    weather: DataFrame with the Gb(n), G(h) and Gd(h) of the same hours
+
+    Returns
+    -------
+    {name: array of poa_global}, the same values as one get_total_irradiance call per plane
+    """
+    names = list(planes)
+    if not names:
+        return {}
+    tilts = np.array([planes[name][0] for name in names], dtype=float)[:, np.newaxis]
+    azimuths = np.array([planes[name][1] for name in names], dtype=float)[:, np.newaxis]
+
+    def row(values):
+        return np.asarray(values, dtype=float)[np.newaxis, :]
+
+    irradiance = get_total_irradiance(
+        surface_tilt=tilts,
+        surface_azimuth=azimuths,
+        solar_zenith=row(solar_position['apparent_zenith']),  # The angles are in degrees.
+        solar_azimuth=row(solar_position['azimuth']),
+        dni=row(weather[DNI_COLUMN]),  # units: W/m2
+        ghi=row(weather[GHI_COLUMN]),
+        dhi=row(weather[DHI_COLUMN]),
+    )
+    poa_global = np.broadcast_to(irradiance['poa_global'], (len(names), len(weather)))
+    return {name: poa_global[i].copy() for i, name in enumerate(names)}
+
+
+class IrradianceService:
+    def __init__(self, cache=None):
+        """
+        :param cache: PVGISCache whose folder keeps the irradiance and the TMYs, the shared one by default
+        """
+        self.cache = cache or pvgis_cache
+        self._positions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def solar_position(self, latitude, longitude, altitude, times):
+        """
+        Apparent zenith and azimuth of the sun at the given hours, calculated once per location and hours.
+        altitude None is looked up by pvlib (as Location(latitude, longitude) does)
+        """
+        key = solar_position_key(latitude, longitude, altitude, times)
+        with self._lock:
+            if key in self._positions:
+                self._positions.move_to_end(key)
+                return self._positions[key]
+        site = Location(latitude, longitude, altitude=altitude)  # Location class sets times as UTC
+        solar_position = site.get_solarposition(times=times)[['apparent_zenith', 'azimuth']]
+        with self._lock:
+            self._positions[key] = solar_position
+            while len(self._positions) > MAX_CACHED_POSITIONS:
+                self._positions.popitem(last=False)
+        return solar_position
+
+    def plane_irradiance(self, latitude, longitude, altitude, weather, planes):
+        """
+        Total irradiance of several planes, from the cache when possible
+
+        Parameters
+        ----------
+        latitude, longitude, altitude: location of the TMY (altitude None is looked up by pvlib)
+        weather: TMY DataFrame (PVGIS names) with a datetime index
+        planes: {name: (tilt, azimuth)} in degrees
+
+        Returns
+        -------
+        {name: array of poa_global} (shared with the cache, do not modify them)
+        """
+        key = irradiance_key(latitude, longitude, altitude, weather, planes)
+        irradiance = self.cache.load_key(key)
+        if irradiance is None:
+            solar_position = self.solar_position(latitude, longitude, altitude, weather.index)
+            irradiance = batch_irradiance(planes, solar_position, weather)
+            self.cache.store_key(key, irradiance)
+        return irradiance
+
+    def facade_irradiance(self, latitude, longitude, altitude, weather, tilt_angle=FACADE_TILT,
+                          orientations=None):
+        """
+        Irradiance of the façades as lists, {"rad_n": [...], "rad_s": [...], "rad_e": [...], "rad_o": [...]}
+        """
+        orientations = FACADE_ORIENTATIONS if orientations is None else orientations
+        planes = {name: (tilt_angle, azimuth) for name, azimuth in orientations.items()}
+        irradiance = self.plane_irradiance(latitude, longitude, altitude, weather, planes)
+        return {name: irradiance[name].tolist() for name in orientations}
+
+    def tmy(self, latitude, longitude, url):
+        """
+        Response of get_pvgis_tmy(map_variables=False) for a location, downloaded once per rounded location and API
+        version. In offline mode the nearest cached TMY (or the local EPW file) is used
+        """
+        api_version = url.rstrip("/").rsplit("/", 1)[-1]
+        tmy_cache = PVGISCache(self.cache.cache_dir, api_version=api_version, offline=self.cache.offline)
+        tmy_response = tmy_cache.load(latitude, longitude, 0, kind=TMY)
+        if tmy_response is not None:
+            return tmy_response
+        if tmy_cache.offline:
+            tmy_response, metadata = tmy_cache.nearest(latitude, longitude, 0, kind=TMY)
+            if tmy_response is None:
+                if not os.path.exists(SEED_TMY_PATH):
+                    raise RuntimeError(f"PVGIS offline mode: no cached TMY for ({latitude}, {longitude})")
+                tmy_response = read_seed_tmy()
+                location = tmy_response[2]["location"]
+                tmy_cache.store(location["latitude"], location["longitude"], 0, tmy_response, kind=TMY,
+                                source=os.path.basename(SEED_TMY_PATH))
+            print(f"PVGIS offline mode: TMY of {tmy_response[2]['location']} used for ({latitude}, {longitude})")
+            return tmy_response
+        tmy_response = get_pvgis_tmy(latitude, longitude, map_variables=False, url=url)
+        tmy_cache.store(latitude, longitude, 0, tmy_response, kind=TMY)
+        return tmy_response
+
+
+# Shared by the whole process
+irradiance_service = IrradianceService()
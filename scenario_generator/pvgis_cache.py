@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Disk cache of the PVGIS calls of call_PVGIS.
+
+Two kinds of entries are stored, both addressed by a hash of the rounded latitude/longitude, the tilt and the PVGIS
+API version:
+    - raw: the responses of get_pvgis_hourly and get_pvgis_tmy, so the derived series can be recalculated without
+      calling PVGIS again
+    - derived: the outputs of call_PVGIS (irradiance per orientation, PV kWh/kWp profile, midday solar elevation,
+      T2m and wind potential). Their key also includes DERIVED_FORMAT_VERSION, bump it when the derivation changes
+
+Every entry is written to a temporary file of the cache folder and then renamed (os.replace is atomic), so several
+processes can share the folder: a reader sees either the whole entry or no entry.
+
+In offline mode PVGIS is never called. The cache can be seeded with the local TMY (data/tmy_pvgis.epw) and hourly
+series (data/seriescalc_pvgis.csv) files, and a location without entry uses the nearest cached location.
+"""
+import glob
+import hashlib
+import json
+import math
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+PVGIS_API_VERSION = "v5_3"
+# 2 decimals are ~1 km, below the resolution of the PVGIS radiation databases
+COORDINATE_DECIMALS = 2
+TILT_DECIMALS = 1
+DERIVED_FORMAT_VERSION = 1
+HOURLY_YEAR = 2023  # year requested to get_pvgis_hourly by call_PVGIS
+
+CACHE_DIR_VARIABLE = "ENPOWER_PVGIS_CACHE_DIR"
+OFFLINE_VARIABLE = "ENPOWER_PVGIS_OFFLINE"
+# user cache folder (XDG_CACHE_HOME or ~/.cache), outside the source tree
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                                 "enpower", "pvgis")
+SEED_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SEED_TMY_PATH = os.path.join(SEED_DATA_DIR, "tmy_pvgis.epw")
+SEED_SERIES_PATH = os.path.join(SEED_DATA_DIR, "seriescalc_pvgis.csv")
+
+RAW = "raw"
+DERIVED = "derived"
+# PVGIS TMY names (map_variables=False) of the EPW columns read by pvlib
+EPW_TO_PVGIS_TMY = {
+    "temp_air": "T2m",
+    "relative_humidity": "RH",
+    "ghi": "G(h)",
+    "dni": "Gb(n)",
+    "dhi": "Gd(h)",
+    "ghi_infrared": "IR(h)",
+    "wind_speed": "WS10m",
+    "wind_direction": "WD10m",
+    "atmospheric_pressure": "SP",
+}
+SERIESCALC_COLUMNS = ["time", "poa_direct", "poa_sky_diffuse", "poa_ground_diffuse", "solar_elevation", "temp_air",
+                      "wind_speed", "Int"]
+
+
+def cache_key(latitude, longitude, tilt_angle, api_version=PVGIS_API_VERSION, kind=RAW):
+    """
+    Content address of an entry: sha256 of the canonical (rounded) request
+    """
+    request = {
+        "latitude": round(float(latitude), COORDINATE_DECIMALS),
+        "longitude": round(float(longitude), COORDINATE_DECIMALS),
+        "tilt_angle": round(float(tilt_angle), TILT_DECIMALS),
+        "api_version": api_version,
+        "kind": kind,
+    }
+    if kind == DERIVED:
+        request["format_version"] = DERIVED_FORMAT_VERSION
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _environment_flag(name):
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class PVGISCache:
+    def __init__(self, cache_dir=None, api_version=PVGIS_API_VERSION, offline=None):
+        """
+        :param cache_dir: folder of the entries, ENPOWER_PVGIS_CACHE_DIR or ~/.cache/enpower/pvgis (under
+        XDG_CACHE_HOME if set) by default
+        :param api_version: PVGIS API version used for the calls, part of the keys
+        :param offline: True to never call PVGIS, ENPOWER_PVGIS_OFFLINE by default
+        """
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_VARIABLE) or DEFAULT_CACHE_DIR
+        self.api_version = api_version
+        self.offline = _environment_flag(OFFLINE_VARIABLE) if offline is None else offline
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}  # entries already read by this process
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"https://re.jrc.ec.europa.eu/api/{self.api_version}/"
+
+    def _path(self, key, extension="pkl"):
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def _write_atomic(self, path, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def load(self, latitude, longitude, tilt_angle, kind=RAW):
+        """
+        Cached entry of a request, None if there is none (or it cannot be read)
+        """
+        key = cache_key(latitude, longitude, tilt_angle, self.api_version, kind)
+        return self.load_key(key)
+
+    def load_key(self, key):
+        """
+        Entry of a key (memory first, then the cache folder), None if there is none
+        """
+        with self._lock:
+            if key in self._memory:
+                self.hits += 1
+                return self._memory[key]
+        try:
+            with open(self._path(key), "rb") as file:
+                entry = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self._memory[key] = entry
+            self.hits += 1
+        return entry
+
+    def store(self, latitude, longitude, tilt_angle, entry, kind=RAW, source="PVGIS"):
+        """
+        Writes an entry and its metadata (used to find the nearest cached location)
+        """
+        key = cache_key(latitude, longitude, tilt_angle, self.api_version, kind)
+        self._write_atomic(self._path(key), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        metadata = {
+            "key": key,
+            "kind": kind,
+            "latitude": round(float(latitude), COORDINATE_DECIMALS),
+            "longitude": round(float(longitude), COORDINATE_DECIMALS),
+            "tilt_angle": round(float(tilt_angle), TILT_DECIMALS),
+            "api_version": self.api_version,
+            "source": source,
+        }
+        if kind == DERIVED:
+            metadata["format_version"] = DERIVED_FORMAT_VERSION
+        self._write_atomic(self._path(key, "json"), json.dumps(metadata).encode("utf-8"))
+        with self._lock:
+            self._memory[key] = entry
+        return key
+
+    def store_key(self, key, entry):
+        """
+        Writes an entry addressed by its own key, without metadata (e.g. series derived from cached entries, see
+        irradiance_service.py). It is never used as the nearest location
+        """
+        self._write_atomic(self._path(key), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._memory[key] = entry
+        return key
+
+    def entries(self):
+        """
+        Metadata of all the entries of the cache folder
+        """
+        metadata = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.json")):
+            try:
+                with open(path, "r") as file:
+                    metadata.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return metadata
+
+    def nearest(self, latitude, longitude, tilt_angle, kind=RAW):
+        """
+        Entry of the nearest cached location with the same tilt and API version, as (entry, metadata).
+        (None, None) if there is none
+        """
+        tilt_angle = round(float(tilt_angle), TILT_DECIMALS)
+        candidates = [metadata for metadata in self.entries()
+                      if metadata.get("kind") == kind and metadata.get("tilt_angle") == tilt_angle
+                      and metadata.get("api_version") == self.api_version
+                      and metadata.get("format_version", DERIVED_FORMAT_VERSION) == DERIVED_FORMAT_VERSION]
+        if not candidates:
+            return None, None
+        metadata = min(candidates, key=lambda candidate: _distance_km(latitude, longitude, candidate["latitude"],
+                                                                      candidate["longitude"]))
+        return self.load_key(metadata["key"]), metadata
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory = {}
+
+
+def _distance_km(latitude_1, longitude_1, latitude_2, longitude_2):
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(math.radians, (latitude_1, longitude_1, latitude_2,
+                                                                          longitude_2))
+    haversine = (math.sin((latitude_2 - latitude_1) / 2) ** 2
+                 + math.cos(latitude_1) * math.cos(latitude_2) * math.sin((longitude_2 - longitude_1) / 2) ** 2)
+    return 2 * 6371 * math.asin(math.sqrt(haversine))
+
+
+def read_seed_tmy(tmy_path=SEED_TMY_PATH):
+    """
+    TMY of an EPW file as the response of get_pvgis_tmy(map_variables=False)
+
+    Returns
+    -------
+    tmy_data, months_selected, inputs, meta
+    """
+    from pvlib.iotools import read_epw
+
+    epw_data, epw_meta = read_epw(tmy_path)
+    tmy_data = epw_data[list(EPW_TO_PVGIS_TMY)].rename(columns=EPW_TO_PVGIS_TMY)
+    # PVGIS gives the TMY in UTC
+    tmy_data.index = tmy_data.index.tz_convert("UTC")
+    tmy_data.index.name = "time(UTC)"
+    months_selected = [{"month": int(month), "year": int(year)}
+                       for month, year in epw_data.groupby(epw_data.index.month)["year"].first().items()]
+    inputs = {"location": {"latitude": epw_meta["latitude"], "longitude": epw_meta["longitude"],
+                           "elevation": epw_meta["altitude"]}}
+    meta = {"source": os.path.basename(tmy_path)}
+    return tmy_data, months_selected, inputs, meta
+
+
+def read_seed_hourly(series_path=SEED_SERIES_PATH, peak_power_kw=1, year=HOURLY_YEAR):
+    """
+    Hourly series of a PVGIS seriescalc file (components, without PV calculation) as the response of
+    get_pvgis_hourly(components=True, pvcalculation=True, map_variables=True)
+
+    The file has no PV power, so P is estimated with PVWatts (pdc0 = peak power, -0.4 %/ºC) with the Faiman cell
+    temperature, for a system without losses as requested by call_PVGIS. The times are moved to the requested year.
+
+    Returns
+    -------
+    data, inputs, meta
+    """
+    from pvlib.pvsystem import pvwatts_dc
+    from pvlib.temperature import faiman
+
+    with open(series_path, "r") as file:
+        slope = float(file.readline())
+        azimuth = float(file.readline())
+    data = pd.read_csv(series_path, skiprows=2, header=None, names=SERIESCALC_COLUMNS)
+    time = pd.to_datetime(data.pop("time"), format="%Y%m%d:%H%M", utc=True)
+    time = time + pd.DateOffset(years=year - int(time.dt.year.iloc[0]))
+    data.index = pd.DatetimeIndex(time, name="time")
+    poa_global = data[["poa_direct", "poa_sky_diffuse", "poa_ground_diffuse"]].sum(axis=1)
+    temp_cell = faiman(poa_global, data["temp_air"], data["wind_speed"])
+    data["P"] = np.maximum(pvwatts_dc(poa_global, temp_cell, pdc0=peak_power_kw * 1000, gamma_pdc=-0.004), 0)
+    inputs = {"mounting_system": {"fixed": {"slope": {"value": slope}, "azimuth": {"value": azimuth}}},
+              "pv_module": {"peak_power": peak_power_kw, "system_loss": 0}}
+    meta = {"source": os.path.basename(series_path)}
+    return data, inputs, meta
+
+
+def seed_offline_cache(cache=None, tmy_path=SEED_TMY_PATH, series_path=SEED_SERIES_PATH, tilt_angle=None):
+    """
+    Stores the local TMY and hourly series files as a raw entry, at the location of the EPW file
+
+    Parameters
+    ----------
+    cache: PVGISCache, the shared one by default
+    tmy_path: EPW file of the TMY
+    series_path: seriescalc file of the hourly series (same location as the TMY)
+    tilt_angle: tilt of the entry, the slope of the seriescalc file by default
+
+    Returns
+    -------
+    Key of the raw entry
+    """
+    cache = cache or pvgis_cache
+    tmy_response = read_seed_tmy(tmy_path)
+    hourly_response = read_seed_hourly(series_path)
+    if tilt_angle is None:
+        tilt_angle = hourly_response[1]["mounting_system"]["fixed"]["slope"]["value"]
+    location = tmy_response[2]["location"]
+    entry = {"hourly": hourly_response, "tmy": tmy_response}
+    return cache.store(location["latitude"], location["longitude"], tilt_angle, entry, kind=RAW,
+                       source=f"{os.path.basename(tmy_path)}, {os.path.basename(series_path)}")
+
+
+# Shared by the whole process
+pvgis_cache = PVGISCache()
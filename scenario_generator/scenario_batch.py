@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation of many scenarios (recommendation sets) of the same community in one call.
+
+The inputs that do not depend on the actions (centroid, PVGIS data, actions to generation systems table) are prepared
+once and shared by all the scenarios, and the baseline buildings are evaluated once: their KPI results seed the
+building results cache of every worker, so a scenario only evaluates the buildings its actions changed. The
+scenarios are evaluated in worker processes and the community KPIs are returned as a table ranked by one KPI.
+"""
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import helpers.constants as cte
+from get_new_context import prepare_scenario_invariants, derive_scenario_context
+from kpi_module.community_kpi_engine import CommunityKPIEngine, building_results_cache
+
+# Hourly KPIs with these units are averaged in the table, the rest are summed over the year
+AVERAGED_UNITS = (cte.AU, cte.PERCENT)
+BASELINE = "baseline"
+
+
+class ScenarioEvaluator:
+    def __init__(self, goal, community_context, invariants):
+        """
+        Creates and evaluates the scenarios of a community. Every scenario gets a new KPI engine, whose unchanged
+        buildings come from the building results cache (only the buildings changed by the actions are evaluated)
+        :param goal: goal of the scenarios, as in resbased_generator_context_creation
+        :param community_context: baseline community context, it is not modified
+        :param invariants: output of prepare_scenario_invariants for the community
+        """
+        self.goal = goal
+        self.community_context = community_context
+        self.invariants = invariants
+
+    def evaluate(self, recommendations_dic, keep_context=True):
+        """
+        Returns
+        -------
+        scenario context (None if keep_context is False), name of the scenario, community KPIs
+        """
+        # the scenario only stores what the actions change, the rest is shared with the baseline
+        scenario_context = derive_scenario_context(self.goal, self.community_context, recommendations_dic,
+                                                   self.invariants)
+        community_indicators = CommunityKPIEngine(scenario_context).community_KPIs()
+        if keep_context:
+            return scenario_context.to_dict(), scenario_context.get("name"), community_indicators
+        return None, scenario_context.get("name"), community_indicators
+
+
+_worker_evaluator = None
+
+
+def initialise_scenario_worker(goal, community_context, invariants, baseline_results):
+    """
+    Keeps the community and its invariants in the worker process and seeds its building results cache with the
+    baseline buildings
+    """
+    global _worker_evaluator
+    for key, result in baseline_results:
+        building_results_cache.put(key, result)
+    _worker_evaluator = ScenarioEvaluator(goal, community_context, invariants)
+
+
+def evaluate_scenario_task(task):
+    index, recommendations_dic, keep_context = task
+    return (index,) + _worker_evaluator.evaluate(recommendations_dic, keep_context)
+
+
+def summarise_community_KPIs(community_indicators):
+    """
+    One value per KPI: hourly series are summed over the year (averaged for ratios), scalars are kept
+    """
+    summary = {}
+    for name, indicator in community_indicators.items():
+        value = indicator["value"]
+        if isinstance(value, list):
+            if not value:
+                continue
+            value = sum(value) / len(value) if indicator.get("unit") in AVERAGED_UNITS else sum(value)
+        summary[name] = float(value)
+    return summary
+
+
+def rank_scenarios(rows, rank_by=cte.TOTAL_PRIMARY_ENERGY_NAME, ascending=True):
+    """
+    Sorts the rows of the table by a KPI and numbers them, rows without the KPI go last
+    """
+    def sort_key(row):
+        value = row.get(rank_by)
+        if value is None or math.isnan(value):
+            return (1, 0)
+        return (0, value if ascending else -value)
+
+    ranked = sorted(rows, key=sort_key)
+    for rank, row in enumerate(ranked, start=1):
+        row["rank"] = rank
+    return ranked
+
+
+def evaluate_scenario_batch(goal, community_context, recommendation_sets, rank_by=cte.TOTAL_PRIMARY_ENERGY_NAME,
+                            ascending=True, parallel=True, max_workers=None, keep_contexts=True):
+    """
+    Creates and evaluates several scenarios of the same community
+
+    Parameters
+    ----------
+    goal: goal of the scenarios, as in resbased_generator_context_creation
+    community_context: baseline community context (building_asset_context structure), it is not modified
+    recommendation_sets: list of recommendations_dic, e.g. subsets of the output of
+        res_based_generator_list_technologies
+    rank_by: name of the community KPI used to rank the scenarios
+    ascending: True if lower values of rank_by are better
+    parallel: True to evaluate the scenarios in worker processes
+    max_workers: number of workers, number of cores by default
+    keep_contexts: False to return only the KPIs (the scenario contexts are not sent back by the workers)
+
+    Returns
+    -------
+    ranked_table: list of rows (dict) sorted by rank_by, with "rank", "scenario" (index in recommendation_sets, or
+        "baseline"), "name", "recommendations" and one value per community KPI (see summarise_community_KPIs)
+    scenarios: list of (scenario context, community KPIs) in the order of recommendation_sets
+    """
+    invariants = prepare_scenario_invariants(community_context)
+    # the baseline is evaluated once, its buildings are reused by all the scenarios
+    baseline_engine = CommunityKPIEngine(community_context, parallel=parallel)
+    baseline_indicators = baseline_engine.community_KPIs()
+    baseline_results = [((content_hash, baseline_engine.timestep_count, baseline_engine.country_id), result)
+                        for content_hash, result in zip(baseline_engine.building_hashes,
+                                                        baseline_engine.building_results)]
+
+    tasks = [(index, recommendations_dic, keep_contexts)
+             for index, recommendations_dic in enumerate(recommendation_sets)]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(tasks)) if tasks else 1
+    outputs = None
+    if parallel and max_workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=initialise_scenario_worker,
+                                     initargs=(goal, community_context, invariants, baseline_results)) as executor:
+                outputs = list(executor.map(evaluate_scenario_task, tasks))
+        except (BrokenProcessPool, OSError) as error:
+            print(f"Process pool not available ({error}), scenarios evaluated serially")
+    if outputs is None:
+        evaluator = ScenarioEvaluator(goal, community_context, invariants)
+        outputs = [(index,) + evaluator.evaluate(recommendations_dic, keep_context)
+                   for index, recommendations_dic, keep_context in tasks]
+
+    rows = [dict(scenario=BASELINE, name=community_context.get("name"), recommendations={},
+                 **summarise_community_KPIs(baseline_indicators))]
+    scenarios = []
+    for index, scenario_context, name, community_indicators in outputs:
+        rows.append(dict(scenario=index, name=name, recommendations=recommendation_sets[index],
+                         **summarise_community_KPIs(community_indicators)))
+        scenarios.append((scenario_context, community_indicators))
+    return rank_scenarios(rows, rank_by, ascending), scenarios
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Copy-on-write community contexts for the scenarios.
+
+A ScenarioContext is a read-only view of a parent context (the baseline dictionary or another ScenarioContext) plus
+the changes of the scenario: the top-level keys it replaces and, per building, the fields of the building_asset_context
+it replaces. Everything else, in particular the 8760 values series of consumptions, demands and assets, is shared with
+the parent by reference, so the memory of a scenario grows with what its actions change and not with the size of the
+community. The parent is never modified.
+
+The buildings of the view are shallow dictionaries built on first access. They (and their series) are shared with the
+parent, so they must be treated as read-only: a change is a new scenario, see derive().
+
+The scenario generator gives every building of a scenario new ids and names (REFERENCE_FIELDS, and the id_temp of
+its assets). changed_buildings only lists the buildings whose content changed, the ones the KPIs have to be
+recalculated for.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+BUILDING_ASSET_CONTEXT = "building_asset_context"
+# Fields of a building_asset_context that identify the building in a context, they do not change its content
+REFERENCE_FIELDS = ("id", "id_temp", "name", "context_id", "building_consumption_id", "building_consumption_id_temp",
+                    "generation_system_profile_id")
+# Keys ignored when the nested values (e.g. the energy assets) are compared
+REFERENCE_KEYS = ("id_temp",)
+
+
+class _Removed:
+    def __repr__(self):
+        return "REMOVED"
+
+
+# Value of a change that removes the key
+REMOVED = _Removed()
+
+
+def apply_changes(parent, changes):
+    """
+    Shallow dictionary of a parent mapping with the changes applied
+    """
+    merged = {key: value for key, value in parent.items() if changes.get(key, value) is not REMOVED}
+    merged.update({key: value for key, value in changes.items() if value is not REMOVED})
+    return merged
+
+
+def equal_values(value, parent_value):
+    """
+    True if a value of a changed context is the parent one or equal to it. Containers that share their items with the
+    parent are compared item by item by identity first, numpy arrays are compared with array_equal
+    """
+    if value is parent_value:
+        return True
+    if isinstance(value, np.ndarray) or isinstance(parent_value, np.ndarray):
+        return (isinstance(value, np.ndarray) and isinstance(parent_value, np.ndarray)
+                and np.array_equal(value, parent_value))
+    if type(value) is not type(parent_value):
+        return False
+    try:
+        return bool(value == parent_value)
+    except ValueError:
+        # numpy arrays inside the containers
+        return same_content(value, parent_value, ignored_keys=())
+
+
+def same_content(value, parent_value, ignored_keys=REFERENCE_KEYS):
+    """
+    equal_values ignoring the ignored_keys of the nested mappings (e.g. the id_temp of the energy assets)
+    """
+    if isinstance(value, Mapping) and isinstance(parent_value, Mapping):
+        keys = value.keys() - set(ignored_keys)
+        return keys == parent_value.keys() - set(ignored_keys) and all(
+            same_content(value[key], parent_value[key], ignored_keys) for key in keys)
+    if isinstance(value, (list, tuple)) and isinstance(parent_value, (list, tuple)):
+        if len(value) != len(parent_value):
+            return False
+        if ignored_keys and not (value and isinstance(value[0], (Mapping, list, tuple))):
+            # e.g. a series, nothing to ignore
+            return equal_values(value, parent_value)
+        return all(same_content(item, parent_item, ignored_keys) for item, parent_item in zip(value, parent_value))
+    return equal_values(value, parent_value)
+
+
+def diff_changes(parent, changed):
+    """
+    Changes (replaced keys, REMOVED keys) that turn the parent mapping into the changed one. Values equal to the
+    parent ones are not changes, the series shared with the parent are compared by identity only
+    """
+    changes = {key: value for key, value in changed.items()
+               if key not in parent or not equal_values(value, parent[key])}
+    changes.update({key: REMOVED for key in parent if key not in changed})
+    return changes
+
+
+def share_unchanged(parent, changed):
+    """
+    Replaces the values of a changed copy of a dictionary that are equal to the parent ones by the parent objects
+    (e.g. a series set to 0 that was already 0). Returns the parent itself if nothing changed
+    """
+    if parent is None or changed is parent:
+        return changed
+    for key, value in changed.items():
+        parent_value = parent.get(key)
+        if value is not parent_value and type(value) is type(parent_value) and value == parent_value:
+            changed[key] = parent_value
+    if changed.keys() == parent.keys() and all(changed[key] is parent[key] for key in changed):
+        return parent
+    return changed
+
+
+class ScenarioContext(Mapping):
+    def __init__(self, parent, changes=None, building_changes=None):
+        """
+        :param parent: community context (dictionary or ScenarioContext) the scenario derives from
+        :param changes: {top-level key: new value or REMOVED}. The changes of the buildings are usually given per
+        building instead, building_asset_context is only a change if buildings are added or removed
+        :param building_changes: {building index: {field: new value or REMOVED}} for the buildings the scenario changes
+        """
+        self.parent = parent
+        self.changes = dict(changes or {})
+        self.building_changes = {b: dict(fields) for b, fields in (building_changes or {}).items() if fields}
+        self._buildings = None
+
+    @classmethod
+    def from_contexts(cls, parent, changed):
+        """
+        ScenarioContext storing only the differences between a parent context and a changed copy of it (a shallow
+        copy whose changed buildings are new dictionaries)
+        """
+        changes = diff_changes({key: value for key, value in parent.items() if key != BUILDING_ASSET_CONTEXT},
+                               {key: value for key, value in changed.items() if key != BUILDING_ASSET_CONTEXT})
+        parent_buildings = parent.get(BUILDING_ASSET_CONTEXT)
+        changed_buildings = changed.get(BUILDING_ASSET_CONTEXT)
+        if not isinstance(parent_buildings, list) or not isinstance(changed_buildings, list) \
+                or len(parent_buildings) != len(changed_buildings):
+            # buildings added or removed: the list is a plain change
+            changes[BUILDING_ASSET_CONTEXT] = changed_buildings
+            return cls(parent, changes)
+        building_changes = {}
+        for b, (parent_building, changed_building) in enumerate(zip(parent_buildings, changed_buildings)):
+            if changed_building is not parent_building:
+                building_changes[b] = diff_changes(parent_building, changed_building)
+        return cls(parent, changes, building_changes)
+
+    def derive(self, changes=None, building_changes=None):
+        """
+        New scenario on top of this one
+        """
+        return ScenarioContext(self, changes, building_changes)
+
+    @property
+    def changed_buildings(self):
+        """
+        Indices of the buildings whose content the scenario changes. Buildings that only get new ids or names
+        (REFERENCE_FIELDS, id_temp of the assets) are not included
+        """
+        parent_buildings = self.parent.get(BUILDING_ASSET_CONTEXT)
+        return [b for b, fields in sorted(self.building_changes.items())
+                if any(field not in REFERENCE_FIELDS
+                       and not (field in parent_buildings[b] and same_content(value, parent_buildings[b][field]))
+                       for field, value in fields.items())]
+
+    def buildings(self):
+        """
+        List of building_asset_context of the scenario: the parent ones, or shallow copies with the changes applied
+        """
+        if self._buildings is None:
+            if BUILDING_ASSET_CONTEXT in self.changes:
+                self._buildings = self.changes[BUILDING_ASSET_CONTEXT]
+            else:
+                parent_buildings = self.parent.get(BUILDING_ASSET_CONTEXT)
+                if not isinstance(parent_buildings, list):
+                    self._buildings = parent_buildings
+                else:
+                    self._buildings = [apply_changes(building, self.building_changes[b])
+                                       if b in self.building_changes else building
+                                       for b, building in enumerate(parent_buildings)]
+        return self._buildings
+
+    def __getitem__(self, key):
+        value = self.changes.get(key, self.parent[key] if key in self.parent else REMOVED)
+        if value is REMOVED:
+            raise KeyError(key)
+        if key == BUILDING_ASSET_CONTEXT:
+            return self.buildings()
+        return value
+
+    def __iter__(self):
+        for key in self.parent:
+            if self.changes.get(key) is not REMOVED:
+                yield key
+        for key, value in self.changes.items():
+            if key not in self.parent and value is not REMOVED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """
+        Plain dictionary (e.g. to be serialised or transformed), the unchanged buildings and series are still shared
+        with the parent
+        """
+        context = dict(self.items())
+        if isinstance(context.get(BUILDING_ASSET_CONTEXT), list):
+            context[BUILDING_ASSET_CONTEXT] = list(context[BUILDING_ASSET_CONTEXT])
+        return context
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Sizing statistics of hourly demands, for one building or for a (buildings x hours) matrix in one call.
+
+The new heating and DHW systems are sized from the peak of the demand (70 % and 90 % of the peak) and, if needed, from
+points of the load duration curve (the demand exceeded during a number of hours) or from the demand filtered by the
+outdoor temperature (energy signature). None of them needs the whole curve sorted: the peak is a maximum and the points
+of the curve are found by partial selection (numpy partition), which is linear in the number of hours.
+"""
+import numpy as np
+
+# Fractions of the peak used to size the systems
+CAPACITY_FRACTIONS = (0.7, 0.9)
+# Outdoor temperatures (°C) below which the demand is heating demand, and above which it is cooling demand
+HEATING_SIGNATURE_TEMPERATURE = 18
+COOLING_SIGNATURE_TEMPERATURE = 26
+HEATING_MODE = 0
+COOLING_MODE = 1
+
+
+def as_demand_matrix(demands):
+    """
+    (buildings x hours) float array of one hourly demand (a list, Series or array) or of a list of them.
+    Missing values (None) are NaN
+    """
+    matrix = np.asarray(demands, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    return matrix
+
+
+def peak_loads(demands):
+    """
+    Peak of every row of the demand matrix, NaN values ignored (NaN for an empty or all NaN row)
+    """
+    matrix = as_demand_matrix(demands)
+    if matrix.shape[1] == 0:
+        return np.full(matrix.shape[0], np.nan)
+    peaks = np.max(np.where(np.isnan(matrix), -np.inf, matrix), axis=1)
+    peaks[np.isneginf(peaks)] = np.nan
+    return peaks
+
+
+def capacities_from_peaks(peaks, fractions=CAPACITY_FRACTIONS):
+    """
+    {"peak": peaks, "capacity_70": 0.7 * peaks, "capacity_90": 0.9 * peaks} (one key per fraction)
+    """
+    capacities = {"peak": peaks}
+    for fraction in fractions:
+        capacities[f"capacity_{round(fraction * 100)}"] = fraction * peaks
+    return capacities
+
+
+def load_duration_values(demands, hours):
+    """
+    Points of the load duration curve: the demand exceeded (or equalled) during the given numbers of hours, for every
+    row. Found by partial selection, the curve is not sorted
+
+    Parameters
+    ----------
+    demands: hourly demand or (buildings x hours) matrix
+    hours: list of numbers of hours (1 is the peak), clipped to the length of the series
+
+    Returns
+    -------
+    (buildings x len(hours)) array
+    """
+    matrix = as_demand_matrix(demands)
+    n_hours = matrix.shape[1]
+    hours = np.clip(np.asarray(hours, dtype=int), 1, max(n_hours, 1))
+    if n_hours == 0:
+        return np.full((matrix.shape[0], len(hours)), np.nan)
+    # k-th largest value = (n - k)-th smallest, NaN go first so they are never selected before real values
+    filled = np.where(np.isnan(matrix), -np.inf, matrix)
+    kth = n_hours - hours
+    values = np.partition(filled, np.unique(kth), axis=1)[:, kth]
+    values[np.isneginf(values)] = np.nan
+    return values
+
+
+def load_duration_quantiles(demands, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Quantiles of the demand of every row, i.e. points of the load duration curve given as the fraction of the hours
+    with a lower demand. (buildings x len(quantiles)) array
+    """
+    return np.nanquantile(as_demand_matrix(demands), quantiles, axis=1).T
+
+
+def signature_mask(outdoor_temperatures, mode=HEATING_MODE):
+    """
+    Hours of the energy signature: outdoor temperature below 18 °C for heating (mode 0), above 26 °C for cooling
+    """
+    outdoor_temperatures = np.asarray(outdoor_temperatures, dtype=float)
+    if mode == HEATING_MODE:
+        return outdoor_temperatures < HEATING_SIGNATURE_TEMPERATURE
+    return outdoor_temperatures > COOLING_SIGNATURE_TEMPERATURE
+
+
+def signature_demands(outdoor_temperatures, demands, mode=HEATING_MODE):
+    """
+    Demand matrix with the hours outside the energy signature set to NaN (the same temperatures for all the rows)
+    """
+    matrix = as_demand_matrix(demands)
+    mask = signature_mask(outdoor_temperatures, mode)[:matrix.shape[1]]
+    return np.where(mask, matrix[:, :len(mask)], np.nan)
+
+
+def sizing_statistics(demands, outdoor_temperatures=None, mode=HEATING_MODE, duration_hours=(),
+                      fractions=CAPACITY_FRACTIONS):
+    """
+    Sizing statistics of every row of a (buildings x hours) demand matrix
+
+    Parameters
+    ----------
+    demands: hourly demand or (buildings x hours) matrix
+    outdoor_temperatures: optional hourly outdoor temperatures, to add the statistics of the energy signature
+    mode: 0 heating (hours below 18 °C), 1 cooling (hours above 26 °C)
+    duration_hours: numbers of hours of the load duration curve points to add, e.g. (1, 100, 1000)
+    fractions: fractions of the peak of the capacities
+
+    Returns
+    -------
+    dict of arrays with one value per row: "peak", "capacity_70", "capacity_90", "duration_<hours>" and, with
+    outdoor_temperatures, the same statistics of the signature prefixed with "signature_"
+    """
+    matrix = as_demand_matrix(demands)
+    statistics = capacities_from_peaks(peak_loads(matrix), fractions)
+    if len(duration_hours):
+        values = load_duration_values(matrix, duration_hours)
+        for column, hours in enumerate(duration_hours):
+            statistics[f"duration_{hours}"] = values[:, column]
+    if outdoor_temperatures is not None:
+        signature = signature_demands(outdoor_temperatures, matrix, mode)
+        signature_statistics = capacities_from_peaks(peak_loads(signature), fractions)
+        statistics.update({f"signature_{name}": value for name, value in signature_statistics.items()})
+    return statistics
+
+
+def sizing_capacities(demand):
+    """
+    70 % and 90 % of the peak of one hourly demand, as floats (what the new heating and DHW systems are sized with)
+    """
+    capacities = capacities_from_peaks(peak_loads(demand))
+    return float(capacities["capacity_70"][0]), float(capacities["capacity_90"][0])
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Client of the ThermaGrid demand service.
+
+The GeoJSON of the community is split in chunks of buildings that are sent concurrently over one pooled HTTP session
+(the weather inputs are the same for every chunk). Every request has bounded connect/read timeouts and failed
+requests (connection errors, 429 and 5xx) are retried with exponential backoff. The features of the responses are put
+back in the order of the features sent, so the result is the same as one request with the whole community.
+
+thermagrid_stub.py is a local server with the same interface that returns synthetic profiles, to test the client
+offline.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Buildings per request
+DEFAULT_CHUNK_SIZE = 50
+# Requests sent at the same time
+DEFAULT_MAX_WORKERS = 4
+# Seconds to connect and to wait for the response of a chunk
+DEFAULT_TIMEOUT = (10, 300)
+DEFAULT_RETRIES = 3
+# Waits of backoff_factor * 2 ** (retry - 1) seconds between the retries
+DEFAULT_BACKOFF_FACTOR = 1.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def chunk_features(geojson_object, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Splits a FeatureCollection in FeatureCollections of at most chunk_size features (the other keys, e.g. crs, are
+    kept in every chunk)
+    """
+    features = geojson_object.get("features", [])
+    chunk_size = max(1, int(chunk_size))
+    chunks = []
+    for start in range(0, max(len(features), 1), chunk_size):
+        chunk = {key: value for key, value in geojson_object.items() if key != "features"}
+        chunk["features"] = features[start:start + chunk_size]
+        chunks.append(chunk)
+    return chunks
+
+
+def reassemble_features(sent_chunks, received_chunks):
+    """
+    One FeatureCollection with the features of the responses in the order of the features sent. Inside a chunk the
+    features are matched by id when the service returns the ids sent, otherwise the order of the response is kept
+    """
+    features = []
+    for sent, received in zip(sent_chunks, received_chunks):
+        sent_features = sent.get("features", [])
+        received_features = received.get("features", [])
+        if len(received_features) != len(sent_features):
+            raise ValueError(f"ThermaGrid returned {len(received_features)} buildings for a chunk of "
+                             f"{len(sent_features)}")
+        sent_ids = [feature.get("id") for feature in sent_features]
+        received_by_id = {feature.get("id"): feature for feature in received_features}
+        if None not in received_by_id and len(set(sent_ids)) == len(sent_ids) and set(sent_ids) == set(received_by_id):
+            received_features = [received_by_id[feature_id] for feature_id in sent_ids]
+        features.extend(received_features)
+    geojson_file = {key: value for key, value in received_chunks[0].items() if key != "features"} \
+        if received_chunks else {"type": "FeatureCollection"}
+    geojson_file["features"] = features
+    return geojson_file
+
+
+class ThermaGridClient:
+    def __init__(self, api_url, api_key, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                 timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        """
+        :param api_url: URL of the demand endpoint
+        :param api_key: value of the x-api-key header
+        :param chunk_size: buildings per request
+        :param max_workers: requests sent at the same time (and size of the connection pool)
+        :param timeout: (connect, read) timeouts in seconds of every request
+        :param retries: retries of a request after a connection error, a timeout or a 429/5xx response
+        :param backoff_factor: the retries wait backoff_factor * 2 ** (retry - 1) seconds
+        """
+        self.api_url = api_url
+        self.chunk_size = chunk_size
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'x-api-key': str(api_key)
+        })
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUS, allowed_methods=frozenset({"POST"}),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def post_chunk(self, payload):
+        response = self.session.post(self.api_url, data=json.dumps(payload), timeout=self.timeout)
+        if response.status_code != 200:
+            response.raise_for_status()
+            raise requests.HTTPError(f"Unexpected ThermaGrid response {response.status_code}", response=response)
+        return response.json()
+
+    def fetch(self, inputs_thermagrid):
+        """
+        Demands of the buildings of inputs_thermagrid (output of generate_demand_inputs: "geojson" and the weather
+        series)
+
+        Returns
+        -------
+        GeoJSON returned by ThermaGrid, with the features in the order of inputs_thermagrid["geojson"]
+        """
+        geojson_object = inputs_thermagrid["geojson"]
+        sent_chunks = chunk_features(geojson_object, self.chunk_size)
+        payloads = [dict(inputs_thermagrid, geojson=chunk) for chunk in sent_chunks]
+        if len(payloads) == 1 or self.max_workers == 1:
+            received_chunks = [self.post_chunk(payload) for payload in payloads]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(payloads))) as executor:
+                # map keeps the order of the chunks
+                received_chunks = list(executor.map(self.post_chunk, payloads))
+        return reassemble_features(sent_chunks, received_chunks)
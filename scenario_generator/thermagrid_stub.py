@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Local stub of the ThermaGrid demand service, to test and load-test ThermaGridClient offline.
+
+It accepts the same POST body as ThermaGrid (geojson, temperature and the irradiance of the façades) and returns the
+GeoJSON with synthetic hourly heating, cooling and DHW demands in the properties of every building. The heating and
+cooling follow the degree hours of the temperature received and scale with the footprint of the building, the DHW is a
+daily pattern. A latency and a rate of failed requests (503) can be set to test the timeouts and the retries.
+
+Usage:
+    python thermagrid_stub.py --port 8101
+    python thermagrid_stub.py --load-test 1000 --chunk-size 50 --workers 8
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import shapely
+from shapely.errors import GEOSException
+from shapely.geometry import shape
+
+HOURS_IN_YEAR = 8760
+HEATING_BASE_TEMPERATURE = 18
+COOLING_BASE_TEMPERATURE = 26
+# Daily DHW pattern (share of the day per hour)
+DHW_DAILY_PATTERN = np.array([1, 1, 1, 1, 1, 2, 6, 9, 7, 4, 3, 3, 4, 4, 3, 3, 3, 4, 6, 8, 7, 5, 3, 2], dtype=float)
+DHW_DAILY_PATTERN /= DHW_DAILY_PATTERN.sum()
+
+
+def synthetic_demands(feature, temperature):
+    """
+    Hourly heating, cooling and DHW demands (kWh) of a building
+    """
+    try:
+        # footprint in m², the geometries are in EPSG 4326
+        footprint = max(shapely.area(shape(feature["geometry"])) * 1.2e10, 50.0)
+    except (KeyError, TypeError, ValueError, GEOSException):
+        footprint = 100.0
+    heating = np.clip(HEATING_BASE_TEMPERATURE - temperature, 0, None) * footprint * 0.002
+    cooling = np.clip(temperature - COOLING_BASE_TEMPERATURE, 0, None) * footprint * 0.0015
+    dhw = np.resize(DHW_DAILY_PATTERN, len(temperature)) * footprint * 0.03
+    return heating, cooling, dhw
+
+
+def stub_response(body):
+    """
+    GeoJSON of the request with the synthetic demands of every building
+    """
+    temperature = np.asarray(body.get("temperature") or [10.0] * HOURS_IN_YEAR, dtype=float)
+    geojson = body["geojson"]
+    features = []
+    for feature in geojson.get("features", []):
+        heating, cooling, dhw = synthetic_demands(feature, temperature)
+        properties = dict(feature.get("properties") or {})
+        properties.setdefault("height", 6)
+        properties.update(heating=heating.round(4).tolist(), cooling=cooling.round(4).tolist(),
+                          dhw=dhw.round(4).tolist())
+        features.append(dict(feature, properties=properties))
+    return dict(geojson, features=features)
+
+
+class ThermaGridStubHandler(BaseHTTPRequestHandler):
+    # set by make_stub_server
+    latency = 0.0
+    failure_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with self.lock:
+            type(self).requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.send_error(503, "Synthetic failure")
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            response = json.dumps(stub_response(body)).encode("utf-8")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, f"Invalid request: {e}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0):
+    """
+    Stub server (not started), port 0 takes a free port. Its URL is f"http://{host}:{server.server_port}/"
+    """
+    handler = type("ThermaGridStub", (ThermaGridStubHandler,), {"latency": latency, "failure_rate": failure_rate,
+                                                               "requests_served": 0, "lock": threading.Lock()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0):
+    """
+    Starts the stub server in a background thread
+
+    Returns
+    -------
+    server (call server.shutdown() to stop it), url
+    """
+    server = make_stub_server(host, port, latency, failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/"
+
+
+def synthetic_community(n_buildings, longitude=-3.6, latitude=37.17, seed=0):
+    """
+    FeatureCollection of n_buildings square buildings around a location
+    """
+    rng = np.random.default_rng(seed)
+    features = []
+    for i in range(n_buildings):
+        x, y = longitude + rng.random() * 0.05, latitude + rng.random() * 0.05
+        d = 0.0001 + rng.random() * 0.0002
+        features.append({"id": str(i), "type": "Feature",
+                         "properties": {"id": i + 1, "use": "residential", "height": 6},
+                         "geometry": {"type": "Polygon",
+                                      "coordinates": [[[x, y], [x + d, y], [x + d, y + d], [x, y + d], [x, y]]]}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def load_test(n_buildings, chunk_size, workers, latency=0.0, failure_rate=0.0):
+    from thermagrid_client import ThermaGridClient
+
+    server, url = start_stub_server(latency=latency, failure_rate=failure_rate)
+    inputs_thermagrid = {"geojson": synthetic_community(n_buildings),
+                         "temperature": (10 + 10 * np.sin(np.arange(HOURS_IN_YEAR) / 1400)).tolist()}
+    try:
+        with ThermaGridClient(url, "stub", chunk_size=chunk_size, max_workers=workers, backoff_factor=0.1) as client:
+            start = time.perf_counter()
+            geojson_file = client.fetch(inputs_thermagrid)
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    in_order = [feature["id"] for feature in geojson_file["features"]] == \
+               [feature["id"] for feature in inputs_thermagrid["geojson"]["features"]]
+    print(f"{n_buildings} buildings, chunks of {chunk_size}, {workers} workers: {elapsed:.2f} s, "
+          f"{server.RequestHandlerClass.requests_served} requests, features in order: {in_order}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the ThermaGrid demand service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--load-test", type=int, default=0, metavar="BUILDINGS",
+                        help="run the client against a stub in this process instead of serving")
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    arguments = parser.parse_args()
+    if arguments.load_test:
+        load_test(arguments.load_test, arguments.chunk_size, arguments.workers, arguments.latency,
+                  arguments.failure_rate)
+    else:
+        server = make_stub_server(arguments.host, arguments.port, arguments.latency, arguments.failure_rate)
+        print(f"ThermaGrid stub on http://{arguments.host}:{server.server_port}/")
+        server.serve_forever()
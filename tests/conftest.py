@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# The modules import each other by top-level name (e.g. "from KPI_module import ..."), as when they are run from the
+# repository root with kpi_module and scenario_generator in the path
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "scenario_generator"), os.path.join(ROOT, "kpi_module"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+ACTIONS_TO_GENERATION_SYSTEMS_PATH = os.path.join(ROOT, "scenario_generator", "actions_to_generation_systems.csv")
+
+
+@pytest.fixture
+def offline_scenarios(monkeypatch, tmp_path):
+    """
+    Scenario generator without network: PVGIS offline mode with a new cache folder (seeded from the files of data/)
+    and the actions to generation systems table of the repository
+    """
+    import pandas as pd
+    import get_new_context
+    import scenario_generator.get_new_context
+    from pvgis_cache import pvgis_cache
+
+    monkeypatch.setattr(pvgis_cache, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(pvgis_cache, "offline", True)
+    monkeypatch.setattr(pvgis_cache, "_memory", {})
+    default_path = os.path.join(os.path.dirname(os.path.abspath(get_new_context.__file__)), "data",
+                                "actions_to_generation_systems.csv")
+    actions_to_generation_systems = pd.read_csv(ACTIONS_TO_GENERATION_SYSTEMS_PATH, encoding="utf-8-sig")
+    # module_integration imports the module with its package prefix, a second copy with its own tables
+    for module in (get_new_context, scenario_generator.get_new_context):
+        monkeypatch.setitem(module._actions_to_generation_systems, default_path, actions_to_generation_systems)
+        monkeypatch.delitem(module._action_system_indexes, default_path, raising=False)
@@ -0,0 +1,94 @@
+"""
+Synthetic community contexts of the tests: random hourly series and the energy carriers of the catalogue
+"""
+import json
+import os
+
+import numpy as np
+
+import helpers.constants as cte
+from helpers.time_series import HOURS_IN_YEAR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENERGY_CARRIER_PATH = os.path.join(ROOT, "scenario_generator", "catalogues", "energy_carrier.json")
+ELECTRICITY_ID = 12
+GAS_ID = 2
+
+with open(ENERGY_CARRIER_PATH, "r", encoding="utf-8") as file:
+    _carriers = {carrier[cte.ID]: carrier for carrier in json.load(file)}
+
+
+def series(rng, scale=1.0):
+    return (rng.random(HOURS_IN_YEAR) * scale).tolist()
+
+
+def carrier(carrier_id):
+    return dict(_carriers[carrier_id])
+
+
+def generation_system_profile(heating_id=61, heating_carrier=ELECTRICITY_ID, dhw_gas=True):
+    return {
+        cte.HEATING_SYSTEM_ID: heating_id,
+        cte.HEATING_SYSTEM: {cte.FUEL_YIELD_1: 3, cte.ENERGY_CARRIER_INPUT1_ID: heating_carrier,
+                             cte.ENERGY_CARRIER_INPUT1: carrier(heating_carrier)},
+        cte.DHW_SYSTEM_ID: 10 if dhw_gas else None,
+        cte.DHW_SYSTEM: {cte.FUEL_YIELD_1: 0.9, cte.ENERGY_CARRIER_INPUT1_ID: GAS_ID,
+                         cte.ENERGY_CARRIER_INPUT1: carrier(GAS_ID)} if dhw_gas else None,
+        cte.COOLING_SYSTEM_ID: None,
+        cte.COOLING_SYSTEM: None,
+        cte.ELECTRICITY_SYSTEM_ID: 79,
+        cte.ELECTRICITY_SYSTEM: {cte.ENERGY_CARRIER_INPUT1_ID: ELECTRICITY_ID,
+                                 cte.ENERGY_CARRIER_INPUT1: carrier(ELECTRICITY_ID)},
+    }
+
+
+def building_consumption(rng):
+    return {cte.HEAT_CONSUMPTION: series(rng), cte.DHW_CONSUMPTION: series(rng, 0.3),
+            cte.ELECTRICITY_CONSUMPTION: series(rng, 0.5), cte.COOL_CONSUMPTION: [0.0] * HOURS_IN_YEAR}
+
+
+def pv_asset(rng, pmax_scalar=3.0):
+    return {cte.GENERATION_SYSTEM_ID: 83, cte.PMAX_SCALAR: pmax_scalar,
+            cte.AVAILABILITY_TS: {cte.VALUE_INPUT1: series(rng, 0.2)}}
+
+
+def building(rng, building_id, heat_pump=False, dhw_gas=True, pv=False):
+    """
+    Building asset context with a gas (or heat pump) heating, a gas DHW boiler (or none) and optionally a PV asset
+    """
+    return {
+        cte.ID: building_id,
+        cte.GENERATION_SYSTEM_PROFILE_ID: 1,
+        cte.GENERATION_SYSTEM_PROFILE: generation_system_profile(61 if heat_pump else 20,
+                                                                 ELECTRICITY_ID if heat_pump else 5, dhw_gas),
+        cte.BUILDING_CONSUMPTION: building_consumption(rng),
+        cte.BUILDING_ENERGY_ASSET: [pv_asset(rng, 2.0 + building_id)] if pv else [],
+        cte.BUILDING: {cte.BUILDING_USE_ID: 1 + building_id % 5, cte.CONSTRUCTION_YEAR: 1990,
+                       cte.AREA: 50.0 + 30 * building_id},
+    }
+
+
+def community(building_count=6, seed=0):
+    """
+    Community context of building_count buildings, alternating gas and heat pump heating, half of them with PV
+    """
+    rng = np.random.default_rng(seed)
+    return {cte.BUILDING_ASSET_CONTEXT: [
+        building(rng, i + 1, heat_pump=i % 2 == 1, dhw_gas=i % 3 != 0, pv=i % 2 == 1) for i in range(building_count)
+    ]}
+
+
+def scenario_community(building_count=6, seed=0):
+    """
+    Community context with the building data used by the scenario generator (geometry, ids, conditioned area)
+    """
+    community_context = community(building_count, seed)
+    for i, building_asset_context in enumerate(community_context[cte.BUILDING_ASSET_CONTEXT]):
+        x, y = -3.6 + i * 0.001, 37.17
+        building_asset_context[cte.BUILDING].update({
+            cte.ID: 100 + i, "area_conditioned": 50.0 + 30 * i,
+            "geom": f"POLYGON(({x} {y}, {x + 0.0005} {y}, {x + 0.0005} {y + 0.0005}, {x} {y + 0.0005}, {x} {y}))"})
+        building_asset_context["name"] = f"building {i}"
+        building_asset_context["building_consumption_id"] = i + 1
+    community_context.update({cte.ID: 1, "name": "baseline", "node": [], "community_energy_asset": []})
+    return community_context
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+from conftest import ACTIONS_TO_GENERATION_SYSTEMS_PATH
+from context_creation import ACTION_SYSTEM_TYPES, compile_action_system_index, get_system_type_for_action
+
+SYSTEMS = list(ACTION_SYSTEM_TYPES) + ["electricity", "heating", "pv", "unknown"]
+
+
+@pytest.fixture(scope="module")
+def actions_to_generation_systems():
+    return pd.read_csv(ACTIONS_TO_GENERATION_SYSTEMS_PATH, encoding="utf-8-sig")
+
+
+def test_index_matches_the_dataframe_lookup(actions_to_generation_systems):
+    action_system_index = compile_action_system_index(actions_to_generation_systems)
+    action_keys = sorted(set(actions_to_generation_systems["action_key"].dropna().astype(int))) + [0, 999]
+    for action_key in action_keys:
+        for system in SYSTEMS:
+            assert (get_system_type_for_action(action_system_index, action_key, system)
+                    == get_system_type_for_action(actions_to_generation_systems, action_key, system)), \
+                (action_key, system)
@@ -0,0 +1,11 @@
+import pytest
+
+from catalogue_registry import generation_systems_catalogue
+from conversion_factors import get_conversion_factor_matrix
+
+
+@pytest.mark.parametrize("drop", [generation_systems_catalogue.reload, generation_systems_catalogue.invalidate])
+def test_reload_drops_the_conversion_factor_matrix(drop):
+    conversion_factor_matrix = get_conversion_factor_matrix()
+    drop()
+    assert get_conversion_factor_matrix() is not conversion_factor_matrix
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+import helpers.constants as cte
+from classes_database import BuildingEnergyAsset, availability_series
+from contexts import community, series
+from key_performance_indicators import calculate_building_final_energy
+
+SERIES = (cte.VALUE_INPUT1, cte.VALUE_INPUT2, cte.VALUE_OUTPUT1, cte.VALUE_OUTPUT2)
+
+
+def asset(demand, fuel_yield1, fuel_yield2, type, generation_system_id=61):
+    building_energy_asset = BuildingEnergyAsset(generation_system_id=generation_system_id, pmaxmin_scalar=0,
+                                                pmaxmax_scalar=5, building_asset_context_id=2, name="asset")
+    building_energy_asset.calculate_inputs_and_outputs(demand=demand, fuel_yield1=fuel_yield1,
+                                                       fuel_yield2=fuel_yield2, type=type)
+    return building_energy_asset
+
+
+def expected_series(demand, fuel_yield1, fuel_yield2, heat_pump):
+    # hour by hour, as calculate_inputs_and_outputs did (with output2 as a series)
+    input1 = [d / fuel_yield1 for d in demand]
+    input2 = [(fuel_yield1 - 1) * value for value in input1] if heat_pump else []
+    has_output2 = not heat_pump and fuel_yield2 is not None and not math.isnan(fuel_yield2)
+    output2 = [d * fuel_yield2 for d in demand] if has_output2 else []
+    return {cte.VALUE_INPUT1: input1, cte.VALUE_INPUT2: input2, cte.VALUE_OUTPUT1: demand,
+            cte.VALUE_OUTPUT2: output2}
+
+
+@pytest.mark.parametrize("fuel_yield1, fuel_yield2, type", [(3.2, None, "heat_pump"), (0.9, 0.1, "boiler"),
+                                                             (0.9, float("nan"), "boiler"), (0.9, None, "boiler")])
+def test_derived_series_are_left_out_of_the_dictionary(fuel_yield1, fuel_yield2, type):
+    demand = series(np.random.default_rng(0))
+    expected = expected_series(demand, fuel_yield1, fuel_yield2, type == "heat_pump")
+    availability_ts = asset(demand, fuel_yield1, fuel_yield2, type).to_dict()[cte.AVAILABILITY_TS]
+
+    assert availability_ts[cte.VALUE_OUTPUT1] is demand
+    assert availability_ts[cte.VALUE_INPUT1] == availability_ts[cte.VALUE_INPUT2] == []
+    assert availability_ts[cte.VALUE_OUTPUT2] == []
+    derived = availability_series(availability_ts)
+    building_energy_asset = asset(demand, fuel_yield1, fuel_yield2, type)
+    for name in SERIES:
+        np.testing.assert_allclose(derived[name], expected[name], rtol=1e-12, err_msg=name)
+        np.testing.assert_allclose(getattr(building_energy_asset, name[len("value_"):]), expected[name],
+                                   rtol=1e-12, err_msg=name)
+
+
+def test_series_set_directly_are_kept():
+    demand = [1.0, 2.0]
+    building_energy_asset = asset(demand, 2.0, None, "heat_pump")
+    building_energy_asset.input1 = [5.0, 6.0]
+    availability_ts = building_energy_asset.to_dict()[cte.AVAILABILITY_TS]
+    assert availability_ts[cte.VALUE_INPUT1] == [5.0, 6.0]
+    assert availability_series(availability_ts)[cte.VALUE_INPUT1] == [5.0, 6.0]
+    assert availability_series(availability_ts)[cte.VALUE_INPUT2] == [0.5, 1.0]
+
+
+def test_final_energy_of_a_derived_heat_pump_asset():
+    building_asset_context = community(2)[cte.BUILDING_ASSET_CONTEXT][1]
+    consumption = building_asset_context[cte.BUILDING_CONSUMPTION]
+    heat_pump = asset(consumption[cte.HEAT_CONSUMPTION], 3.0, None, "heat_pump").to_dict()
+    materialised = dict(heat_pump, **{cte.AVAILABILITY_TS: availability_series(heat_pump[cte.AVAILABILITY_TS])})
+
+    results = [calculate_building_final_energy(consumption, building_asset_context[cte.GENERATION_SYSTEM_PROFILE],
+                                               [building_energy_asset], 8760)
+               for building_energy_asset in (heat_pump, materialised)]
+    for derived, complete in zip(*results):
+        if isinstance(derived, dict):
+            assert derived.keys() == complete.keys()
+            continue
+        np.testing.assert_array_equal(np.asarray(derived, dtype=float), np.asarray(complete, dtype=float))
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+import helpers.constants as cte
+from community_kpi_engine import CommunityKPIEngine
+from contexts import community
+from conversion_factors import DEFAULT_COUNTRY_ID
+from key_performance_indicators import (calculate_building_indicators, get_totals_per_building, community_KPIs,
+                                        aggregate_demand_profiles, recalculate_indicators)
+
+
+def assert_same_KPIs(expected, actual):
+    assert set(expected) == set(actual)
+    for name in expected:
+        np.testing.assert_allclose(np.asarray(actual[name]["value"], dtype=float),
+                                   np.asarray(expected[name]["value"], dtype=float), rtol=1e-9, atol=1e-9,
+                                   err_msg=name)
+
+
+def citizen_values(building_citizen_KPIs):
+    return {kpi["name"]: kpi["value"] for kpi in building_citizen_KPIs}
+
+
+def test_engine_matches_the_building_indicators():
+    community_context = community(6)
+    citizen_KPIs = CommunityKPIEngine(community_context).citizen_KPIs()
+    for building_asset_context in community_context[cte.BUILDING_ASSET_CONTEXT]:
+        (total_PV, rate_of_self_consumption, self_sufficiency, total_electricity_use, self_consumption,
+         total_final_energy, KPIs, costs) = calculate_building_indicators(
+            building_asset_context[cte.BUILDING_CONSUMPTION], building_asset_context[cte.GENERATION_SYSTEM_PROFILE],
+            building_asset_context[cte.BUILDING_ENERGY_ASSET], 8760,
+            building_asset_context[cte.BUILDING][cte.BUILDING_USE_ID])
+        (total_primary_energy_kWh, total_co2, total_primary_energy_non_renewable, total_primary_energy_renewable,
+         total_h_costs, total_non_h_costs, *_, FinalEnergy_dic) = get_totals_per_building(KPIs, 8760,
+                                                                                          total_final_energy)
+        expected = {
+            "KPI_peak_elec_demand_[kWh]": max(total_electricity_use),
+            "total_primary_energy_[kWh]": total_primary_energy_kWh,
+            "Total_co2": total_co2,
+            "non_renewable_primary_energy_[kWh]": total_primary_energy_non_renewable,
+            "renewable_primary_energy_[kWh]": total_primary_energy_renewable,
+            "households_costs_[€]": total_h_costs,
+            "non_households_costs_[€]": total_non_h_costs,
+            "Total_PV_[kWh]": total_PV,
+            "Total_self_consumption": self_consumption,
+            "Total_self_sufficiency": self_sufficiency,
+            "rate_of_self_consumption": rate_of_self_consumption,
+            **FinalEnergy_dic,
+        }
+        actual = citizen_values(citizen_KPIs[building_asset_context[cte.ID]])
+        assert set(FinalEnergy_dic) == {name for name in actual if name.startswith("final_energy_")}
+        for name, value in expected.items():
+            np.testing.assert_allclose(actual[name], value, rtol=1e-9, atol=1e-9, err_msg=name)
+
+
+def test_recalculate_indicators_matches_the_engine():
+    community_context = community(6)
+    citizen_KPIs, demand_profiles_context, areas_buildings = recalculate_indicators(community_context)
+    engine = CommunityKPIEngine(community_context)
+
+    assert list(citizen_KPIs) == engine.building_ids
+    assert areas_buildings == engine.areas_buildings()
+    assert len(demand_profiles_context) == len(engine.building_ids)
+    assert_same_KPIs(engine.community_KPIs(), community_KPIs(citizen_KPIs,
+                                                             aggregate_demand_profiles(demand_profiles_context),
+                                                             areas_buildings))
+
+
+def test_recalculate_indicators_of_a_wrong_structure():
+    assert recalculate_indicators({cte.BUILDING_ASSET_CONTEXT: {}}) == ({}, [], {})
+
+
+def assert_same_engine(expected, actual):
+    assert actual.building_ids == expected.building_ids
+    assert actual.carrier_ids == expected.carrier_ids
+    assert_same_KPIs(expected.community_KPIs(), actual.community_KPIs())
+    expected_citizen_KPIs, actual_citizen_KPIs = expected.citizen_KPIs(), actual.citizen_KPIs()
+    for building_id in expected.building_ids:
+        expected_values = citizen_values(expected_citizen_KPIs[building_id])
+        actual_values = citizen_values(actual_citizen_KPIs[building_id])
+        assert set(expected_values) == set(actual_values)
+        for name, value in expected_values.items():
+            np.testing.assert_allclose(np.asarray(actual_values[name], dtype=float),
+                                       np.asarray(value, dtype=float), rtol=1e-9, atol=1e-6, err_msg=name)
+
+
+def scale_consumption(building_asset_context, factor):
+    building_asset_context[cte.BUILDING_CONSUMPTION] = {
+        name: (np.asarray(values) * factor).tolist()
+        for name, values in building_asset_context[cte.BUILDING_CONSUMPTION].items()}
+
+
+def remove_dhw_boilers(building_asset_context):
+    generation_system_profile = dict(building_asset_context[cte.GENERATION_SYSTEM_PROFILE])
+    generation_system_profile[cte.DHW_SYSTEM_ID] = None
+    generation_system_profile[cte.DHW_SYSTEM] = None
+    building_asset_context[cte.GENERATION_SYSTEM_PROFILE] = generation_system_profile
+
+
+@pytest.mark.parametrize("modify", [
+    pytest.param(lambda buildings: scale_consumption(buildings[2], 1.5), id="consumption"),
+    pytest.param(lambda buildings: buildings[1][cte.BUILDING_ENERGY_ASSET].clear(), id="assets"),
+    # the natural gas of the DHW boilers is no longer used by any building
+    pytest.param(lambda buildings: [remove_dhw_boilers(building) for building in buildings], id="carrier removed"),
+])
+def test_update_matches_a_new_engine(modify):
+    community_context = community(6)
+    engine = CommunityKPIEngine(community_context)
+    modified_context = community(6)
+    modify(modified_context[cte.BUILDING_ASSET_CONTEXT])
+
+    dirty = engine.update(modified_context)
+
+    assert dirty
+    assert_same_engine(CommunityKPIEngine(modified_context), engine)
+    # and back to the first context
+    engine.update(community_context)
+    assert_same_engine(CommunityKPIEngine(community_context), engine)
+
+
+def test_carrier_added_by_update():
+    community_context = community(6)
+    for building_asset_context in community_context[cte.BUILDING_ASSET_CONTEXT]:
+        remove_dhw_boilers(building_asset_context)
+    engine = CommunityKPIEngine(community_context)
+    engine.update(community(6))
+    assert_same_engine(CommunityKPIEngine(community(6)), engine)
+
+
+def test_set_country_matches_a_new_engine():
+    community_context = community(6)
+    engine = CommunityKPIEngine(community_context)
+    engine.set_country(9)
+    assert_same_engine(CommunityKPIEngine(community_context, country_id=9), engine)
+    engine.set_country(DEFAULT_COUNTRY_ID)
+    assert_same_engine(CommunityKPIEngine(community_context), engine)
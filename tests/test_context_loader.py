@@ -0,0 +1,67 @@
+import io
+import json
+import math
+
+import numpy as np
+import pytest
+
+from contexts import community
+from helpers.context_loader import load_community_context
+
+CHUNK_SIZES = [1, 2, 3, 7, 8, 9, 64]
+DOCUMENTS = [
+    '{"x": 12.5}',
+    '{"x": 3e-5}',
+    '{"x": -0.25E+12, "y": [1, -2.5e3, 0]}',
+    '[NaN,1,2]',
+    '[Infinity]',
+    '[-Infinity, NaN, Infinity, 1.5]',
+    '{"a": NaN, "b": -Infinity, "c": [true, false, null]}',
+    '[1, 2, null, 3.25, "text", {"k": [4, 5]}, [6, 7.5e-1], -8]',
+    '{"nested": [[1, 2], [3.5, NaN], []], "name": "a \\"quoted\\" \\u00e9 name", "empty": {}}',
+    json.dumps({"series": [round(0.001 * hour + 12.5, 3) for hour in range(200)], "id": 7}),
+    json.dumps([[hour * 1e-7 for hour in range(40)], [-hour for hour in range(40)]]),
+    "[" + ", ".join(["NaN", "1e5", "Infinity"] * 20) + "]",
+]
+
+
+def assert_same_json(expected, actual):
+    # loader values against json.loads ones, arrays as lists and NaN equal to NaN
+    if isinstance(actual, np.ndarray):
+        actual = actual.tolist()
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and list(actual) == list(expected)
+        for key in expected:
+            assert_same_json(expected[key], actual[key])
+    elif isinstance(expected, list):
+        assert isinstance(actual, list) and len(actual) == len(expected)
+        for expected_item, actual_item in zip(expected, actual):
+            assert_same_json(expected_item, actual_item)
+    elif isinstance(expected, float) and math.isnan(expected):
+        assert isinstance(actual, float) and math.isnan(actual)
+    else:
+        assert actual == expected and type(actual) in (type(expected), float)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("min_series_length", [2, 24])
+def test_loader_matches_json_loads(document, chunk_size, min_series_length):
+    loaded = load_community_context(io.StringIO(document), min_series_length=min_series_length,
+                                    chunk_size=chunk_size)
+    assert_same_json(json.loads(document), loaded)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 4096])
+def test_loader_matches_json_loads_on_a_context(chunk_size):
+    document = json.dumps(community(2), default=lambda value: value.tolist())
+    assert_same_json(json.loads(document), load_community_context(io.StringIO(document), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("document", ['{"x": 12.}', '[1, 2', '{"x": tru}', '[1] 2', '{"x": -}'])
+def test_loader_rejects_what_json_loads_rejects(document):
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(document)
+    for chunk_size in CHUNK_SIZES:
+        with pytest.raises(json.JSONDecodeError):
+            load_community_context(io.StringIO(document), chunk_size=chunk_size)
@@ -0,0 +1,94 @@
+import copy
+
+import numpy as np
+import pytest
+
+import helpers.constants as cte
+from community_kpi_engine import CommunityKPIEngine
+from contexts import community
+from key_performance_indicators import (calculate_building_final_energy, community_KPIs, aggregate_demand_profiles,
+                                        get_indicators_from_baseline, recalculate_indicators)
+
+
+@pytest.fixture
+def heat_pump_building():
+    # heat pump heating and no heat pump asset: its consumption is added to the electricity use of the building
+    return community(2)[cte.BUILDING_ASSET_CONTEXT][1]
+
+
+def final_energy(building_asset_context):
+    return calculate_building_final_energy(building_asset_context[cte.BUILDING_CONSUMPTION],
+                                           building_asset_context[cte.GENERATION_SYSTEM_PROFILE],
+                                           building_asset_context[cte.BUILDING_ENERGY_ASSET], 8760)
+
+
+def test_electricity_use_does_not_modify_the_consumption(heat_pump_building):
+    consumption = heat_pump_building[cte.BUILDING_CONSUMPTION]
+    electricity_consumption = list(consumption[cte.ELECTRICITY_CONSUMPTION])
+    first = final_energy(heat_pump_building)
+    second = final_energy(heat_pump_building)
+
+    assert consumption[cte.ELECTRICITY_CONSUMPTION] == electricity_consumption
+    np.testing.assert_allclose(first[3], np.add(electricity_consumption, consumption[cte.HEAT_CONSUMPTION]))
+    np.testing.assert_array_equal(first[3], second[3])
+
+
+def test_empty_electricity_consumption_with_pv(heat_pump_building):
+    heat_pump_building[cte.BUILDING_CONSUMPTION][cte.ELECTRICITY_CONSUMPTION] = []
+    (total_PV, _, _, total_electricity_use, self_consumption, grid_consumption,
+     total_final_energy) = final_energy(heat_pump_building)
+
+    heat_consumption = heat_pump_building[cte.BUILDING_CONSUMPTION][cte.HEAT_CONSUMPTION]
+    np.testing.assert_allclose(total_electricity_use, heat_consumption)
+    np.testing.assert_allclose(self_consumption, np.minimum(heat_consumption, total_PV))
+    np.testing.assert_allclose(total_final_energy[12].hourly_data, grid_consumption)
+
+
+def test_pv_of_the_last_electric_asset(heat_pump_building):
+    first_asset = heat_pump_building[cte.BUILDING_ENERGY_ASSET][0]
+    last_asset = copy.deepcopy(first_asset)
+    last_asset[cte.PMAX_SCALAR] = 0.5
+    heat_pump_building[cte.BUILDING_ENERGY_ASSET].append(last_asset)
+    total_PV, rate_of_self_consumption, _, total_electricity_use, self_consumption, _, _ = (
+        final_energy(heat_pump_building))
+
+    expected_PV = np.asarray(last_asset[cte.AVAILABILITY_TS][cte.VALUE_INPUT1]) * 0.5
+    np.testing.assert_allclose(total_PV, expected_PV)
+    np.testing.assert_allclose(self_consumption, np.minimum(total_electricity_use, expected_PV))
+
+
+def test_peak_electricity_demand_of_the_electricity_consumption():
+    # The demand profile of electricity is the electricity consumption of the context, the consumption of the heat
+    # pumps is part of the electricity use (final energy) only
+    community_context = community(6)
+    electricity_consumption = np.sum([building[cte.BUILDING_CONSUMPTION][cte.ELECTRICITY_CONSUMPTION]
+                                      for building in community_context[cte.BUILDING_ASSET_CONTEXT]], axis=0)
+    for _ in range(2):
+        citizen_KPIs, demand_profiles, areas_buildings = recalculate_indicators(community_context)
+        aggregate_KPIs = community_KPIs(citizen_KPIs, aggregate_demand_profiles(demand_profiles), areas_buildings)
+        assert aggregate_KPIs["KPI_peak_elec_demand_[kWh]"]["value"] == pytest.approx(electricity_consumption.max())
+
+
+def test_engine_with_empty_electricity_consumption():
+    community_context = community(4)
+    community_context[cte.BUILDING_ASSET_CONTEXT][1][cte.BUILDING_CONSUMPTION][cte.ELECTRICITY_CONSUMPTION] = []
+    aggregate_KPIs = CommunityKPIEngine(community_context).community_KPIs()
+    assert np.isfinite(aggregate_KPIs["KPI_peak_elec_demand_[kWh]"]["value"])
+
+
+@pytest.mark.filterwarnings("ignore:Invalid WKT")
+@pytest.mark.parametrize("geom", ["POLYGON((garbage", None, {"type": "Polygon"}])
+def test_baseline_with_an_invalid_geometry_raises(geom):
+    front_data = [{"building_statistics_profile_id": 1, cte.BUILDING_USE_ID: 1, cte.CONSTRUCTION_YEAR: 1990,
+                   "geom": geom}]
+    data = [{cte.ID: 1, cte.GENERATION_SYSTEM_PROFILE: {}}]
+    with pytest.raises(ValueError, match="building 1"):
+        get_indicators_from_baseline(front_data, data, {}, [])
+
+
+@pytest.mark.filterwarnings("ignore:Invalid WKT")
+def test_baseline_with_an_invalid_location_raises():
+    front_data = {cte.BUILDING_USE_ID: 1, cte.CONSTRUCTION_YEAR: 1990, "location": "garbage", "num_building": 3}
+    data = {"building_statistics_profile": {cte.GENERATION_SYSTEM_PROFILE: {}}}
+    with pytest.raises(ValueError, match="Location"):
+        get_indicators_from_baseline(front_data, data, {}, {})
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import parallel_evaluation
+from parallel_evaluation import map_buildings
+
+
+def square(task):
+    return task * task
+
+
+def fail_reading(task):
+    if task == 3:
+        raise OSError("file of the building not readable")
+    return task
+
+
+def exit_in_worker(task):
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return task
+
+
+@pytest.fixture
+def shutdowns(monkeypatch):
+    calls = []
+    monkeypatch.setattr(parallel_evaluation, "shutdown_executor", lambda: calls.append(True))
+    return calls
+
+
+def test_results_in_the_order_of_the_tasks():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert map_buildings(square, range(10), executor=executor, chunk_size=3) == [task * task for task in range(10)]
+
+
+def test_errors_of_the_function_are_raised(shutdowns):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(OSError, match="not readable"):
+            map_buildings(fail_reading, range(6), executor=executor, chunk_size=1)
+    assert not shutdowns
+
+
+def test_broken_caller_executor_falls_back_to_serial(shutdowns):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert map_buildings(exit_in_worker, range(4), executor=executor) == list(range(4))
+    # only the shared pool is shut down by map_buildings
+    assert not shutdowns
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import helpers.result_cache as result_cache_module
+from helpers.result_cache import canonical_hash, data_fingerprint, request_key, result_cache
+from catalogue_registry import generation_systems_catalogue
+from community_kpi_engine import CommunityKPIEngine, building_results_cache
+from contexts import community
+from conversion_factors import invalidate_conversion_factor_matrix
+from national_benchmarks import get_national_benchmarks
+
+
+@pytest.mark.parametrize("reload", [generation_systems_catalogue.reload, generation_systems_catalogue.invalidate,
+                                    invalidate_conversion_factor_matrix, get_national_benchmarks().reload])
+def test_reload_clears_the_cached_results(reload):
+    community_context = community(2)
+    CommunityKPIEngine(community_context)
+    key = request_key("calculate_indicators", community_context)
+    result_cache.put(key, {"kpi": 1})
+    assert len(building_results_cache) > 0 and result_cache.get(key) == {"kpi": 1}
+    reload()
+    assert len(building_results_cache) == 0
+    assert result_cache.get(key) is None
+    assert len(result_cache) == 0
+
+
+def test_request_key_changes_with_the_data_files(monkeypatch, tmp_path):
+    data_file = tmp_path / "energy_carrier.json"
+    data_file.write_text("[]")
+    monkeypatch.setattr(result_cache_module, "DATA_FILES", (str(data_file),))
+    community_context = community(1)
+    key = request_key("calculate_indicators", community_context)
+    assert request_key("calculate_indicators", community_context) == key
+    fingerprint = data_fingerprint()
+    modified = os.stat(data_file).st_mtime_ns + 10 ** 9
+    os.utime(data_file, ns=(modified, modified))
+    assert data_fingerprint() != fingerprint
+    assert request_key("calculate_indicators", community_context) != key
+
+
+def test_series_modified_in_place_is_hashed_again():
+    series = [float(hour % 24) for hour in range(8760)]
+    context = {"consumption": series}
+    first = canonical_hash(context)
+    assert canonical_hash(context) == first
+    series[100] += 1
+    assert canonical_hash(context) != first
+    assert canonical_hash(context) == canonical_hash({"consumption": list(series)})
+
+
+
+def test_scenario_data_files_are_in_the_fingerprint():
+    names = [os.path.basename(path) for path in result_cache_module.DATA_FILES]
+    assert "actions_to_generation_systems.csv" in names and "all_profiles.csv" in names
+    assert [name for name, *_ in data_fingerprint()] == names
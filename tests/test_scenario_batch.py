@@ -0,0 +1,71 @@
+import copy
+import json
+
+import pytest
+
+from contexts import scenario_community
+from community_kpi_engine import CommunityKPIEngine
+from scenario_batch import evaluate_scenario_batch
+
+RECOMMENDATION_SETS = [{"0": {"id": action_id, "action_name": "action"}} for action_id in (12, 22, 25, 27)] + [
+    {"0": {"id": 25, "action_name": "envelope"}, "1": {"id": 27, "action_name": "PV"}}]
+
+
+def as_json(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+@pytest.fixture(scope="module")
+def community_context():
+    return scenario_community(6)
+
+
+def test_serial_and_parallel_batches_match(offline_scenarios, community_context):
+    baseline = copy.deepcopy(community_context)
+    serial_table, serial_scenarios = evaluate_scenario_batch(1, community_context, RECOMMENDATION_SETS,
+                                                             parallel=False)
+    parallel_table, parallel_scenarios = evaluate_scenario_batch(1, community_context, RECOMMENDATION_SETS,
+                                                                 parallel=True, max_workers=2)
+
+    assert as_json(community_context) == as_json(baseline)
+    assert [row["scenario"] for row in serial_table] == [row["scenario"] for row in parallel_table]
+    for (_, serial_KPIs), (_, parallel_KPIs) in zip(serial_scenarios, parallel_scenarios):
+        assert as_json(serial_KPIs) == as_json(parallel_KPIs)
+    for scenario_context, serial_KPIs in serial_scenarios:
+        engine = CommunityKPIEngine(scenario_context, results_cache=None)
+        assert as_json(engine.community_KPIs()) == as_json(serial_KPIs)
+
+
+def test_get_new_contexts_matches_the_batch(offline_scenarios, community_context):
+    from data_packages.transform_structure import transform_whole_structure, reverse_whole_structure
+    from module_integration import get_new_contexts
+
+    # context of the front end, with nodes instead of community energy assets
+    front_context = dict(transform_whole_structure(community_context), id=community_context["id"])
+    ranked_table, new_contexts = get_new_contexts(1, front_context, RECOMMENDATION_SETS)
+    batch_table, scenarios = evaluate_scenario_batch(1, reverse_whole_structure(front_context), RECOMMENDATION_SETS)
+    assert as_json(ranked_table) == as_json(batch_table)
+    for (new_context, community_indicators), (scenario_context, scenario_KPIs) in zip(new_contexts, scenarios):
+        assert as_json(community_indicators) == as_json(scenario_KPIs)
+        expected_context = transform_whole_structure(scenario_context)
+        # the creation date is the time of the request
+        assert new_context.pop("creation_date") and expected_context.pop("creation_date")
+        assert as_json(new_context) == as_json(expected_context)
+
+
+def test_cached_new_context_gets_the_date_of_the_request(offline_scenarios, community_context, monkeypatch):
+    from data_packages.transform_structure import transform_whole_structure
+    from helpers.result_cache import ResultCache
+    import module_integration
+
+    front_context = dict(transform_whole_structure(community_context), id=community_context["id"])
+    cache = ResultCache()
+    new_context, community_indicators = module_integration.get_new_context(1, front_context, RECOMMENDATION_SETS[-1],
+                                                                           cache=cache)
+    monkeypatch.setattr(module_integration, "current_creation_date", lambda: "2030-01-01 00:00:00")
+    cached_context, cached_indicators = module_integration.get_new_context(1, front_context, RECOMMENDATION_SETS[-1],
+                                                                           cache=cache)
+    assert cache.stats()["hits"] == 1
+    assert cached_context.pop("creation_date") == "2030-01-01 00:00:00" != new_context.pop("creation_date")
+    assert as_json(cached_context) == as_json(new_context)
+    assert as_json(cached_indicators) == as_json(community_indicators)
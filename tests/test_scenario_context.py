@@ -0,0 +1,67 @@
+import numpy as np
+
+import helpers.constants as cte
+from community_kpi_engine import CommunityKPIEngine
+from contexts import community, scenario_community
+from get_new_context import derive_scenario_context
+from scenario_context import ScenarioContext, REFERENCE_FIELDS, equal_values, same_content
+
+
+def renamed_copy(community_context):
+    # what the scenario generator does to every building: copied, new ids and names, assets copied with an id_temp
+    changed = dict(community_context)
+    changed[cte.BUILDING_ASSET_CONTEXT] = []
+    for b, building_asset_context in enumerate(community_context[cte.BUILDING_ASSET_CONTEXT]):
+        building_asset_context = dict(building_asset_context)
+        del building_asset_context[cte.ID]
+        building_asset_context["id_temp"] = b + 1
+        building_asset_context["name"] = f"building {b} with action 10_ "
+        building_asset_context[cte.GENERATION_SYSTEM_PROFILE_ID] = None
+        building_asset_context[cte.BUILDING_ENERGY_ASSET] = [
+            dict(asset, id_temp=b + 1) for asset in building_asset_context[cte.BUILDING_ENERGY_ASSET]]
+        generation_system_profile = building_asset_context[cte.GENERATION_SYSTEM_PROFILE]
+        building_asset_context[cte.GENERATION_SYSTEM_PROFILE] = dict(generation_system_profile)
+        changed[cte.BUILDING_ASSET_CONTEXT].append(building_asset_context)
+    return changed
+
+
+def test_only_the_buildings_whose_content_changed():
+    community_context = community(6)
+    changed = renamed_copy(community_context)
+    changed[cte.BUILDING_ASSET_CONTEXT][4][cte.BUILDING_CONSUMPTION] = {
+        name: (np.asarray(values) * 2).tolist()
+        for name, values in community_context[cte.BUILDING_ASSET_CONTEXT][4][cte.BUILDING_CONSUMPTION].items()}
+
+    scenario_context = ScenarioContext.from_contexts(community_context, changed)
+
+    assert scenario_context.changed_buildings == [4]
+    # equal copies are not stored, the parent objects are shared
+    for b, fields in scenario_context.building_changes.items():
+        assert set(fields) - set(REFERENCE_FIELDS) <= {cte.BUILDING_ENERGY_ASSET, cte.BUILDING_CONSUMPTION}
+        assert (scenario_context[cte.BUILDING_ASSET_CONTEXT][b][cte.GENERATION_SYSTEM_PROFILE]
+                is community_context[cte.BUILDING_ASSET_CONTEXT][b][cte.GENERATION_SYSTEM_PROFILE])
+    assert scenario_context[cte.BUILDING_ASSET_CONTEXT][1][cte.BUILDING_ENERGY_ASSET][0]["id_temp"] == 2
+
+    engine = CommunityKPIEngine(community_context)
+    assert engine.update(scenario_context) == [4]
+    assert engine.building_ids == CommunityKPIEngine(scenario_context).building_ids
+
+
+def test_equal_values():
+    series = np.arange(5.0)
+    assert equal_values([1.0, 2.0], [1.0, 2.0])
+    assert not equal_values([1.0, 2.0], (1.0, 2.0))
+    assert equal_values({"a": series}, {"a": series.copy()})
+    assert not equal_values({"a": series}, {"a": series + 1})
+    assert same_content([{"id_temp": 1, "a": series}], [{"id_temp": 2, "a": series}])
+    assert not same_content([{"id_temp": 1, "a": series}], [{"id_temp": 1, "a": series + 1}])
+
+
+def test_scenario_of_the_generator(offline_scenarios):
+    community_context = scenario_community(6)
+    # action without changes at building level: only the buildings without DHW system change (their DHW
+    # consumption is set to 0), the rest only get new ids and names
+    scenario_context = derive_scenario_context(1, community_context, {"0": {"id": 19, "action_name": "action"}})
+    assert scenario_context.changed_buildings == [0, 3]
+    engine = CommunityKPIEngine(community_context)
+    assert engine.update(scenario_context) == [0, 3]
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+import requests
+
+from thermagrid_client import ThermaGridClient, chunk_features, reassemble_features
+from thermagrid_stub import start_stub_server, synthetic_community
+
+TEMPERATURE = [float(hour % 24) for hour in range(48)]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(failure_rate=0.0):
+        server, url = start_stub_server(failure_rate=failure_rate)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def ids(geojson_object):
+    return [feature["id"] for feature in geojson_object["features"]]
+
+
+@pytest.mark.parametrize("n_buildings, chunk_size, max_workers", [(23, 5, 4), (23, 5, 1), (3, 50, 4), (0, 5, 4)])
+def test_features_are_fetched_in_chunks_and_in_order(stub, n_buildings, chunk_size, max_workers):
+    server, url = stub()
+    inputs_thermagrid = {"geojson": synthetic_community(n_buildings), "temperature": TEMPERATURE}
+    with ThermaGridClient(url, "stub", chunk_size=chunk_size, max_workers=max_workers) as client:
+        geojson_file = client.fetch(inputs_thermagrid)
+    assert server.RequestHandlerClass.requests_served == len(chunk_features(inputs_thermagrid["geojson"], chunk_size))
+    assert ids(geojson_file) == ids(inputs_thermagrid["geojson"])
+    for feature in geojson_file["features"]:
+        assert len(feature["properties"]["heating"]) == len(TEMPERATURE)
+
+
+def test_failed_requests_are_retried(stub):
+    # one request at a time, so that the seeded failures do not depend on the threads
+    random.seed(0)
+    server, url = stub(failure_rate=0.5)
+    inputs_thermagrid = {"geojson": synthetic_community(20), "temperature": TEMPERATURE}
+    with ThermaGridClient(url, "stub", chunk_size=4, max_workers=1, retries=20, backoff_factor=0) as client:
+        geojson_file = client.fetch(inputs_thermagrid)
+    assert server.RequestHandlerClass.requests_served > 5
+    assert ids(geojson_file) == ids(inputs_thermagrid["geojson"])
+
+
+def test_exhausted_retries_raise(stub):
+    server, url = stub(failure_rate=1.0)
+    inputs_thermagrid = {"geojson": synthetic_community(3), "temperature": TEMPERATURE}
+    with ThermaGridClient(url, "stub", retries=2, backoff_factor=0) as client:
+        with pytest.raises(requests.HTTPError):
+            client.fetch(inputs_thermagrid)
+    assert server.RequestHandlerClass.requests_served == 3
+
+
+def test_features_are_matched_by_id_inside_a_chunk():
+    sent_chunks = chunk_features(synthetic_community(7), 3)
+    received_chunks = [dict(chunk, features=chunk["features"][::-1]) for chunk in sent_chunks]
+    assert ids(reassemble_features(sent_chunks, received_chunks)) == [str(i) for i in range(7)]
+    with pytest.raises(ValueError):
+        reassemble_features(sent_chunks, [dict(chunk, features=chunk["features"][1:]) for chunk in sent_chunks])